@@ -49,30 +49,36 @@
 
 # --- Import necessary libraries ---
 # We use Streamlit for the web app, datetime for date handling, pandas for data manipulation,
-# We use datetime and timedelta for date calculations, BytesIO for in-memory file handling,
-# We use pandas for data manipulation, and PIL for image processing.
+# We use datetime and timedelta for date calculations,
+# We use pandas for data manipulation (image processing is done in plant_api.py).
 # We use altair for data visualization, and base64 for encoding images.
 # We use base64 for encoding images.
+# We use uuid to give every browser session its own token (for the weather prefetching).
 import streamlit as st
 import datetime
 import pandas as pd
 from datetime import timedelta
-from io import BytesIO
-from PIL import Image
 import altair as alt
 import base64
+import uuid
 
 # --- Import custom modules ---
 # The modules represent the different functionalities of the app
 # Such as plant classification, weather data retrieval, and scheduling
-from plant_api import classify_plant_image
-from weather_api import get_weekly_rainfall, geocode
+from plant_api import classify_plant_image, find_similar_plants, warm_up_model, get_model_status, _CLASS_NAMES
+from weather_api import cancel_prefetches, get_weekly_rainfall, geocode, prefetch_adjacent_weeks
 from calendar_api import get_watering_schedule
+from finetune import stage_upload, maybe_start_finetune, get_staging_stats
 
 # --- Page config ---
 # This sets the title and layout of the Streamlit app.
 st.set_page_config(page_title="Plantelligence 🌱", layout="centered")
 
+# --- Model Warm-Up ---
+# The plant classifier (and TensorFlow) is loaded in a background thread, so the page renders without waiting for it.
+# The model is shared by all sessions of this server process, so this only starts loading on the very first run.
+warm_up_model()
+
 # --- Session State Init ---
 # This initializes the session state variables to store user inputs and app data.
 if 'garden' not in st.session_state:
@@ -85,6 +91,9 @@ if 'week_start' not in st.session_state:
     st.session_state.week_start = monday
 if "checklist_states" not in st.session_state:
     st.session_state.checklist_states = {}
+# identifies this browser session when it asks weather_api to prefetch weeks in the background
+if "session_token" not in st.session_state:
+    st.session_state.session_token = uuid.uuid4().hex
 
 # --- App Title ---
 # This sets the title of the app and allows the user to input the name of their garden.
@@ -96,6 +105,18 @@ garden_name = st.text_input("Name your garden:", key="garden_name")
 with st.sidebar:
     st.header("Weather Settings 🌍")
     city = st.text_input("In which city is your garden?:", value="St. Gallen")
+    # shows whether the plant classifier has finished loading in the background and how long it took
+    model_status = get_model_status()
+    if model_status["loaded"]:
+        st.caption(f"Plant classifier ready (loaded in {model_status['load_seconds']:.1f} s)")
+    else:
+        st.caption("Plant classifier is loading in the background…")
+    # how many confirmed photos are waiting for the next fine-tuning run of the classifier
+    staging = get_staging_stats()
+    if staging["state"] == "running":
+        st.caption("Improving the classifier with your confirmed photos…")
+    elif staging["min_new_samples"] > 0:
+        st.caption(f"Confirmed photos for the next improvement: {staging['new']}/{staging['min_new_samples']}")
 lat, lon = geocode(city)
 
 # --- Add Plant Form ---
@@ -118,18 +139,61 @@ if submitted:
         st.warning("Please provide both a plant name and an image.")
     else:
         image_bytes = plant_file.read()
-        plant_type = classify_plant_image(image_bytes)
-        display_img = Image.open(BytesIO(image_bytes)).convert("RGB")
-        st.session_state.garden.append({
-            "name": plant_name,
-            "type": plant_type,
-            "image_bytes": image_bytes
-        })
-        # starting of dry day counter for new plant; counter tracks how many days have passed without precipitation, whereby starting point is 0 days. 
-        st.session_state.plant_counters.append(0)
-        # clear watering schedule as the garden respectively the plants have changed (cache must is cleared).
-        if 'cached_schedules' in st.session_state:
-            st.session_state.cached_schedules = {}
+        # images that are far too large are refused by plant_api before they are decoded
+        try:
+            plant_type = classify_plant_image(image_bytes)
+        except ValueError as e:
+            st.error(f"Could not classify this image: {e}")
+            plant_type = None
+        if plant_type is not None:
+            st.session_state.garden.append({
+                "name": plant_name,
+                "type": plant_type,
+                "image_bytes": image_bytes
+            })
+            # starting of dry day counter for new plant; counter tracks how many days have passed without precipitation, whereby starting point is 0 days. 
+            st.session_state.plant_counters.append(0)
+            # remembered for the "Is this right?" question below, which outlives the form
+            st.session_state.last_upload = {"index": len(st.session_state.garden) - 1, "predicted": plant_type}
+            # clear watering schedule as the garden respectively the plants have changed (cache must is cleared).
+            if 'cached_schedules' in st.session_state:
+                st.session_state.cached_schedules = {}
+            # show the closest reference photos from plant_images next to the predicted type (empty until "similar_plants.py" was run)
+            similar = find_similar_plants(image_bytes, k=3)
+            if similar:
+                st.caption(f"{plant_name} looks like a {plant_type}. The most similar photos in our reference dataset:")
+                st.image(
+                    [match["path"] for match in similar],
+                    width=120,
+                    caption=[f"{match['label']} ({match['score']:.2f})" for match in similar],
+                )
+
+# --- Confirm Plant Type ---
+# This section asks the user whether the predicted type of the last added plant is right.
+# The confirmed (or corrected) photo is kept in a local staging store by finetune.py; once enough photos are
+# confirmed, the classifier is fine-tuned on them in the background and replaced without restarting the app.
+if "last_upload" in st.session_state:
+    last = st.session_state.last_upload
+    plant = st.session_state.garden[last["index"]]
+    confirm_cols = st.columns([3, 2, 2])
+    label = confirm_cols[0].selectbox(f"Is {plant['name']} a {last['predicted']}?", _CLASS_NAMES,
+                                      index=_CLASS_NAMES.index(last["predicted"]), key="confirm_label")
+    if confirm_cols[1].button("Confirm type", key="confirm_type"):
+        try:
+            stage_upload(plant["image_bytes"], label, last["predicted"])
+        except ValueError as e:
+            st.error(f"Could not keep this photo: {e}")
+        else:
+            # a corrected type is also shown in the garden and used for the watering schedule
+            if label != plant["type"]:
+                plant["type"] = label
+                st.session_state.cached_schedules = {}
+            maybe_start_finetune()
+        del st.session_state.last_upload
+        st.rerun()
+    if confirm_cols[2].button("Skip", key="skip_confirm"):
+        del st.session_state.last_upload
+        st.rerun()
 
 # --- Garden Overview ---
 # This section displays the user's garden overview, including the plants added and their types.
@@ -218,6 +282,9 @@ if st.session_state.garden:
         # if fetching the precipitation forecast fails, an error message and indication of no rain is shown to the user.
         st.error(f"Error fetching weather data: {e}")
         weekly_rain = [0.0] * 7
+    # the previous and the next week are loaded into the weather cache in the background (without waiting for them),
+    # so clicking "← Previous Week" or "Next Week →" does not have to wait for the weather API
+    prefetch_adjacent_weeks(st.session_state.week_start, lat, lon, st.session_state.session_token)
 
     # Calculate watering schedule
     # This section checks if the watering schedule needs to be recalculated based on the week start date.
@@ -312,6 +379,8 @@ if st.session_state.garden:
 
 else:
     st.info("📷 Please add at least one plant to your garden above.") # tell the user to add a plant if none are added
+    # no forecast is shown, so the weeks queued for this session in the background are not needed anymore
+    cancel_prefetches(st.session_state.session_token)
 
 
 # --- Overlay Widget ---
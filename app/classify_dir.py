@@ -0,0 +1,171 @@
+# --- Bulk Plant Classification ---
+# This script classifies every image in a directory tree with the plant classifier from "plant_api.py".
+# It is meant for re-labelling and auditing large photo dumps, e.g. a folder laid out like plant_images/<Class>/*.jpg.
+# Images are decoded in a pool of worker processes and classified in batches in the main process.
+# One JSON line per image (label, probabilities, timing) is streamed to the output as soon as its batch is done,
+# and the number of images per second is reported at the end.
+# When the images sit in folders named after the classes, the folder is used as the true label
+# and a per-class accuracy summary is printed (and written to --summary if given).
+# Without --output, standard output carries nothing but the JSON lines (so it can be piped into jq):
+# the summary, the model load times and anything else a library prints go to standard error.
+
+# --- how to run ---
+# type in your terminal: python app/classify_dir.py plant_images --output labels.jsonl --summary summary.json
+# press enter
+
+# --- Reference ---
+# https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+# https://docs.python.org/3/library/multiprocessing.html#contexts-and-start-methods
+# https://jsonlines.org
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from model_scripts import dataset_cache_module
+from plant_api import MAX_BATCH_SIZE, _CLASS_NAMES, predict_batch, preprocess_image
+
+
+def find_images(root: str) -> list:
+    """Returns the sorted paths of all images below root (hidden files like .DS_Store are skipped)."""
+    # the same file extensions as the training dataset cache and the similar plants index accept
+    # (looked up here, not at import time, so the decoding worker processes do not import the dataset cache)
+    image_extensions = dataset_cache_module().IMAGE_EXTENSIONS
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.startswith(".") and filename.lower().endswith(image_extensions):
+                paths.append(os.path.join(dirpath, filename))
+    return paths
+
+
+def true_label(path: str):
+    """The class encoded by the image's folder name, or None if the folder is not a class name."""
+    folder = os.path.basename(os.path.dirname(path))
+    return folder if folder in _CLASS_NAMES else None
+
+
+def load_image(path: str):
+    """
+    Runs in a worker process: reads and preprocesses one image.
+    Returns (path, array, decode_ms, error); array is None if the image could not be decoded.
+    """
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            arr = preprocess_image(f.read())
+        error = None
+    except (OSError, ValueError) as e:
+        arr, error = None, str(e)
+    return path, arr, 1000 * (time.perf_counter() - start), error
+
+
+def classify_batch(batch: list, out) -> list:
+    """Classifies one batch of decoded images, writes one JSON line per image and returns the records."""
+    start = time.perf_counter()
+    preds = predict_batch(np.stack([arr for _, arr, _, _ in batch]))
+    # the batch's inference time is split evenly between its images
+    inference_ms = 1000 * (time.perf_counter() - start) / len(batch)
+
+    records = []
+    for (path, _, decode_ms, _), row in zip(batch, preds):
+        record = {
+            "path": path,
+            "label": _CLASS_NAMES[int(np.argmax(row))],
+            "probabilities": {name: round(float(p), 6) for name, p in zip(_CLASS_NAMES, row)},
+            "true_label": true_label(path),
+            "decode_ms": round(decode_ms, 2),
+            "inference_ms": round(inference_ms, 2),
+        }
+        out.write(json.dumps(record) + "\n")
+        records.append(record)
+    out.flush()
+    return records
+
+
+def accuracy_summary(records: list) -> dict:
+    """Per-class and overall accuracy of the records that have a true label."""
+    per_class = {}
+    for record in records:
+        if record.get("true_label") is None or "label" not in record:
+            continue
+        stats = per_class.setdefault(record["true_label"], {"images": 0, "correct": 0})
+        stats["images"] += 1
+        stats["correct"] += int(record["label"] == record["true_label"])
+    for stats in per_class.values():
+        stats["accuracy"] = round(stats["correct"] / stats["images"], 4)
+    total = sum(stats["images"] for stats in per_class.values())
+    correct = sum(stats["correct"] for stats in per_class.values())
+    return {
+        "images": total,
+        "accuracy": round(correct / total, 4) if total else None,
+        "per_class": dict(sorted(per_class.items())),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Classify every image below a directory and stream JSON lines.")
+    parser.add_argument("directory", help="folder to scan, e.g. plant_images")
+    parser.add_argument("--output", help="JSONL file to write (default: standard output)")
+    parser.add_argument("--summary", help="JSON file for the per-class accuracy summary")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of decoding processes")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE)
+    args = parser.parse_args()
+
+    paths = find_images(args.directory)
+    out = open(args.output, "w") if args.output else sys.stdout
+    # from here on, everything else that would be printed to standard output goes to standard error,
+    # so the JSON lines stay valid JSONL (e.g. messages of TensorFlow or of plant_api when the model is loaded)
+    sys.stdout = sys.stderr
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+    records = []
+    start = time.perf_counter()
+
+    # "spawn" starts clean worker processes; forking a process that has already loaded TensorFlow is not safe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        batch = []
+        # map() yields the decoded images in order while the workers keep decoding ahead
+        for path, arr, decode_ms, error in pool.map(load_image, paths, chunksize=4):
+            if error is not None:
+                record = {"path": path, "error": error, "true_label": true_label(path)}
+                out.write(json.dumps(record) + "\n")
+                records.append(record)
+                continue
+            batch.append((path, arr, decode_ms, error))
+            if len(batch) == args.batch_size:
+                records += classify_batch(batch, out)
+                batch = []
+        if batch:
+            records += classify_batch(batch, out)
+
+    seconds = time.perf_counter() - start
+    if args.output:
+        out.close()
+    # images that could not be decoded are not classified, so they do not count towards the throughput
+    errors = sum("error" in record for record in records)
+    classified = len(records) - errors
+    print(f"Classified {classified} images in {seconds:.1f} s ({classified / seconds:.1f} images/s), "
+          f"{errors} could not be read", file=sys.stderr)
+
+    # the summary only makes sense when the folders encode the true label
+    summary = accuracy_summary(records)
+    if summary["images"]:
+        print(f"Accuracy: {summary['accuracy']:.3f} over {summary['images']} labelled images", file=sys.stderr)
+        for name, stats in summary["per_class"].items():
+            print(f"  {name:<10} {stats['accuracy']:.3f}  ({stats['correct']}/{stats['images']})", file=sys.stderr)
+        if args.summary:
+            with open(args.summary, "w") as f:
+                json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
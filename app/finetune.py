@@ -0,0 +1,332 @@
+# --- Fine-Tuning From Confirmed Uploads ---
+# Photos uploaded in the app used to be classified once and then forgotten. With this module, a user can confirm
+# (or correct) the predicted type of an upload, and the photo is kept with that label in a local staging store:
+# the image bytes in cache/staging/images/<sha256> and one row per photo in cache/staging/staging.sqlite.
+# Once MIN_NEW_SAMPLES new photos have been confirmed, a background thread fine-tunes the current model:
+# - a copy of plant_classifier.keras is trained for a few steps with a small learning rate
+# - when the app runs the cascade (see plant_api.py), most photos are answered by the fast companion model alone,
+#   so a copy of plant_classifier_fast.keras is trained on the same batches; otherwise the new photos would only
+#   reach the full model, which the fast model rarely asks
+# - every batch mixes new photos with "replay" photos (the training split from the dataset cache and photos
+#   confirmed earlier), so the model learns the new photos without forgetting the old ones
+# - the result is checked on the validation split; it is only kept if its accuracy did not drop by more than
+#   MAX_ACCURACY_DROP compared to the reference model, both for the full model alone and for the cascade of the two.
+#   The reference is the model the fine-tuned ones descend from (the shipped or retrained one), not the previous run's,
+#   so repeated runs cannot each lose a little and add up to a large drop (its accuracy is kept in baseline.json)
+# - the accepted models are written next to the old ones and moved over them with os.replace (atomic: every reader sees
+#   either the old or the new file, never half of it), then plant_api switches to them without restarting the app
+# The app keeps classifying with the old model while the job runs.
+
+# --- how to run ---
+# the app starts the job by itself; to fine-tune on the staged photos by hand:
+# type in your terminal: python app/finetune.py
+# press enter
+
+# --- Reference ---
+# https://docs.python.org/3/library/sqlite3.html
+# https://docs.python.org/3/library/os.html#os.replace
+# Rolnick et al. (2019), "Experience Replay for Continual Learning"
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import plant_api
+from model_scripts import dataset_cache_module
+from plant_api import _CLASS_NAMES, cache_dir, preprocess_image
+
+logger = logging.getLogger(__name__)
+
+staging_dir = os.path.join(cache_dir, "staging")
+staging_db_path = os.path.join(staging_dir, "staging.sqlite")
+# the models that were replaced last, to go back by hand if needed
+previous_model_path = os.path.join(staging_dir, "previous.keras")
+previous_fast_model_path = os.path.join(staging_dir, "previous_fast.keras")
+# the validation accuracy of the reference model and the hash of the models the last accepted run wrote
+baseline_path = os.path.join(staging_dir, "baseline.json")
+
+MIN_NEW_SAMPLES = int(os.environ.get("PLANT_FINETUNE_MIN_SAMPLES", "8"))  # 0 turns the automatic fine-tuning off
+FINETUNE_STEPS = 20
+BATCH_SIZE = 16
+REPLAY_FRACTION = 0.5  # share of every batch taken from the replay photos
+LEARNING_RATE = 1e-4  # ten times smaller than in training, so a few photos cannot pull the weights far
+MAX_ACCURACY_DROP = 0.01
+
+_db_lock = threading.Lock()
+_job_lock = threading.Lock()
+_job_thread = None
+_status = {"state": "idle", "last_run": None}
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.join(staging_dir, "images"), exist_ok=True)
+    db = sqlite3.connect(staging_db_path)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS samples ("
+        "sha256 TEXT PRIMARY KEY, label TEXT, predicted TEXT, added_at REAL, used INTEGER DEFAULT 0)"
+    )
+    return db
+
+
+def stage_upload(image_bytes: bytes, label: str, predicted: str = None) -> str:
+    """
+    Keeps an uploaded photo with its confirmed (or corrected) label for the next fine-tuning run
+    and returns its hash. Uploading the same photo again only updates its label.
+    """
+    if label not in _CLASS_NAMES:
+        raise ValueError(f"unknown label {label!r}, choose one of {_CLASS_NAMES}")
+    preprocess_image(image_bytes)  # refuses images that cannot be decoded or are too large, before anything is stored
+    sha256 = hashlib.sha256(image_bytes).hexdigest()
+    image_path = os.path.join(staging_dir, "images", sha256)
+    with _db_lock:
+        db = _connect()
+        if not os.path.exists(image_path):
+            tmp_path = image_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, image_path)
+        # a corrected label makes the photo new again, so it is part of the next run
+        db.execute(
+            "INSERT INTO samples (sha256, label, predicted, added_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(sha256) DO UPDATE SET label = excluded.label, used = 0 WHERE label != excluded.label",
+            (sha256, label, predicted, time.time()),
+        )
+        db.commit()
+        db.close()
+    return sha256
+
+
+def get_staging_stats() -> dict:
+    """Returns how many confirmed photos are staged, how many of them are new, and the state of the fine-tuning job."""
+    with _db_lock:
+        db = _connect()
+        total, new = db.execute("SELECT COUNT(*), COALESCE(SUM(used = 0), 0) FROM samples").fetchone()
+        db.close()
+    return {"staged": total, "new": new, "min_new_samples": MIN_NEW_SAMPLES, **_status}
+
+
+def _load_staged(used: int) -> tuple:
+    with _db_lock:
+        db = _connect()
+        rows = db.execute("SELECT sha256, label FROM samples WHERE used = ? ORDER BY added_at", (used,)).fetchall()
+        db.close()
+    images, labels, hashes = [], [], []
+    for sha256, label in rows:
+        with open(os.path.join(staging_dir, "images", sha256), "rb") as f:
+            images.append(preprocess_image(f.read()).astype(np.uint8))
+        labels.append(_CLASS_NAMES.index(label))
+        hashes.append(sha256)
+    return images, labels, hashes
+
+
+def _mark_used(hashes: list, labels: list) -> None:
+    """
+    Turns the photos of a run into replay photos of the next runs. Only the label the run trained on is marked:
+    a photo whose label was corrected while the run was going on stays new, so the correction is part of the next run.
+    """
+    with _db_lock:
+        db = _connect()
+        db.executemany("UPDATE samples SET used = 1 WHERE sha256 = ? AND label = ?",
+                       [(sha256, _CLASS_NAMES[label]) for sha256, label in zip(hashes, labels)])
+        db.commit()
+        db.close()
+
+
+def predict(model, images: np.ndarray, batch_size: int = 32) -> np.ndarray:
+    return np.concatenate([
+        model(images[i:i + batch_size].astype("float32"), training=False).numpy()
+        for i in range(0, len(images), batch_size)
+    ])
+
+
+def accuracy(model, images: np.ndarray, labels: np.ndarray, fast_model=None) -> float:
+    """Accuracy of the model, or of the cascade of fast_model and model exactly as plant_api runs it."""
+    if fast_model is None:
+        probs = predict(model, images)
+    else:
+        probs, _ = plant_api.cascade_predict(lambda batch: predict(fast_model, batch), lambda batch: predict(model, batch),
+                                             images, plant_api.CASCADE_THRESHOLD)
+    return float(np.mean(np.argmax(probs, axis=1) == labels))
+
+
+def _replace_model(model, path: str, previous_path: str) -> None:
+    tmp_path = path + ".finetune.tmp.keras"  # same folder, so os.replace does not cross file systems
+    model.compile()  # saved without the optimizer, the app loads it with compile=False anyway
+    model.save(tmp_path)
+    shutil.copy2(path, previous_path)
+    os.replace(tmp_path, path)
+
+
+def _models_hash(paths: list) -> str:
+    return hashlib.sha256("".join(plant_api._file_sha256(path) for path in paths).encode("ascii")).hexdigest()
+
+
+def _read_baseline(models_hash: str, validation_hash: str):
+    """
+    Returns the stored reference accuracies if the current models were written by an accepted run
+    and the validation split did not change since; otherwise None (the current models are the new reference).
+    """
+    if not os.path.exists(baseline_path):
+        return None
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline["models_hash"] != models_hash or baseline["validation_hash"] != validation_hash:
+        return None
+    return baseline
+
+
+def _write_baseline(baseline: dict) -> None:
+    os.makedirs(staging_dir, exist_ok=True)
+    tmp_path = baseline_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(baseline, f)
+    os.replace(tmp_path, baseline_path)
+
+
+def run_finetune() -> dict:
+    """
+    Fine-tunes the current model (and the cascade's fast model, if the app uses it) on the new staged photos
+    plus replay, and swaps them in if they pass validation.
+    """
+    import tensorflow as tf
+
+    dataset_cache = dataset_cache_module()
+
+    start = time.perf_counter()
+    new_images, new_labels, new_hashes = _load_staged(used=0)
+    if not new_images:
+        return {"accepted": False, "reason": "no new photos"}
+
+    # Step 1: replay photos and the validation split
+    manifest = dataset_cache.build_dataset_cache()
+    if manifest["class_names"] != _CLASS_NAMES:
+        raise RuntimeError(f"the dataset classes {manifest['class_names']} do not match the app's {_CLASS_NAMES}")
+    val_hashes = {entry["sha256"] for entry in manifest["entries"] if entry["split"] == "validation"}
+    # a reference photo from the validation split that is uploaded again must not be trained on,
+    # otherwise the validation accuracy would no longer be a fair check
+    keep = [i for i, sha256 in enumerate(new_hashes) if sha256 not in val_hashes]
+    if not keep:
+        # training on replay photos alone would only produce (and swap in) a model that learned nothing new
+        _mark_used(new_hashes, new_labels)
+        return {"accepted": False, "reason": "no trainable new photos", "new_photos": len(new_images), "trained_on": 0}
+    val_images, val_labels, _ = dataset_cache.load_arrays("validation", manifest=manifest)
+    train_images, train_labels, _ = dataset_cache.load_arrays("training", manifest=manifest)
+    old_images, old_labels, _ = _load_staged(used=1)
+    replay_images = np.concatenate([train_images, np.array(old_images, dtype=np.uint8).reshape(-1, *train_images.shape[1:])])
+    replay_labels = np.concatenate([train_labels, np.array(old_labels, dtype=np.int32)])
+
+    # Step 2: the mixed batches, new photos drawn with replacement (there are only a few of them)
+    rng = np.random.default_rng()
+    total = FINETUNE_STEPS * BATCH_SIZE
+    n_replay = int(total * REPLAY_FRACTION)
+    new_index = rng.choice(keep, total - n_replay)
+    replay_index = rng.choice(len(replay_labels), n_replay)
+    x = np.concatenate([np.array(new_images, dtype=np.uint8)[new_index].reshape(-1, *train_images.shape[1:]),
+                        replay_images[replay_index]])
+    y = np.concatenate([np.array(new_labels, dtype=np.int32)[new_index], replay_labels[replay_index]])
+    order = rng.permutation(total)
+    dataset = (tf.data.Dataset.from_tensor_slices((x[order], y[order])).batch(BATCH_SIZE)
+               .map(lambda a, b: (tf.cast(a, tf.float32), b)))
+
+    # Step 3: train separate copies, so the models serving the app are not touched
+    # (the fast model only when the cascade is on: then it answers most photos without asking the full model)
+    model = tf.keras.models.load_model(plant_api.model_path, compile=False)
+    fast_model = tf.keras.models.load_model(plant_api.fast_model_path, compile=False) if plant_api.cascade_enabled() else None
+    accuracy_before = accuracy(model, val_images, val_labels)
+    cascade_before = accuracy(model, val_images, val_labels, fast_model) if fast_model is not None else None
+    for candidate in (model, fast_model):
+        if candidate is not None:
+            candidate.compile(optimizer=tf.keras.optimizers.Adam(LEARNING_RATE), loss="sparse_categorical_crossentropy")
+            candidate.fit(dataset, epochs=1, verbose=0)
+    accuracy_after = accuracy(model, val_images, val_labels)
+    cascade_after = accuracy(model, val_images, val_labels, fast_model) if fast_model is not None else None
+
+    # Step 4: keep them only if neither the full model nor the cascade is worse than the reference model
+    model_paths = [plant_api.model_path] + ([plant_api.fast_model_path] if fast_model is not None else [])
+    validation_hash = hashlib.sha256("".join(sorted(val_hashes)).encode("ascii")).hexdigest()
+    baseline = _read_baseline(_models_hash(model_paths), validation_hash) or {
+        "validation_hash": validation_hash,
+        "val_accuracy": accuracy_before,
+        "cascade_val_accuracy": cascade_before,
+    }
+    accepted = accuracy_after >= baseline["val_accuracy"] - MAX_ACCURACY_DROP
+    if fast_model is not None:
+        accepted = accepted and cascade_after >= baseline["cascade_val_accuracy"] - MAX_ACCURACY_DROP
+    result = {
+        "accepted": accepted,
+        "new_photos": len(new_images),
+        "trained_on": len(keep),
+        "val_accuracy_reference": baseline["val_accuracy"],
+        "val_accuracy_before": accuracy_before,
+        "val_accuracy_after": accuracy_after,
+        "cascade_val_accuracy_reference": baseline["cascade_val_accuracy"],
+        "cascade_val_accuracy_before": cascade_before,
+        "cascade_val_accuracy_after": cascade_after,
+    }
+    if result["accepted"]:
+        _replace_model(model, plant_api.model_path, previous_model_path)
+        if fast_model is not None:
+            _replace_model(fast_model, plant_api.fast_model_path, previous_fast_model_path)
+        # the next run is gated against the same reference, as long as the models are the ones written here
+        _write_baseline({**baseline, "models_hash": _models_hash(model_paths)})
+        plant_api.reload_model()
+        _rebuild_similar_index()
+
+    # the photos of this run become replay photos of the next runs, also when the result was rejected
+    _mark_used(new_hashes, new_labels)
+    result["seconds"] = time.perf_counter() - start
+    cascade = f", cascade {cascade_before:.3f} -> {cascade_after:.3f}" if fast_model is not None else ""
+    logger.info("Fine-tuning on %d new photos: validation accuracy %.3f -> %.3f%s, %s (%.1f s)", len(new_images),
+                accuracy_before, accuracy_after, cascade, "accepted" if result["accepted"] else "rejected", result["seconds"])
+    return result
+
+
+def _rebuild_similar_index() -> None:
+    # the "similar plants" index holds features of the old model; it is rebuilt if it exists
+    from similar_plants import build_index, index_dir
+
+    if os.path.exists(os.path.join(index_dir, "manifest.json")):
+        build_index()
+
+
+def _run_job() -> None:
+    global _job_thread
+    try:
+        _status["last_run"] = run_finetune()
+    except Exception as e:
+        # a failed run must not take the app down; the photos stay staged for the next attempt
+        logger.exception("Fine-tuning failed: %s", e)
+        _status["last_run"] = {"accepted": False, "reason": str(e)}
+    finally:
+        with _job_lock:
+            _status["state"] = "idle"
+            _job_thread = None
+
+
+def maybe_start_finetune() -> bool:
+    """Starts a fine-tuning run in a daemon thread when enough new photos are staged and no run is going on."""
+    global _job_thread
+    if MIN_NEW_SAMPLES <= 0 or get_staging_stats()["new"] < MIN_NEW_SAMPLES:
+        return False
+    with _job_lock:
+        if _job_thread is not None:
+            return False
+        _status["state"] = "running"
+        _job_thread = threading.Thread(target=_run_job, name="plant-finetune", daemon=True)
+        _job_thread.start()
+    return True
+
+
+if __name__ == "__main__":
+    # the result of the run is logged; show it on standard error
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    stats = get_staging_stats()
+    print(f"{stats['staged']} staged photos, {stats['new']} new")
+    run_finetune()
@@ -0,0 +1,198 @@
+# --- Local Inference Server ---
+# This script runs the plant classifier as a standalone worker process on this machine.
+# Several Streamlit app processes can then share one copy of the model instead of each loading their own.
+# The app processes become clients by setting the PLANT_INFERENCE_URL environment variable (see "plant_api.py").
+# Requests from all clients are put in one queue and batched dynamically: a batch is run as soon as
+# --max-batch-size images are waiting or --max-wait-ms have passed since the first one arrived.
+
+# --- how to run ---
+# type in your terminal: python app/inference_server.py --port 8765
+# then start the app with: PLANT_INFERENCE_URL=http://127.0.0.1:8765 streamlit run app/app.py
+
+# The answers carry the hash of the model the server has loaded (not of the file on disk), because the clients cache
+# the predictions under it. When the model files change (a retrain, or "finetune.py" swapping in a fine-tuned model),
+# the next request notices it and the server reloads the model in a background thread. Requests arriving during the
+# reload wait for it (a few seconds), so every answer is labelled with the hash of the model that really made it.
+# POST /reload reloads immediately and answers once the new model is serving.
+
+# --- Endpoints ---
+# POST /predict   body {"images": [<base64 image bytes>, ...]}  ->  {"probabilities": [[...], ...], "labels": [...], "model_hash": ...}
+# POST /reload    ->  {"status": "ok", "model_hash": ...}
+# GET  /health    ->  {"status": "ok", "model_loaded": ..., "load_seconds": ..., "model_hash": ...}
+
+# --- Reference ---
+# https://docs.python.org/3/library/http.server.html
+# https://docs.python.org/3/library/argparse.html
+
+import argparse
+import base64
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from plant_api import (
+    MAX_BATCH_SIZE,
+    MicroBatcher,
+    _CLASS_NAMES,
+    _current_model_hash,
+    get_model_status,
+    predict_batch,
+    preprocess_image,
+    reload_model,
+)
+
+logger = logging.getLogger(__name__)
+
+# the batcher is created in main() once the command-line options are known
+_batcher = None
+
+# The hash of the loaded model is only changed together with the model itself: a batch holds _model_lock while it runs,
+# and a reload holds it while it replaces the model, so no answer is labelled with the hash of a model that did not make it.
+_model_lock = threading.Lock()
+_loaded_model_hash = None
+_reload_thread = None
+_reload_thread_lock = threading.Lock()
+
+
+def _predict_with_hash(batch):
+    """Runs one batch and returns (probabilities, hash of the model that made them) per image."""
+    with _model_lock:
+        preds = predict_batch(batch)
+        return [(row, _loaded_model_hash) for row in preds]
+
+
+def _load_model() -> None:
+    """(Re)loads the model and records the hash of the files it was loaded from."""
+    global _loaded_model_hash
+    with _model_lock:
+        # the files are hashed before loading, so a file replaced during the load makes the next check reload again
+        model_hash = _current_model_hash()
+        if _loaded_model_hash is None:
+            # the first load also traces the forward pass, so the first client does not pay for it
+            predict_batch(np.zeros((1, 224, 224, 3), dtype="float32"))
+        else:
+            reload_model()
+        _loaded_model_hash = model_hash
+    logger.info("Serving model %s", model_hash[:12])
+
+
+def _reload_if_changed() -> None:
+    """Starts a background reload when the model files no longer match the loaded model."""
+    global _reload_thread
+    try:
+        changed = _current_model_hash() != _loaded_model_hash
+    except OSError:
+        return  # a model file is being replaced right now; the next request checks again
+    if not changed:
+        return
+    with _reload_thread_lock:
+        if _reload_thread is None or not _reload_thread.is_alive():
+            _reload_thread = threading.Thread(target=_load_model, name="plant-model-reload", daemon=True)
+            _reload_thread.start()
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """Handles one HTTP request; ThreadingHTTPServer runs every request in its own thread."""
+
+    # keep-alive connections let the clients' requests.Session reuse one connection
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately; without this, Nagle's algorithm delays every response by ~40 ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        status = get_model_status()
+        self._send_json(200, {
+            "status": "ok",
+            "model_loaded": status["loaded"],
+            "load_seconds": status["load_seconds"],
+            "model_hash": _loaded_model_hash,
+        })
+
+    def do_POST(self):
+        if self.path == "/reload":
+            try:
+                _load_model()
+            except Exception as e:
+                self._send_json(500, {"error": f"reload failed: {e}"})
+                return
+            self._send_json(200, {"status": "ok", "model_hash": _loaded_model_hash})
+            return
+        if self.path != "/predict":
+            self._send_json(404, {"error": "not found"})
+            return
+        _reload_if_changed()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            images = [base64.b64decode(image) for image in json.loads(self.rfile.read(length))["images"]]
+            # decoding happens here, in the request thread, so several requests are decoded in parallel
+            arrays = [preprocess_image(image_bytes) for image_bytes in images]
+        except (KeyError, TypeError, ValueError, OSError) as e:
+            self._send_json(400, {"error": f"invalid request: {e}"})
+            return
+
+        # every image goes into the shared queue and is batched together with the images of other clients
+        futures = [_batcher.submit(arr) for arr in arrays]
+        try:
+            results = [future.result() for future in futures]
+        except Exception as e:
+            self._send_json(500, {"error": f"inference failed: {e}"})
+            return
+        preds = np.stack([row for row, _ in results]) if results else np.zeros((0, len(_CLASS_NAMES)))
+        # the clients cache the predictions under the hash of the model that made them; if a reload happened between
+        # two batches of this request, the images come from different models and the answer is not cached (None)
+        model_hashes = {model_hash for _, model_hash in results}
+        model_hash = model_hashes.pop() if len(model_hashes) == 1 else None
+        self._send_json(200, {
+            "probabilities": preds.tolist(),
+            "labels": [_CLASS_NAMES[int(idx)] for idx in np.argmax(preds, axis=1)],
+            "model_hash": model_hash,
+        })
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # one log line per request would flood the terminal under load
+        pass
+
+
+def main() -> None:
+    global _batcher
+    parser = argparse.ArgumentParser(description="Serve the plant classifier to local app processes.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE, help="largest batch run at once")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="how long a batch waits for more images")
+    args = parser.parse_args()
+    # plant_api reports the model load time through logging; the server shows it on standard error
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # the model is loaded before the server accepts requests, so the first client does not pay for it
+    _load_model()
+    _batcher = MicroBatcher(_predict_with_hash, args.max_batch_size, args.max_wait_ms / 1000.0)
+
+    server = ThreadingHTTPServer((args.host, args.port), InferenceRequestHandler)
+    server.daemon_threads = True
+    print(f"Plant inference server listening on http://{args.host}:{args.port} "
+          f"(max batch {args.max_batch_size}, max wait {args.max_wait_ms} ms)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# --- Access to the Training Scripts' Modules ---
+# Some app modules reuse code of the training scripts in the "model" folder: the fine-tuning job reads the replay
+# images and the validation split from the dataset cache, and the similar plants index and the bulk classification CLI
+# list images with the dataset cache's scanner and file extensions, so all of them agree on which images exist.
+# The modules in the "model" folder import each other by name, so that folder has to be on sys.path.
+# It is added only when one of them is first needed (not when the app starts), and at the end of sys.path,
+# so it cannot hide a module of the app.
+
+# --- Reference ---
+# https://docs.python.org/3/library/sys.html#sys.path
+
+import os
+import sys
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+model_dir = os.path.abspath(os.path.join(script_dir, os.pardir, "model"))
+
+
+def dataset_cache_module():
+    """Returns the "model/dataset_cache.py" module (importing it loads TensorFlow)."""
+    if model_dir not in sys.path:
+        sys.path.append(model_dir)
+    import dataset_cache
+
+    return dataset_cache
@@ -15,61 +15,818 @@
 
 # Import necessary libraries
 # os is used to locate the model file.
+# base64 is used to send images to the local inference server inside a JSON request.
+# hashlib is used to hash uploaded images and the model file for the prediction cache.
+# sqlite3 is used to keep the prediction cache on disk between restarts.
+# collections.OrderedDict is used as the in-memory LRU part of the prediction cache.
+# threading is used to load the model in a background warm-up thread, to share one instance between sessions
+# and to run the micro-batching worker that merges concurrent requests.
+# concurrent.futures.Future is used to hand a micro-batched result back to the session that asked for it.
+# queue is used to pass pending requests to the micro-batching worker.
+# time is used to measure how long the model takes to load.
+# logging is used for the load times and fallbacks: this module is imported by the app, the inference server and
+# the command line tools, so it must not print to their standard output (classify_dir.py streams JSON lines there).
 # io.BytesIO is used to read the raw bytes of the uploaded image.
+import base64
+import hashlib
+import logging
 import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from io import BytesIO
 
 # numpy is used for numerical operations, especially for handling image data.
-# tensorflow is used for loading the Keras model and running inference.
 # PIL (Pillow) is used for image processing, specifically to open and manipulate images.
+# tensorflow is used for loading the Keras model and running inference.
+# It is NOT imported here: importing TensorFlow takes several seconds, so it is only imported when the model is first needed.
+# requests is used to talk to the optional local inference server.
 import numpy as np
-import tensorflow as tf
-from PIL import Image
+import requests
+from PIL import Image, ImageOps
 
 # — Step 1: locate & load the .keras model —
 # The model was trained using TensorFlow 2.12.0 and Keras 2.12.0.
 # The model file is located in the "model" directory
 # https://docs.python.org/3/library/os.path.html
+logger = logging.getLogger(__name__)
 script_dir = os.path.dirname(os.path.abspath(__file__))
+IMAGE_SIZE = (224, 224)  # the model only accepts images of size 224x224 pixels
 model_dir = os.path.join(script_dir, os.pardir, "model")
-model_path = os.path.join(model_dir, "plant_classifier.keras")
-_model = tf.keras.models.load_model(model_path)
+# PLANT_MODEL_PATH can point to another model with the same input and output, e.g. the distilled student from "model/distill.py"
+model_path = os.environ.get("PLANT_MODEL_PATH", os.path.join(model_dir, "plant_classifier.keras"))
+# the optional small 96px companion model trained with "python model/predict.py --fast" (see Step 4)
+fast_model_path = os.path.join(model_dir, "plant_classifier_fast.keras")
+# the quantized TFLite version of the full model chosen by "python model/export_tflite.py" (see below)
+tflite_model_path = os.path.join(model_dir, "plant_classifier.tflite")
+# runtime caches (predictions, weather, ...) are kept in the "cache" folder next to "app" and "model"
+cache_dir = os.environ.get("PLANTELLIGENCE_CACHE_DIR", os.path.join(script_dir, os.pardir, "cache"))
+
+
+# The model is not loaded at import time anymore, because "app.py" imports this module on every start.
+# Instead, a single holder per process loads it on first use (or in a background warm-up thread).
+# Streamlit imports this module only once per server process, so all browser sessions share the same model instance.
+# https://docs.python.org/3/library/threading.html
+class _ModelHolder:
+    """
+    Holds one lazily loaded Keras model per process.
+    The model is loaded either on the first call to get() or in the background by warm_up(),
+    and the time the load took is kept in load_seconds.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.load_seconds = None
+        self._model = None
+        self._forward = None
+        self._embed = None
+        self._lock = threading.Lock()
+        self._warm_up_thread = None
+
+    def get(self):
+        """Returns the loaded model, loading it first if no other thread has done so yet."""
+        # the lock makes sure that two sessions uploading at the same time do not load the model twice
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def warm_up(self) -> None:
+        """Starts loading the model in a daemon thread so the first upload does not have to wait for it."""
+        with self._lock:
+            if self._model is not None or self._warm_up_thread is not None:
+                return
+            self._warm_up_thread = threading.Thread(target=self.get, name="plant-model-warm-up", daemon=True)
+            self._warm_up_thread.start()
+
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Runs one compiled forward pass over a (N, 224, 224, 3) float32 batch and returns the (N, classes) probabilities."""
+        self.get()
+        return self._forward(batch).numpy()
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        """Returns the penultimate-layer features (the input of the final Dense layer, e.g. the Dense(128) output) of a batch."""
+        self.get()
+        with self._lock:
+            if self._embed is None:
+                import tensorflow as tf
+
+                # a second model sharing the same layers, that stops before the output layer
+                # (self._model is read under the lock, so a concurrent reload() cannot mix two models)
+                model = self._model
+                features = tf.keras.Model(model.inputs[0], model.layers[-1].input)
+                self._embed = tf.function(
+                    lambda batch: features(batch, training=False),
+                    input_signature=[tf.TensorSpec(shape=(None, *IMAGE_SIZE, 3), dtype=tf.float32)],
+                )
+        return self._embed(batch).numpy()
+
+    def _load(self):
+        # tensorflow is imported here, so the cost of the import is part of the measured load time
+        start = time.perf_counter()
+        import tensorflow as tf
+
+        # compile=False skips restoring the optimizer, which is only needed for training
+        model = tf.keras.models.load_model(self.path, compile=False)
+        self._forward = self._make_forward(model)
+        self.load_seconds = time.perf_counter() - start
+        logger.info("Loaded plant classifier from %s in %.2f s", self.path, self.load_seconds)
+        return model
+
+    @staticmethod
+    def _make_forward(model):
+        import tensorflow as tf
+
+        # model.predict() builds a whole tf.data pipeline on every call, which costs far more than one small forward pass.
+        # Instead the forward pass is traced once as a tf.function; the batch dimension is left open (None),
+        # so batches of any size reuse the same compiled graph.
+        # https://www.tensorflow.org/guide/function
+        return tf.function(
+            lambda batch: model(batch, training=False),
+            input_signature=[tf.TensorSpec(shape=(None, *IMAGE_SIZE, 3), dtype=tf.float32)],
+        )
+
+    def reload(self) -> None:
+        """
+        Loads the model file again (e.g. after fine-tuning replaced it) and switches to it once it is ready.
+        The new model is loaded and traced without holding the lock, so predictions keep running
+        on the old model in the meantime; requests already running finish on the model they started with.
+        """
+        if self._model is None:
+            return  # not loaded yet, the first get() will read the new file
+        import tensorflow as tf
+
+        start = time.perf_counter()
+        model = tf.keras.models.load_model(self.path, compile=False)
+        forward = self._make_forward(model)
+        forward(np.zeros((1, *IMAGE_SIZE, 3), dtype="float32"))  # traced here, not in the first request after the swap
+        with self._lock:
+            self._model, self._forward, self._embed = model, forward, None
+        self.load_seconds = time.perf_counter() - start
+        logger.info("Reloaded plant classifier from %s in %.2f s", self.path, self.load_seconds)
+
+
+# The full model can also run as a quantized TFLite model, which is several times smaller and faster on CPU-only servers.
+# PLANT_BACKEND=tflite switches to it (if "model/export_tflite.py" has produced it); the default stays the Keras model.
+# The similar plants lookup needs the model's inner features, which the TFLite file does not expose, so it keeps using Keras.
+# https://www.tensorflow.org/lite/guide/inference
+BACKEND = os.environ.get("PLANT_BACKEND", "keras").lower()
+
+
+class _TFLiteHolder(_ModelHolder):
+    """
+    Same interface as _ModelHolder for predict(), but runs a TFLite model with the TFLite interpreter.
+    It has no embeddings; embed_images() uses the Keras model in any case (see _embedding_holder).
+    One interpreter cannot run two inferences at the same time, so predict() holds a lock while it runs.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._invoke_lock = threading.Lock()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        interpreter = self.get()
+        with self._invoke_lock:
+            input_detail = interpreter.get_input_details()[0]
+            # the input is resized to the batch size; this only re-allocates when the size changes
+            if tuple(input_detail["shape"]) != batch.shape:
+                interpreter.resize_tensor_input(input_detail["index"], batch.shape)
+                interpreter.allocate_tensors()
+                input_detail = interpreter.get_input_details()[0]
+            if input_detail["dtype"] == np.uint8:
+                # the fully integer model takes the 0-255 pixel values directly
+                batch = np.clip(np.round(batch), 0, 255)
+            interpreter.set_tensor(input_detail["index"], batch.astype(input_detail["dtype"]))
+            interpreter.invoke()
+            return interpreter.get_tensor(interpreter.get_output_details()[0]["index"]).copy()
+
+    def _load(self):
+        start = time.perf_counter()
+        # the standalone LiteRT interpreter is much lighter than TensorFlow; it is used when installed
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+        interpreter = Interpreter(model_path=self.path, num_threads=os.cpu_count())
+        interpreter.allocate_tensors()
+        self.load_seconds = time.perf_counter() - start
+        logger.info("Loaded TFLite plant classifier from %s in %.2f s", self.path, self.load_seconds)
+        return interpreter
+
+    def reload(self) -> None:
+        """Creates a new interpreter from the file (e.g. after it was exported again) and switches to it."""
+        if self._model is None:
+            return
+        interpreter = self._load()
+        # waits for a running inference, which finishes on the old interpreter
+        with self._invoke_lock:
+            self._model = interpreter
+
+
+_keras_model_holder = _ModelHolder(model_path)
+if BACKEND == "tflite" and os.path.exists(tflite_model_path):
+    _model_holder = _TFLiteHolder(tflite_model_path)
+else:
+    if BACKEND == "tflite":
+        logger.warning("PLANT_BACKEND=tflite, but %s does not exist; using the Keras model", tflite_model_path)
+    _model_holder = _keras_model_holder
+_fast_model_holder = _ModelHolder(fast_model_path)
+
+
+def warm_up_model() -> None:
+    """
+    Starts loading the classifier in the background.
+    "app.py" calls this on every run; only the first call per process actually starts a thread.
+    When a local inference server is configured, the model is only loaded if the server cannot be reached.
+    """
+    if INFERENCE_SERVER_URL:
+        return
+    _model_holder.warm_up()
+    if cascade_enabled():
+        _fast_model_holder.warm_up()
+
+
+def reload_model() -> None:
+    """
+    Switches the in-process Keras models (the full one and the cascade's fast one) to the current content of their files,
+    without restarting the app (used by "finetune.py" after it replaced them). Prediction cache entries of the old models
+    are dropped automatically, because the cache is keyed by the hash of the model files.
+    With PLANT_BACKEND=tflite the TFLite file is read again as well (it only changes when it is exported again).
+    """
+    _keras_model_holder.reload()
+    if _model_holder is not _keras_model_holder:
+        _model_holder.reload()
+    _fast_model_holder.reload()
+
+
+def get_model_status() -> dict:
+    """Returns whether the classifier is loaded and how many seconds loading it took (None while not loaded)."""
+    return {
+        "loaded": _model_holder.is_loaded(),
+        "load_seconds": _model_holder.load_seconds,
+        "backend": "tflite" if isinstance(_model_holder, _TFLiteHolder) else "keras",
+        "cascade": cascade_enabled(),
+        "fast_load_seconds": _fast_model_holder.load_seconds,
+    }
 
 # — Step 2: class names in the same order as the training folders —
 # The model was trained on a dataset with five classes:
 # "edible", "flower", "grass", "succulent", and "tree".
 _CLASS_NAMES = ["Edible", "Flower", "Grass", "Succulent", "Tree"]
 
-# — Step 3: define the function to classify the image —
-# This function accepts the raw bytes of an uploaded plant image, preprocesses it, runs inference, and returns one of the five class labels.
+# — Step 3: preprocess the raw image bytes —
+# This function turns the raw bytes of one uploaded plant image into the array the model expects.
 # The model only accepts images of size 224x224 pixels, so the function resizes the image accordingly.
-def classify_plant_image(image_bytes: bytes) -> str:
+# Phone photos and the 1280px images in "plant_images" are much larger than that, so instead of decoding
+# every pixel only to throw most of them away, JPEGs are decoded directly at a reduced scale (draft mode)
+# and images whose header announces more than MAX_IMAGE_PIXELS pixels are refused before anything is decoded.
+# https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.draft
+# https://pillow.readthedocs.io/en/stable/reference/ImageOps.html#PIL.ImageOps.exif_transpose
+MAX_IMAGE_PIXELS = 40_000_000  # about 40 megapixels, more than any phone camera produces
+
+
+def preprocess_image(image_bytes: bytes) -> np.ndarray:
     """
-    Accepts the raw bytes of an uploaded plant image,
-    preprocesses it, runs inference, and returns
-    one of the five class labels.
+    Decodes the raw bytes of a plant image and returns
+    a (224, 224, 3) float32 array with values left in [0–255]
+    (the model rescales them itself).
+    Raises ValueError for images larger than MAX_IMAGE_PIXELS.
     """
     # 1) open from raw bytes
     # buf declared here is a BytesIO object that allows us to read the raw bytes of the uploaded image.
-    # img is a PIL Image object that represents the image.
+    # img is a PIL Image object that represents the image; at this point only the header has been read.
     buf = BytesIO(image_bytes)
     img = Image.open(buf)
+    if img.width * img.height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"image is too large ({img.width}x{img.height} pixels)")
+
+    # 2) reduced-resolution decode
+    # for JPEGs, draft() makes the decoder scale the image by 1/2, 1/4 or 1/8 while decoding,
+    # picking the smallest scale that is still at least 224x224; other formats ignore it.
+    img.draft("RGB", IMAGE_SIZE)
+
+    # 3) apply the EXIF orientation, so photos taken in portrait mode are not classified sideways
+    img = ImageOps.exif_transpose(img)
 
-    # 2) ensure RGB & resize
-    img = img.convert("RGB").resize((224, 224))
+    # 4) ensure RGB & resize
+    # non-JPEG images are first shrunk by an integer factor with reduce(), which is much cheaper than resizing from full size
+    img = img.convert("RGB")
+    factor = min(img.width // IMAGE_SIZE[0], img.height // IMAGE_SIZE[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    img = img.resize(IMAGE_SIZE)
 
-    # 3) to numpy array, float32, leave in [0–255]
+    # 5) to numpy array, float32, leave in [0–255]
     # arr is a numpy array that represents the image data.
-    arr = np.array(img).astype("float32")
+    return np.asarray(img, dtype="float32")
+
+
+# — Step 4: run the model on a batch —
+# Batches larger than MAX_BATCH_SIZE are split into chunks, so a huge upload list does not allocate one giant tensor.
+# Most uploads are easy cases (a cactus, a lawn), so the small 96px companion model can run first on each chunk,
+# and only the images whose top probability is below CASCADE_THRESHOLD are escalated to the full 224px model.
+# The cascade is opt-in: it is only used when the companion model exists and PLANT_CASCADE_THRESHOLD is set below 1
+# (e.g. 0.8), after "python model/evaluate_cascade.py" has shown what that threshold costs in accuracy.
+MAX_BATCH_SIZE = 32
+CASCADE_THRESHOLD = float(os.environ.get("PLANT_CASCADE_THRESHOLD", "1.0"))
+
+_cascade_stats = {"images": 0, "escalated": 0, "seconds": 0.0}
+_cascade_stats_lock = threading.Lock()
+
+
+def cascade_enabled() -> bool:
+    """The cascade is used when the companion model has been trained and a threshold below 1 has been chosen."""
+    return CASCADE_THRESHOLD < 1.0 and os.path.exists(fast_model_path)
+
+
+def cascade_predict(fast_fn, full_fn, batch: np.ndarray, threshold: float):
+    """
+    Runs fast_fn over the whole batch and full_fn only over the images
+    whose top fast probability is below threshold.
+    Returns the probabilities and a boolean mask of the escalated images.
+    """
+    preds = np.array(fast_fn(batch))
+    escalated = preds.max(axis=1) < threshold
+    if escalated.any():
+        preds[escalated] = full_fn(batch[escalated])
+    return preds, escalated
+
+
+def get_cascade_stats() -> dict:
+    """Returns how many images went through the cascade, how many were escalated and the mean latency per image."""
+    with _cascade_stats_lock:
+        images, escalated, seconds = _cascade_stats["images"], _cascade_stats["escalated"], _cascade_stats["seconds"]
+    return {
+        "enabled": cascade_enabled(),
+        "threshold": CASCADE_THRESHOLD,
+        "images": images,
+        "escalated": escalated,
+        "escalation_rate": escalated / images if images else 0.0,
+        "mean_latency_ms": 1000 * seconds / images if images else 0.0,
+    }
+
+
+def _predict_chunk(chunk: np.ndarray) -> np.ndarray:
+    if not cascade_enabled():
+        return _model_holder.predict(chunk)
+    start = time.perf_counter()
+    preds, escalated = cascade_predict(_fast_model_holder.predict, _model_holder.predict, chunk, CASCADE_THRESHOLD)
+    with _cascade_stats_lock:
+        _cascade_stats["images"] += len(chunk)
+        _cascade_stats["escalated"] += int(escalated.sum())
+        _cascade_stats["seconds"] += time.perf_counter() - start
+    return preds
+
+
+def predict_batch(batch: np.ndarray) -> np.ndarray:
+    """
+    Runs the classifier (or the cascade) over a stacked (N, 224, 224, 3) float32 batch
+    and returns the (N, 5) array of class probabilities.
+    """
+    chunks = [
+        _predict_chunk(batch[start:start + MAX_BATCH_SIZE])
+        for start in range(0, len(batch), MAX_BATCH_SIZE)
+    ]
+    return np.concatenate(chunks, axis=0)
+
+
+# — Step 5: micro-batching of concurrent requests —
+# Every Streamlit session runs in its own thread. When several users upload at the same time,
+# each single image would otherwise pay for its own forward pass.
+# The micro-batcher waits a short window after the first pending image, collects what other sessions sent meanwhile,
+# and runs them all in one forward pass. It is disabled by default (window of 0 ms) and can be enabled
+# per call or for the whole process with the PLANT_MICRO_BATCH_WINDOW_MS environment variable.
+# https://docs.python.org/3/library/queue.html
+MICRO_BATCH_WINDOW_MS = float(os.environ.get("PLANT_MICRO_BATCH_WINDOW_MS", "0"))
+
+
+class MicroBatcher:
+    """
+    Collects single images submitted from many threads and predicts them together.
+    A batch is run as soon as max_batch_size images are waiting or max_wait_seconds
+    have passed since the first image of the batch arrived.
+    """
+
+    def __init__(self, predict_fn, max_batch_size: int, max_wait_seconds: float):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._pending = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="plant-micro-batcher", daemon=True)
+        self._worker.start()
 
-    # 4) batch dimension
-    # batch is a numpy array with an additional dimension to represent the batch size.
-    batch = np.expand_dims(arr, axis=0)
+    def submit(self, arr: np.ndarray) -> Future:
+        """Queues one preprocessed image; the returned future resolves to its row of probabilities."""
+        future = Future()
+        self._pending.put((arr, future))
+        return future
 
-    # 5) predict
-    # preds is a numpy array of predicted probabilities for each class.
-    # idx is the index of the class with the highest predicted probability.
+    def _run(self) -> None:
+        while True:
+            # block until the first image of the next batch arrives, then keep collecting until the window closes
+            items = [self._pending.get()]
+            deadline = time.monotonic() + self.max_wait_seconds
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # one forward pass for everything collected; errors are handed back to every waiting caller
+            try:
+                preds = self.predict_fn(np.stack([arr for arr, _ in items]))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), row in zip(items, preds):
+                future.set_result(row)
+
+
+_micro_batchers = {}
+_micro_batchers_lock = threading.Lock()
+
+
+def _get_micro_batcher(window_ms: float) -> MicroBatcher:
+    # one shared batcher per window length, created on first use
+    with _micro_batchers_lock:
+        if window_ms not in _micro_batchers:
+            _micro_batchers[window_ms] = MicroBatcher(predict_batch, MAX_BATCH_SIZE, window_ms / 1000.0)
+        return _micro_batchers[window_ms]
+
+
+# — Step 6: optional local inference server —
+# Instead of every Streamlit process holding its own copy of the model, the model can be served by one
+# worker process ("inference_server.py") that batches the requests of all app processes together.
+# Setting PLANT_INFERENCE_URL (e.g. http://127.0.0.1:8765) makes this module a client of that server.
+# If the server cannot be reached, the images are classified in-process instead, and the server
+# is not asked again for INFERENCE_SERVER_RETRY_SECONDS, so a dead server does not slow down every upload.
+# The server may run another model than the files next to this process (or they may not exist at all), so its
+# answers carry the hash of the server's model, and the prediction cache (Step 7) stores them under that hash.
+# https://requests.readthedocs.io/en/latest/user/advanced/#session-objects
+INFERENCE_SERVER_URL = os.environ.get("PLANT_INFERENCE_URL", "").rstrip("/")
+INFERENCE_SERVER_TIMEOUT = (1.0, 30.0)  # seconds to connect, seconds to wait for the prediction
+INFERENCE_SERVER_RETRY_SECONDS = 30.0
+
+_inference_session = requests.Session()
+# both are read and written by the threads of all sessions, so they are only accessed under the lock
+_inference_server_lock = threading.Lock()
+_inference_server_down_until = 0.0
+_inference_server_model_hash = None  # the model hash of the last answer of the server
+
+
+def encode_images_request(images: list) -> dict:
+    """Builds the JSON body for the inference server's /predict endpoint."""
+    return {"images": [base64.b64encode(image_bytes).decode("ascii") for image_bytes in images]}
+
+
+def _inference_server_available() -> bool:
+    with _inference_server_lock:
+        return bool(INFERENCE_SERVER_URL) and time.monotonic() >= _inference_server_down_until
+
+
+def _predict_remote(images: list):
+    """
+    Asks the local inference server for the probabilities of the given raw images.
+    Returns (probabilities, hash of the server's model or None), or None if no server is configured or it cannot be reached.
+    Raises ValueError if the server refuses the request (4xx), e.g. because an image is broken or too large:
+    the server itself is fine then, so it is not marked as down and the images are not decoded again in-process.
+    """
+    global _inference_server_down_until, _inference_server_model_hash
+    if not _inference_server_available():
+        return None
+    try:
+        response = _inference_session.post(
+            f"{INFERENCE_SERVER_URL}/predict",
+            json=encode_images_request(images),
+            timeout=INFERENCE_SERVER_TIMEOUT,
+        )
+        refused = 400 <= response.status_code < 500
+        if not refused:
+            # only connection errors, timeouts, server errors (5xx) and broken answers mark the server as down
+            response.raise_for_status()
+            payload = response.json()
+            preds = np.asarray(payload["probabilities"], dtype="float32")
+    except (requests.RequestException, KeyError, ValueError) as e:
+        logger.warning("Inference server at %s failed (%s), classifying in-process", INFERENCE_SERVER_URL, e)
+        with _inference_server_lock:
+            _inference_server_down_until = time.monotonic() + INFERENCE_SERVER_RETRY_SECONDS
+        return None
+    if refused:
+        try:
+            error = response.json()["error"]
+        except (KeyError, ValueError):
+            error = response.reason
+        raise ValueError(f"inference server refused the images: {error}")
+    model_hash = payload.get("model_hash")
+    with _inference_server_lock:
+        _inference_server_model_hash = model_hash
+    return preds, model_hash
+
+
+# — Step 7: content-addressed prediction cache —
+# Users often upload the same photo twice, and the demo gardens reuse images from "plant_images".
+# The raw image bytes are hashed (SHA-256) and the label and probabilities are stored under that hash,
+# in an in-memory LRU cache backed by an SQLite file so the cache survives restarts.
+# Every entry also stores the hash of the model file, so retraining "plant_classifier.keras"
+# automatically invalidates all predictions made by the old model.
+# The SQLite file is shared by all processes (the app, classify_dir.py, the inference server), which may run different
+# models or settings at the same time, so rows of other model hashes are kept; only the oldest rows beyond
+# PREDICTION_CACHE_ROWS are dropped, whenever a process starts using a new model hash.
+# https://docs.python.org/3/library/hashlib.html
+# https://docs.python.org/3/library/sqlite3.html
+PREDICTION_CACHE_SIZE = 1024  # number of predictions kept in memory
+PREDICTION_CACHE_ROWS = 100_000  # number of predictions kept in the SQLite file
+prediction_cache_path = os.path.join(cache_dir, "predictions.sqlite")
+
+
+def _file_sha256(path: str) -> str:
+    # the file is read in 1 MB blocks so hashing a large model does not load it into memory at once
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _PredictionCache:
+    """
+    Maps (model hash, image hash) to (label, probabilities).
+    Lookups go to an in-memory LRU first and to the SQLite file second;
+    hits and misses are counted for get_prediction_cache_stats().
+    """
+
+    def __init__(self, db_path: str, max_entries: int, max_rows: int = PREDICTION_CACHE_ROWS):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._model_stat = None
+        self._model_hash = None
+
+    def model_hash(self, paths: tuple, extra: str = "") -> str:
+        """
+        Combined hash of the model files (and any extra setting that changes predictions);
+        it is only recomputed when one of the files' size or modification time changes.
+        """
+        stats = []
+        for path in paths:
+            stat = os.stat(path)
+            stats.append((path, stat.st_size, stat.st_mtime_ns))
+        key = (tuple(stats), extra)
+        with self._lock:
+            if key != self._model_stat:
+                self._model_hash = hashlib.sha256(
+                    ("".join(_file_sha256(path) for path in paths) + extra).encode("utf-8")
+                ).hexdigest()
+                self._model_stat = key
+                # rows are written in rowid order (INSERT OR REPLACE gives a replaced row a new rowid),
+                # so the rows below the newest max_rows are the oldest ones, whatever model made them
+                self._connect().execute(
+                    "DELETE FROM predictions WHERE rowid IN "
+                    "(SELECT rowid FROM predictions ORDER BY rowid DESC LIMIT -1 OFFSET ?)", (self.max_rows,)
+                )
+                self._connect().commit()
+            return self._model_hash
+
+    def get(self, model_hash: str, image_hash: str):
+        """Returns (label, probabilities) or None, and counts the hit or miss."""
+        key = (model_hash, image_hash)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            row = self._connect().execute(
+                "SELECT label, probabilities FROM predictions WHERE model_hash = ? AND image_hash = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = (row[0], np.frombuffer(row[1], dtype="float32"))
+            self._remember(key, entry)
+            return entry
+
+    def put(self, model_hash: str, image_hash: str, label: str, probabilities: np.ndarray) -> None:
+        probabilities = np.asarray(probabilities, dtype="float32")
+        key = (model_hash, image_hash)
+        with self._lock:
+            self._remember(key, (label, probabilities))
+            self._connect().execute(
+                "INSERT OR REPLACE INTO predictions (model_hash, image_hash, label, probabilities) VALUES (?, ?, ?, ?)",
+                (model_hash, image_hash, label, probabilities.tobytes()),
+            )
+            self._connect().commit()
+
+    def _remember(self, key, entry) -> None:
+        # least recently used entries are evicted from memory once max_entries is reached
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection shared by all session threads; every access happens under self._lock
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "model_hash TEXT, image_hash TEXT, label TEXT, probabilities BLOB, "
+                "PRIMARY KEY (model_hash, image_hash))"
+            )
+        return self._db
+
+
+_prediction_cache = _PredictionCache(prediction_cache_path, PREDICTION_CACHE_SIZE)
+
+
+def _current_model_hash() -> str:
+    # the hash covers the file the backend actually runs (.keras or .tflite), so switching backends does not reuse predictions
+    # with the cascade, a prediction depends on both models and on the threshold
+    if cascade_enabled():
+        return _prediction_cache.model_hash((_model_holder.path, fast_model_path), f"cascade@{CASCADE_THRESHOLD}")
+    return _prediction_cache.model_hash((_model_holder.path,))
+
+
+def get_prediction_cache_stats() -> dict:
+    """Returns the number of prediction cache hits and misses in this process and the resulting hit rate."""
+    hits, misses = _prediction_cache.hits, _prediction_cache.misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "memory_entries": len(_prediction_cache._memory),
+    }
+
+
+# — Step 8: "similar plants" lookup —
+# The reference photos in "plant_images" are embedded once by "similar_plants.py" (the penultimate-layer features
+# of the full model, stored as a memory-mapped float32 matrix). An upload is embedded the same way and compared
+# to all reference photos at once with a single matrix-vector product (cosine similarity).
+# The index is reloaded automatically when it is rebuilt.
+# The index also records the hash of the model it was built with: after retraining (or with another PLANT_MODEL_PATH)
+# the features of an upload are not comparable to the stored ones anymore, so the lookup returns nothing until the
+# index is rebuilt ("python app/similar_plants.py", or automatically after "finetune.py" replaced the model).
+_similar_index = None
+_similar_index_lock = threading.Lock()
+_embedding_model_stat = None
+_embedding_model_hash = None
+_warned_index_hash = None
+
+
+def _embedding_model_file_hash() -> str:
+    # SHA-256 of the Keras model file (the one the embeddings come from), only recomputed when its size or mtime changes
+    global _embedding_model_stat, _embedding_model_hash
+    path = _embedding_holder().path
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    with _similar_index_lock:
+        if key != _embedding_model_stat:
+            _embedding_model_hash = _file_sha256(path)
+            _embedding_model_stat = key
+        return _embedding_model_hash
+
+
+def _embedding_holder() -> _ModelHolder:
+    # the embeddings always come from the Keras model: the TFLite file (PLANT_BACKEND=tflite) only has the class
+    # probabilities as output, so with that backend the Keras model is loaded as well, for the lookup only
+    return _keras_model_holder
+
+
+def embed_images(batch: np.ndarray) -> np.ndarray:
+    """Returns the L2-normalised penultimate-layer embeddings of a stacked (N, 224, 224, 3) float32 batch."""
+    holder = _embedding_holder()
+    chunks = [
+        holder.embed(batch[start:start + MAX_BATCH_SIZE])
+        for start in range(0, len(batch), MAX_BATCH_SIZE)
+    ]
+    embeddings = np.concatenate(chunks, axis=0).astype("float32")
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def find_similar_plants(image_bytes: bytes, k: int = 3) -> list:
+    """
+    Returns the k reference photos most similar to the uploaded image, best first,
+    as dicts with "path", "label" and "score" (cosine similarity).
+    Returns an empty list if the index has not been built yet or was built with another model.
+    """
+    global _similar_index, _warned_index_hash
+    # imported here, because similar_plants.py itself imports this module
+    from similar_plants import SimilarPlantIndex, index_dir
+
+    with _similar_index_lock:
+        if _similar_index is None or _similar_index.is_stale():
+            _similar_index = SimilarPlantIndex.load(index_dir)
+        index = _similar_index
+    if index is None or index.size == 0:
+        return []
+    if index.manifest["model_hash"] != _embedding_model_file_hash():
+        # only warned once per outdated index, not on every upload
+        if _warned_index_hash != index.manifest["model_hash"]:
+            _warned_index_hash = index.manifest["model_hash"]
+            logger.warning("The similar plants index was built with another model; "
+                           "rebuild it with: python app/similar_plants.py")
+        return []
+    query = embed_images(np.expand_dims(preprocess_image(image_bytes), axis=0))[0]
+    return index.search(query, k)
+
+
+# — Step 9: define the functions to classify the images —
+# The model was trained on a dataset with five classes, in the order of _CLASS_NAMES.
+def _expected_model_hash():
+    # the hash of the model the next prediction will most likely come from: the server's (as far as it is known yet)
+    # while the server is used, the local files' otherwise; None means the cache cannot be looked up
+    if _inference_server_available():
+        with _inference_server_lock:
+            return _inference_server_model_hash
+    return _current_model_hash()
+
+
+def _predict_uncached(images: list, batch_window_ms: float) -> tuple:
+    """Returns (probabilities, hash of the model that made them, or None if it is not known)."""
+    # the local inference server (if any) gets the raw bytes, so this process does not even decode them
+    remote = _predict_remote(images)
+    if remote is not None:
+        return remote
+
+    arrays = [preprocess_image(image_bytes) for image_bytes in images]
+    if batch_window_ms > 0:
+        batcher = _get_micro_batcher(batch_window_ms)
+        futures = [batcher.submit(arr) for arr in arrays]
+        return np.stack([future.result() for future in futures]), _current_model_hash()
+
+    # stack all images into one batch, so the model runs a single forward pass
+    return predict_batch(np.stack(arrays)), _current_model_hash()
+
+
+def predict_plant_images(images: list, batch_window_ms: float = None) -> np.ndarray:
+    """
+    Accepts a list of raw image bytes, preprocesses them, runs inference in a single batch
+    and returns the (N, 5) array of class probabilities in the order of _CLASS_NAMES.
+    With batch_window_ms > 0 the images are merged with concurrent requests from other sessions
+    that arrive within that window (defaults to MICRO_BATCH_WINDOW_MS).
+    Images the current model has already seen are answered from the prediction cache.
+    """
+    if batch_window_ms is None:
+        batch_window_ms = MICRO_BATCH_WINDOW_MS
+    preds = np.zeros((len(images), len(_CLASS_NAMES)), dtype="float32")
+
+    # look every image up in the prediction cache first; only the misses are decoded and sent to the model
+    model_hash = _expected_model_hash()
+    image_hashes = [hashlib.sha256(image_bytes).hexdigest() for image_bytes in images]
+    missing = []
+    for i, image_hash in enumerate(image_hashes):
+        cached = _prediction_cache.get(model_hash, image_hash) if model_hash is not None else None
+        if cached is None:
+            missing.append(i)
+        else:
+            preds[i] = cached[1]
+    if not missing:
+        return preds
+
+    # the new predictions are stored under the hash of the model that really made them
+    new_preds, model_hash = _predict_uncached([images[i] for i in missing], batch_window_ms)
+    for i, row in zip(missing, new_preds):
+        preds[i] = row
+        if model_hash is not None:
+            _prediction_cache.put(model_hash, image_hashes[i], _CLASS_NAMES[int(np.argmax(row))], row)
+    return preds
+
+
+def classify_plant_images(images: list, batch_window_ms: float = None) -> list:
+    """
+    Accepts a list of raw image bytes and returns one of the five class labels per image.
+    See predict_plant_images() for the meaning of batch_window_ms.
+    """
+    # idx is the index of the class with the highest predicted probability for each image.
     # the returned class label is the corresponding class name from _CLASS_NAMES.
-    preds = _model.predict(batch)
-    idx = int(np.argmax(preds[0]))
-    return _CLASS_NAMES[idx]
\ No newline at end of file
+    preds = predict_plant_images(images, batch_window_ms=batch_window_ms)
+    return [_CLASS_NAMES[int(idx)] for idx in np.argmax(preds, axis=1)]
+
+
+def classify_plant_image(image_bytes: bytes, batch_window_ms: float = None) -> str:
+    """
+    Accepts the raw bytes of an uploaded plant image,
+    preprocesses it, runs inference, and returns
+    one of the five class labels.
+    """
+    return classify_plant_images([image_bytes], batch_window_ms=batch_window_ms)[0]
\ No newline at end of file
@@ -0,0 +1,156 @@
+# --- Similar Plants Index ---
+# This script builds (and this module searches) the index behind the "similar plants" lookup of the app.
+# Every reference photo in "plant_images" is run through the full classifier once, and its penultimate-layer
+# features (the Dense(128) output) are stored as one row of a float32 matrix in model/embeddings/embeddings-<build>.f32.
+# A manifest (manifest.json) records, for every row, the photo's path, class, size and modification time,
+# and the hash of the model the rows were computed with.
+# Rebuilding is incremental: unchanged photos keep their rows, only new or changed photos go through the model.
+# A new model invalidates the whole index, because its features are not comparable to the old ones.
+# The matrix is opened memory-mapped, so app processes share it through the operating system's page cache.
+
+# --- how to run ---
+# type in your terminal: python app/similar_plants.py
+# press enter (run it again after adding photos to plant_images)
+
+# --- Reference ---
+# https://numpy.org/doc/stable/reference/generated/numpy.memmap.html
+# https://numpy.org/doc/stable/reference/generated/numpy.argpartition.html
+
+import json
+import os
+import time
+
+import numpy as np
+
+from model_scripts import dataset_cache_module
+from plant_api import _file_sha256, embed_images, model_path, preprocess_image
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+index_dir = os.path.join(script_dir, os.pardir, "model", "embeddings")
+
+
+class SimilarPlantIndex:
+    """A read-only, memory-mapped matrix of L2-normalised embeddings plus the manifest describing its rows."""
+
+    def __init__(self, directory: str, manifest: dict, matrix: np.ndarray, manifest_mtime: int):
+        self.directory = directory
+        self.manifest = manifest
+        self.matrix = matrix
+        self._manifest_mtime = manifest_mtime
+
+    @classmethod
+    def load(cls, directory: str):
+        """Opens the index in directory, or returns None if it has not been built yet."""
+        manifest_path = os.path.join(directory, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        manifest_mtime = os.stat(manifest_path).st_mtime_ns
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        rows = len(manifest["entries"])
+        if rows == 0:
+            matrix = np.zeros((0, manifest["dim"]), dtype="float32")
+        else:
+            matrix = np.memmap(os.path.join(directory, manifest["matrix"]), dtype="float32", mode="r",
+                               shape=(rows, manifest["dim"]))
+        return cls(directory, manifest, matrix, manifest_mtime)
+
+    @property
+    def size(self) -> int:
+        return len(self.manifest["entries"])
+
+    def is_stale(self) -> bool:
+        """True if the index was rebuilt on disk since it was loaded."""
+        manifest_path = os.path.join(self.directory, "manifest.json")
+        return not os.path.exists(manifest_path) or os.stat(manifest_path).st_mtime_ns != self._manifest_mtime
+
+    def search(self, query: np.ndarray, k: int) -> list:
+        """Returns the k rows with the highest cosine similarity to the (L2-normalised) query, best first."""
+        # one matrix-vector product scores every reference photo at once
+        scores = self.matrix @ query
+        k = min(k, len(scores))
+        # argpartition finds the k best in linear time; only those k are then sorted
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        entries = self.manifest["entries"]
+        return [
+            {
+                "path": os.path.join(data_dir, entries[i]["path"]),
+                "label": entries[i]["label"],
+                "score": float(scores[i]),
+            }
+            for i in top
+        ]
+
+
+def build_index(root: str = data_dir, directory: str = index_dir, batch_size: int = 32) -> dict:
+    """
+    Brings the index in directory up to date with the photos in root and returns some statistics.
+    Only photos that are new or whose size or modification time changed are embedded again.
+    """
+    os.makedirs(directory, exist_ok=True)
+    model_hash = _file_sha256(model_path)
+
+    # rows of the previous index can be reused if it was built with the same model
+    old = SimilarPlantIndex.load(directory)
+    reusable = {}
+    if old is not None and old.manifest["model_hash"] == model_hash:
+        for row, entry in enumerate(old.manifest["entries"]):
+            reusable[(entry["path"], entry["size"], entry["mtime_ns"])] = row
+
+    # the photos are listed by the same scanner (and with the same file extensions) as the training dataset cache,
+    # so the two indexes always agree on which reference photos exist
+    entries, rows, to_embed = [], [], []
+    for rel_path, label in dataset_cache_module().scan_images(root):
+        stat = os.stat(os.path.join(root, rel_path))
+        entry = {"path": rel_path, "label": label, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        key = (rel_path, stat.st_size, stat.st_mtime_ns)
+        if key in reusable:
+            rows.append(old.matrix[reusable[key]])
+        else:
+            rows.append(None)
+            to_embed.append(len(entries))
+        entries.append(entry)
+
+    # the new and changed photos are embedded in batches
+    for start in range(0, len(to_embed), batch_size):
+        positions = to_embed[start:start + batch_size]
+        batch = []
+        for i in positions:
+            with open(os.path.join(root, entries[i]["path"]), "rb") as f:
+                batch.append(preprocess_image(f.read()))
+        for i, embedding in zip(positions, embed_images(np.stack(batch))):
+            rows[i] = embedding
+
+    dim = len(rows[0]) if rows else (old.manifest["dim"] if old is not None else 0)
+    # the matrix gets a new file name on every rebuild, so processes that still have the old one mapped keep working;
+    # the manifest is replaced last, which is what makes the new index visible
+    matrix_name = f"embeddings-{time.time_ns()}.f32"
+    if rows:
+        matrix = np.memmap(os.path.join(directory, matrix_name), dtype="float32", mode="w+", shape=(len(rows), dim))
+        matrix[:] = np.stack(rows)
+        matrix.flush()
+        del matrix
+    manifest = {"model_hash": model_hash, "dim": dim, "matrix": matrix_name, "entries": entries}
+    tmp_path = os.path.join(directory, "manifest.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(directory, "manifest.json"))
+
+    # matrices of older builds are no longer referenced
+    # (on Windows a matrix still mapped by a running app cannot be deleted; it is removed by a later rebuild)
+    for filename in os.listdir(directory):
+        if filename.startswith("embeddings-") and filename != matrix_name:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+    return {"images": len(entries), "embedded": len(to_embed), "reused": len(entries) - len(to_embed)}
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    stats = build_index()
+    print(f"Indexed {stats['images']} reference photos ({stats['embedded']} embedded, {stats['reused']} reused) "
+          f"in {time.perf_counter() - start:.1f} s -> {index_dir}")
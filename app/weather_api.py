@@ -3,12 +3,18 @@
 # It includes functions to geocode city names to latitude and longitude, and to retrieve weekly rainfall data for a given location.
 # We use the output of this feature in "app.py" to have access to the weather data for the selected city.
 # The data is used for watering recommendations.
+# The rainfall of every (location, week) is kept in a forecast cache shared by all sessions of the app (see Step 2),
+# so the Meteomatics API is only asked once per week and location instead of once per session and rerun.
 
 # --- Reference ---
 # https://api.meteomatics.com/doc/api/1.0/overview/
 # https://requests.readthedocs.io/en/latest/user/authentication/
 # https://docs.python-requests.org/en/latest/
 # https://datetime.readthedocs.io/en/stable/
+# https://docs.python.org/3/library/sqlite3.html
+# https://docs.python.org/3/library/concurrent.futures.html#future-objects
+# https://requests.readthedocs.io/en/latest/user/advanced/#session-objects
+# https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
 # The code in weather_api.py was developed with reference to public API documentation for Open-Meteo and Meteomatics. 
 # The structure for making HTTP requests and parsing JSON responses follows standard usage examples provided by these services.
 # This script uses or was assisted by OpenAI's language models (ChatGPT/GPT-4)
@@ -17,46 +23,148 @@
 # Import necessary libraries
 # Requests is used for making HTTP requests to the Meteomatics API.
 # Datetime is used for handling date and time operations.
+# sqlite3, os and time are used to keep the forecast cache on disk between restarts.
+# threading and concurrent.futures.Future are used to share one upstream request between sessions asking for the same week.
+# concurrent.futures.ThreadPoolExecutor runs the prefetching of neighbouring weeks in the background.
+# random is used to spread the retries of failed requests over time.
+# logging reports failures of background jobs, which have no page to show them on.
 import requests
 import datetime
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
 
 # Constants for Meteomatics API authentication
 # Set the username and password for the Meteomatics API
 METEO_USER = "universityofstgallen_yan_grace"   
 METEO_PASS = "2XPaF66p7o"
 
+# runtime caches (geocodes, rainfall) are kept in the "cache" folder next to "app" and "model", like the prediction cache
+cache_dir = os.environ.get("PLANTELLIGENCE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "cache"))
+weather_db_path = os.path.join(cache_dir, "weather.sqlite")
+
+# --- Step 1: one HTTP session with timeouts and retries ---
+# requests.get opens a new connection (TCP + TLS handshake) for every call and waits forever if the server does not answer.
+# All requests now go through one shared requests.Session, which keeps the connections to both APIs open (keep-alive)
+# and reuses them; the pool holds up to HTTP_POOL_SIZE connections per host for sessions that ask at the same time.
+# Every request has a timeout, and requests that fail for a temporary reason (no connection, timeout, HTTP 429 or 5xx)
+# are tried again up to HTTP_RETRIES times, after a random wait that doubles every time ("jitter", so sessions that
+# failed together do not all come back at the same moment).
+HTTP_TIMEOUT = (3.05, 15)  # seconds to connect, seconds to wait for the answer
+HTTP_RETRIES = 3
+HTTP_BACKOFF_SECONDS = 0.5
+HTTP_POOL_SIZE = 8
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE))
+
+
+def _http_get(url: str, **kwargs) -> requests.Response:
+    """GET through the shared session, retried with jittered exponential backoff on temporary failures."""
+    for attempt in range(HTTP_RETRIES + 1):
+        try:
+            response = _session.get(url, timeout=HTTP_TIMEOUT, **kwargs)
+            if response.status_code not in _RETRY_STATUS or attempt == HTTP_RETRIES:
+                return response
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == HTTP_RETRIES:
+                raise
+        time.sleep(random.uniform(0, HTTP_BACKOFF_SECONDS * 2 ** attempt))
+
+
 # We define a function that geocode city names to latitude and longitude
 # This function uses the Open-Meteo geocoding API to convert a city name into its corresponding latitude and longitude.
 # And returns a tuple of (latitude, longitude).
+# "app.py" calls it on every rerun (every click), so the answers are cached: in memory for this process and in the
+# "geocodes" table of the weather cache for the next start. The key is the normalized city name
+# ("  st.  GALLEN " and "St. Gallen" are the same city), so once a city is resolved, a rerun needs no network at all.
+# A city that is not found is only remembered for GEOCODE_NOT_FOUND_TTL_SECONDS: the answer may have been a temporary
+# glitch of the geocoding service, and the user would otherwise get the rainfall of FALLBACK_LOCATION for good.
+FALLBACK_LOCATION = (47.4245, 9.3767)  # St Gallen, used when the city is not found
+GEOCODE_NOT_FOUND_TTL_SECONDS = 60 * 60
+_geocodes = {}  # normalized city -> (location, time after which it is looked up again, or None for found cities)
+_geocode_lock = threading.Lock()
+
+
+def _normalize_city(city: str) -> str:
+    return " ".join(city.split()).casefold()
+
+
+def _geocode_db() -> sqlite3.Connection:
+    os.makedirs(cache_dir, exist_ok=True)
+    db = sqlite3.connect(weather_db_path)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS geocodes (city TEXT PRIMARY KEY, lat REAL, lon REAL, found INTEGER, checked_at REAL)"
+    )
+    return db
+
+
 def geocode(city: str) -> tuple[float, float]:
-    """Use Open-Meteo’s geocoding to turn a city name into (lat, lon)."""
-    resp = requests.get(
+    """Use Open-Meteo’s geocoding to turn a city name into (lat, lon), from the cache if it was resolved before."""
+    key = _normalize_city(city)
+    now = time.time()
+    with _geocode_lock:
+        if key in _geocodes:
+            location, retry_at = _geocodes[key]
+            if retry_at is None or now < retry_at:
+                return location
+        else:
+            db = _geocode_db()
+            row = db.execute("SELECT lat, lon, found, checked_at FROM geocodes WHERE city = ?", (key,)).fetchone()
+            db.close()
+            if row is not None and row[2]:
+                _geocodes[key] = ((row[0], row[1]), None)
+                return _geocodes[key][0]
+            if row is not None and now < row[3] + GEOCODE_NOT_FOUND_TTL_SECONDS:
+                _geocodes[key] = (FALLBACK_LOCATION, row[3] + GEOCODE_NOT_FOUND_TTL_SECONDS)
+                return FALLBACK_LOCATION
+
+    resp = _http_get(
         "https://geocoding-api.open-meteo.com/v1/search",
-        params={"name": city, "count": 1}
+        params={"name": city.strip(), "count": 1}
     )
     resp.raise_for_status()
     results = resp.json().get("results")
-    if not results:
-        # fallback to St Gallen if nothing found
-        return 47.4245, 9.3767
-    best = results[0]
-    return float(best["latitude"]), float(best["longitude"])
+    # a city that is not found is remembered as well (for a while), so typing an unknown name does not call the API
+    # on every rerun
+    found = bool(results)
+    location = (float(results[0]["latitude"]), float(results[0]["longitude"])) if found else FALLBACK_LOCATION
+    with _geocode_lock:
+        _geocodes[key] = (location, None if found else now + GEOCODE_NOT_FOUND_TTL_SECONDS)
+        db = _geocode_db()
+        db.execute("INSERT OR REPLACE INTO geocodes (city, lat, lon, found, checked_at) VALUES (?, ?, ?, ?, ?)",
+                   (key, *location, int(found), now))
+        db.commit()
+        db.close()
+    return location
 
 # Use the latitude and longitude to get the weekly rainfall data
-# We define a new function called "get_weekly_rainfall"
-# This function fetches daily rainfall data for a week starting from a given date.
-def get_weekly_rainfall(week_start_date: datetime.date, lat: float, lon: float) -> list:
-    """Fetch daily rainfall (in mm) for 7 days starting from week_start_date (inclusive) at the given location.
-    Returns a list of 7 rainfall values (mm) for each day."""
-    start_dt = datetime.datetime.combine(week_start_date, datetime.time.min).strftime("%Y-%m-%dT%H:%M:%SZ")
-    end_date = week_start_date + datetime.timedelta(days=7)  # 7 days later (exclusive end)
+# We define a new function called "_fetch_rainfall_points", which always asks the Meteomatics API
+# This function fetches daily rainfall data for a number of days (a week, or a whole season, see Step 5) starting from a given date.
+# Meteomatics accepts several locations in one request ("lat1,lon1+lat2,lon2+..."), so the rainfall of many
+# gardens can be fetched with a single call (see Step 4); one location is simply a list with one point.
+# The app calls get_weekly_rainfall (Step 2) instead, which answers from the forecast cache when it can.
+def _fetch_rainfall_points(start_date: datetime.date, points: list, days: int = 7) -> list:
+    """Fetch daily rainfall (in mm) for the given number of days starting from start_date (inclusive) at every
+    (lat, lon) in points. Returns one list of daily rainfall values (mm) per point, in the order of points."""
+    start_dt = datetime.datetime.combine(start_date, datetime.time.min).strftime("%Y-%m-%dT%H:%M:%SZ")
+    end_date = start_date + datetime.timedelta(days=days)  # exclusive end
     end_dt = datetime.datetime.combine(end_date, datetime.time.min).strftime("%Y-%m-%dT%H:%M:%SZ")
-    url = f"https://api.meteomatics.com/{start_dt}--{end_dt}:P1D/precip_24h:mm/{lat},{lon}/json"
+    locations = "+".join(f"{lat},{lon}" for lat, lon in points)
+    url = f"https://api.meteomatics.com/{start_dt}--{end_dt}:P1D/precip_24h:mm/{locations}/json"
 
     # Perform API request with basic authentication
     # The API requires authentication using a username and password.
     # The username and password are passed in the request using the auth parameter.
-    response = requests.get(url, auth=(METEO_USER, METEO_PASS))
+    response = _http_get(url, auth=(METEO_USER, METEO_PASS))
     if response.status_code != 200:
         raise Exception(f"Meteomatics API error: {response.status_code} {response.text}")
 
@@ -64,13 +172,411 @@ def get_weekly_rainfall(week_start_date: datetime.date, lat: float, lon: float)
     data = response.json()
 
     # The response structure is nested, so we need to navigate through the JSON to find the relevant data.
+    # There is one entry in "coordinates" per requested location, in the order of the request.
     try:
-        dates_data = data["data"][0]["coordinates"][0]["dates"]
-        rain_values = [entry.get("value", 0) for entry in dates_data]
-        # The API returns 8 values if we include the end date; take first 7 entries for the week
-        daily_rain = rain_values[:7]
+        coordinates = data["data"][0]["coordinates"]
+        if len(coordinates) != len(points):
+            raise IndexError(f"{len(coordinates)} locations in the answer, {len(points)} requested")
+        daily_rain = []
+        for coordinate in coordinates:
+            rain_values = [entry.get("value", 0) for entry in coordinate["dates"]]
+            # The API returns one value more than the number of days, because it includes the end date; drop it
+            if len(rain_values) < days:
+                raise IndexError(f"{len(rain_values)} days in the answer, {days} requested")
+            daily_rain.append(rain_values[:days])
     except (KeyError, IndexError) as e:
         raise Exception("Unexpected response format from Meteomatics API") from e
 
-    # return the list of daily rainfall values
-    return daily_rain
\ No newline at end of file
+    # return the lists of daily rainfall values
+    return daily_rain
+
+
+def _fetch_weekly_rainfall(week_start_date: datetime.date, lat: float, lon: float) -> list:
+    """Fetch daily rainfall (in mm) for 7 days starting from week_start_date (inclusive) at the given location."""
+    return _fetch_rainfall_points(week_start_date, [(lat, lon)])[0]
+
+
+# --- Step 2: forecast cache shared by all sessions ---
+# Every session used to call the Meteomatics API for every week it showed (the only cache was the per-session
+# st.session_state.cached_schedules, which is emptied whenever a plant is added), and the free account is limited
+# to 1000 requests. The rainfall is now cached per process in an SQLite file in the "cache" folder:
+# - the location is rounded to FORECAST_PRECISION decimals (0.01 degrees is about 1 km, much finer than
+#   the weather model), so nearby addresses of the same city share their entries
+# - every day is stored on its own row, so a week can be answered from days that were fetched as part of another
+#   week or of a longer range (Step 5); a request is a hit when all of its days are cached
+# - days that are in the past do not change anymore and are kept forever
+# - today and future days are forecasts that get better over time, so they expire after FORECAST_TTL_SECONDS
+# - when several sessions ask for the same missing days at the same time, only the first one calls the API and the
+#   others wait for its answer (request coalescing)
+# Hits, misses and API calls are counted for get_weather_cache_stats().
+FORECAST_PRECISION = 2
+FORECAST_TTL_SECONDS = float(os.environ.get("PLANT_WEATHER_TTL_SECONDS", str(3 * 3600)))
+
+
+class _ForecastCache:
+    """
+    Maps a key (rounded lat, rounded lon, first day, number of days) to the daily rainfall values of those days,
+    stored as one row per day. Past days never expire, today and future days expire after ttl_seconds.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+        self.coalesced = 0  # requests that waited for another session's API call instead of making their own
+        self.prefetched = 0  # API calls made in the background by prefetch_adjacent_weeks (Step 3)
+        self._lock = threading.Lock()
+        self._db = None
+        self._in_flight = {}  # key -> Future of the API call that is running for it
+
+    @staticmethod
+    def key(start_date: datetime.date, lat: float, lon: float, days: int = 7) -> tuple:
+        return round(lat, FORECAST_PRECISION), round(lon, FORECAST_PRECISION), start_date.isoformat(), days
+
+    @staticmethod
+    def _days(key: tuple) -> list:
+        start = datetime.date.fromisoformat(key[2])
+        return [(start + datetime.timedelta(days=i)).isoformat() for i in range(key[3])]
+
+    def get(self, key: tuple):
+        """Returns the cached rainfall of the key's days, or None if any of them is missing or expired."""
+        with self._lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key: tuple):
+        # must be called with self._lock held
+        days = self._days(key)
+        rows = self._connect().execute(
+            "SELECT day, rain, fetched_at, final FROM daily_rainfall WHERE lat = ? AND lon = ? AND day BETWEEN ? AND ?",
+            (key[0], key[1], days[0], days[-1]),
+        ).fetchall()
+        now = time.time()
+        fresh = {day: rain for day, rain, fetched_at, final in rows if final or now - fetched_at <= self.ttl_seconds}
+        if len(fresh) < len(days):
+            return None
+        return [fresh[day] for day in days]
+
+    def put(self, entries: dict) -> None:
+        """Stores the rainfall of several keys ({key: rainfall}) in one transaction, one row per day."""
+        # a day is final once it is over (Meteomatics works in UTC)
+        today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        now = time.time()
+        rows = [
+            (key[0], key[1], day, rain, now, int(day < today))
+            for key, rainfall in entries.items()
+            for day, rain in zip(self._days(key), rainfall)
+        ]
+        with self._lock:
+            self._connect().executemany(
+                "INSERT OR REPLACE INTO daily_rainfall (lat, lon, day, rain, fetched_at, final) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._connect().commit()
+
+    def get_or_fetch_many(self, keys: list, fetch_many, prefetch: bool = False) -> dict:
+        """
+        Returns {key: rainfall} for all keys. The keys that are neither cached nor being fetched by another caller
+        are fetched with a single fetch_many(missing_keys) call (which returns {key: rainfall});
+        the keys another caller is fetching right now are waited for.
+        Prefetches are not counted as hits or misses, so the hit rate stays the one the sessions see.
+        """
+        results, owned, waiting = {}, {}, {}
+        with self._lock:
+            # The cache is read under the same lock that registers the running API calls. Read before taking it,
+            # a key whose call finished in between (stored, and no longer in flight) would be fetched a second time.
+            for key in dict.fromkeys(keys):
+                rainfall = results[key] = self._get_locked(key)
+                if rainfall is not None:
+                    self.hits += not prefetch
+                    continue
+                self.misses += not prefetch
+                covering = self._covering(key)
+                if covering is not None:
+                    waiting[key] = covering
+                    self.coalesced += 1
+                else:
+                    owned[key] = self._in_flight[key] = Future()
+            if owned:
+                self.upstream_calls += 1
+                self.prefetched += prefetch
+        if owned:
+            try:
+                fetched = fetch_many(list(owned))
+                self.put(fetched)
+                for key, future in owned.items():
+                    future.set_result(fetched[key])
+            except BaseException as e:
+                for future in owned.values():
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    for key in owned:
+                        del self._in_flight[key]
+        for key, future in owned.items():
+            results[key] = future.result()
+        # an error of the API call is raised in every waiting session, like it would have been without coalescing
+        for key, (future, offset) in waiting.items():
+            results[key] = future.result()[offset:offset + key[3]]
+        return results
+
+    def _covering(self, key: tuple):
+        # must be called with self._lock held; returns (Future, offset of the key's first day) of an API call that
+        # is running for the key's days (the same key, or a longer range of the same location that contains them)
+        start = datetime.date.fromisoformat(key[2])
+        for other, future in self._in_flight.items():
+            offset = (start - datetime.date.fromisoformat(other[2])).days
+            if other[:2] == key[:2] and offset >= 0 and offset + key[3] <= other[3]:
+                return future, offset
+        return None
+
+    def get_or_fetch(self, key: tuple, fetch, prefetch: bool = False) -> list:
+        """Returns the cached rainfall of the key or calls fetch() once for all sessions that ask for it now."""
+        return self.get_or_fetch_many([key], lambda keys: {key: fetch()}, prefetch)[key]
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection shared by all session threads; every access happens under self._lock
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS daily_rainfall ("
+                "lat REAL, lon REAL, day TEXT, rain REAL, fetched_at REAL, final INTEGER, "
+                "PRIMARY KEY (lat, lon, day))"
+            )
+        return self._db
+
+
+_forecast_cache = _ForecastCache(weather_db_path, FORECAST_TTL_SECONDS)
+
+
+def get_weekly_rainfall(week_start_date: datetime.date, lat: float, lon: float) -> list:
+    """Returns the daily rainfall (in mm) of the 7 days starting at week_start_date at the given location,
+    from the forecast cache if possible and from the Meteomatics API otherwise."""
+    key = _ForecastCache.key(week_start_date, lat, lon)
+    # the API is asked for the rounded location, so the cached values belong to exactly the location of the key
+    return _forecast_cache.get_or_fetch(key, lambda: _fetch_weekly_rainfall(week_start_date, key[0], key[1]))
+
+
+def get_weather_cache_stats() -> dict:
+    """Returns the forecast cache hits and misses in this process, the hit rate and the number of Meteomatics API calls."""
+    cache = _forecast_cache
+    with cache._lock:
+        hits, misses, upstream_calls, coalesced = cache.hits, cache.misses, cache.upstream_calls, cache.coalesced
+        prefetched = cache.prefetched
+    with _prefetch_lock:
+        prefetch_pending, prefetch_cancelled = len(_prefetches), _prefetch_cancelled
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "upstream_calls": upstream_calls,
+        "coalesced": coalesced,
+        "prefetched": prefetched,
+        "prefetch_pending": prefetch_pending,
+        "prefetch_cancelled": prefetch_cancelled,
+    }
+
+
+# --- Step 3: prefetching the neighbouring weeks ---
+# A click on "← Previous Week" or "Next Week →" used to wait for the API before the page could render.
+# After every render, the app calls prefetch_adjacent_weeks, which loads the week before and the week after into the
+# forecast cache in a background thread, so the next click is normally answered from the cache.
+# The three weeks (before, shown, after) are loaded as one range of days with a single request (see Step 5).
+# - days that are cached already or being loaded already (by a prefetch or by a session) are not asked for twice:
+#   the prefetch goes through get_or_fetch, so a session that clicks while its prefetch runs waits for that same call
+# - every session passes its own token; ranges it no longer needs (it moved on, or changed the city) are cancelled
+#   if they have not started yet and no other session wants them
+# - Streamlit does not tell when a browser session ends, so a session that has not asked for PREFETCH_SESSION_IDLE_SECONDS
+#   is forgotten (and its queued ranges cancelled) on the next call, and at most PREFETCH_MAX_SESSIONS sessions are kept;
+#   the app also calls cancel_prefetches when its garden is empty and no forecast is shown
+# PLANT_WEATHER_PREFETCH=0 turns the prefetching off (it costs up to one API request per new week and city).
+PREFETCH_ENABLED = os.environ.get("PLANT_WEATHER_PREFETCH", "1") != "0"
+PREFETCH_WEEKS = 1  # how many weeks before and after the shown week are loaded
+PREFETCH_SESSION_IDLE_SECONDS = 30 * 60
+PREFETCH_MAX_SESSIONS = 256
+_prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather-prefetch")
+_prefetch_lock = threading.Lock()
+_prefetches = {}  # key -> (Future of the background job, set of session tokens that want it)
+_session_prefetches = OrderedDict()  # session token -> (time of its last call, set of keys it asked for), oldest first
+_prefetch_cancelled = 0  # queued prefetches that were cancelled before they started
+
+
+def _prefetch(key: tuple, start_date: datetime.date) -> None:
+    try:
+        _forecast_cache.get_or_fetch(key, lambda: _fetch_rainfall_points(start_date, [(key[0], key[1])], key[3])[0], prefetch=True)
+    except Exception as e:
+        # a failed prefetch only means the weeks are loaded when they are shown, as before
+        logger.warning("Prefetching the rainfall of %s failed: %s", key, e)
+    finally:
+        with _prefetch_lock:
+            _prefetches.pop(key, None)
+
+
+def _release(token: str, keys: set) -> None:
+    # must be called with _prefetch_lock held
+    global _prefetch_cancelled
+    for key in keys:
+        if key not in _prefetches:
+            continue
+        future, tokens = _prefetches[key]
+        tokens.discard(token)
+        # Future.cancel only succeeds while the job is still waiting in the pool; a running API call is let finish,
+        # its answer is cached like any other
+        if not tokens and future.cancel():
+            del _prefetches[key]
+            _prefetch_cancelled += 1
+
+
+def _forget_idle_sessions(now: float) -> None:
+    # must be called with _prefetch_lock held; _session_prefetches is ordered by last call, so the idle ones come first
+    while _session_prefetches:
+        token, (last_used, keys) = next(iter(_session_prefetches.items()))
+        if now - last_used < PREFETCH_SESSION_IDLE_SECONDS and len(_session_prefetches) <= PREFETCH_MAX_SESSIONS:
+            break
+        del _session_prefetches[token]
+        _release(token, keys)
+
+
+def prefetch_adjacent_weeks(week_start_date: datetime.date, lat: float, lon: float, token: str) -> int:
+    """
+    Loads the PREFETCH_WEEKS weeks before and after week_start_date into the forecast cache in the background
+    and cancels the queued prefetches this session (token) no longer needs. Returns the number of new jobs.
+    """
+    if not PREFETCH_ENABLED:
+        return 0
+    # one range from the first day of the earliest week to the last day of the latest week
+    start = week_start_date - datetime.timedelta(days=7 * PREFETCH_WEEKS)
+    wanted = {_ForecastCache.key(start, lat, lon, days=7 * (2 * PREFETCH_WEEKS + 1)): start}
+    started = 0
+    now = time.monotonic()
+    with _prefetch_lock:
+        _, asked = _session_prefetches.pop(token, (now, set()))
+        _release(token, asked - set(wanted))
+        _session_prefetches[token] = (now, set(wanted))
+        _forget_idle_sessions(now)
+        for key, first_day in wanted.items():
+            if key in _prefetches:
+                _prefetches[key][1].add(token)
+            elif _forecast_cache.get(key) is None:
+                _prefetches[key] = (_prefetch_pool.submit(_prefetch, key, first_day), {token})
+                started += 1
+    return started
+
+
+def cancel_prefetches(token: str) -> None:
+    """Cancels the queued prefetches of a session that no other session wants, and forgets the session."""
+    with _prefetch_lock:
+        _, asked = _session_prefetches.pop(token, (0.0, set()))
+        _release(token, asked)
+
+
+# --- Step 4: many locations at once ---
+# With many gardens in different cities, every garden used to cost one request per week.
+# get_weekly_rainfall_many asks for the rainfall of many locations in a few requests: the locations that are not cached
+# are split into chunks of BULK_CHUNK_SIZE points (one request each, the points go into the URL, so it cannot grow
+# without limit), and the chunks are fetched at the same time by at most BULK_MAX_CONNECTIONS threads
+# (not more than the connection pool of the shared session, see Step 1).
+# refresh_known_locations uses it to bring the forecasts of every location the app has seen up to date,
+# e.g. once an hour from a scheduled job:  python app/weather_api.py
+BULK_CHUNK_SIZE = 50
+BULK_MAX_CONNECTIONS = 4
+
+
+def get_rainfall_many(start_date: datetime.date, locations: list, days: int = 7,
+                      chunk_size: int = BULK_CHUNK_SIZE, max_connections: int = BULK_MAX_CONNECTIONS) -> dict:
+    """
+    Returns {(lat, lon): daily rainfall values} of the days starting at start_date for every (lat, lon) in locations,
+    from the forecast cache if possible and with one Meteomatics request per chunk of chunk_size missing locations
+    otherwise. The locations of the result are the given ones; locations that round to the same key share one entry.
+    """
+    keys = {location: _ForecastCache.key(start_date, *location, days=days) for location in locations}
+    unique = list(dict.fromkeys(keys.values()))
+    chunks = [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+
+    def fetch_chunk(chunk_keys: list) -> dict:
+        rainfall = _fetch_rainfall_points(start_date, [(key[0], key[1]) for key in chunk_keys], days)
+        return dict(zip(chunk_keys, rainfall))
+
+    # the cached keys of every chunk are answered without a request, only the missing ones are fetched
+    def load_chunk(chunk: list) -> dict:
+        return _forecast_cache.get_or_fetch_many(chunk, fetch_chunk)
+
+    results = {}
+    if len(chunks) <= 1:
+        for chunk in chunks:
+            results.update(load_chunk(chunk))
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_connections, HTTP_POOL_SIZE, len(chunks))) as pool:
+            for chunk_result in pool.map(load_chunk, chunks):
+                results.update(chunk_result)
+    return {location: results[key] for location, key in keys.items()}
+
+
+def get_weekly_rainfall_many(week_start_date: datetime.date, locations: list, **kwargs) -> dict:
+    """Returns {(lat, lon): 7 daily rainfall values} of the week for every (lat, lon) in locations (see get_rainfall_many)."""
+    return get_rainfall_many(week_start_date, locations, days=7, **kwargs)
+
+
+def known_locations() -> list:
+    """Returns every (lat, lon) the app has resolved a city to or shown a forecast for, rounded like the cache keys."""
+    db = _geocode_db()  # creates the geocodes table if it does not exist yet
+    rows = db.execute("SELECT lat, lon FROM geocodes WHERE found = 1").fetchall()
+    db.close()
+    with _forecast_cache._lock:
+        rows += _forecast_cache._connect().execute("SELECT DISTINCT lat, lon FROM daily_rainfall").fetchall()
+    return list(dict.fromkeys((round(lat, FORECAST_PRECISION), round(lon, FORECAST_PRECISION)) for lat, lon in rows))
+
+
+def refresh_known_locations(weeks: int = 2) -> dict:
+    """
+    Loads the current week and the following weeks (weeks in total) of every known location into the forecast cache.
+    All weeks are fetched as one range per chunk of locations (Step 5), so the number of requests does not grow with weeks.
+    Only missing or expired entries are fetched, so running it more often than FORECAST_TTL_SECONDS costs nothing.
+    """
+    locations = known_locations()
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    monday = today - datetime.timedelta(days=today.weekday())
+    calls_before = _forecast_cache.upstream_calls
+    start = time.perf_counter()
+    get_rainfall_many(monday, locations, days=7 * weeks)
+    return {
+        "locations": len(locations),
+        "weeks": weeks,
+        "upstream_calls": _forecast_cache.upstream_calls - calls_before,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# --- Step 5: longer ranges in one request ---
+# Browsing several weeks used to cost one request per week. get_rainfall_range fetches any number of days (e.g. a whole
+# season) with one request at daily resolution; the days are stored on their own rows in the forecast cache (Step 2),
+# so every 7-day window inside the range is then answered by get_weekly_rainfall without another request, whatever
+# day it starts on. prefetch_adjacent_weeks (Step 3) loads the weeks around the shown one this way for the app.
+MAX_RANGE_DAYS = 120  # longer ranges are split into several requests, so a single answer stays small
+
+
+def get_rainfall_range(start_date: datetime.date, end_date: datetime.date, lat: float, lon: float) -> list:
+    """
+    Returns the daily rainfall (in mm) from start_date to end_date (both inclusive) at the given location,
+    from the forecast cache if possible and with one Meteomatics request per MAX_RANGE_DAYS days otherwise.
+    """
+    total = (end_date - start_date).days + 1
+    if total <= 0:
+        raise ValueError(f"end_date {end_date} is before start_date {start_date}")
+    rainfall = []
+    for offset in range(0, total, MAX_RANGE_DAYS):
+        part_start = start_date + datetime.timedelta(days=offset)
+        days = min(MAX_RANGE_DAYS, total - offset)
+        key = _ForecastCache.key(part_start, lat, lon, days=days)
+        rainfall += _forecast_cache.get_or_fetch(key, lambda: _fetch_rainfall_points(part_start, [(key[0], key[1])], days)[0])
+    return rainfall
+
+
+if __name__ == "__main__":
+    summary = refresh_known_locations()
+    print(f"Refreshed {summary['weeks']} weeks of {summary['locations']} locations with "
+          f"{summary['upstream_calls']} API calls in {summary['seconds']:.1f} s")
@@ -0,0 +1,123 @@
+# --- Architecture Comparison ---
+# This script compares the CNN variants of "model/architectures.py" (baseline, gap, separable, lean).
+# Every variant is trained with "model/predict.py --architecture ..." in its own process for the same number of epochs,
+# and the script then reports for each trained model:
+# - the number of parameters and the size of the .keras file
+# - how long loading the file takes (what every app process pays once)
+# - the CPU latency for a single image (one upload) and per image in a batch of 32 (bulk classification)
+# - the accuracy on the validation split
+# Already trained models can be compared without training them again with --models.
+
+# --- how to run ---
+# type in your terminal: python benchmarks/bench_architectures.py --epochs 5
+# press enter
+# or, for existing models: python benchmarks/bench_architectures.py --models model/plant_classifier.keras other.keras
+
+# --- Reference ---
+# https://www.tensorflow.org/api_docs/python/tf/keras/Model#count_params
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+model_dir = os.path.join(script_dir, os.pardir, "model")
+sys.path.insert(0, model_dir)
+
+from architectures import ARCHITECTURES  # noqa: E402
+from dataset_cache import load_arrays  # noqa: E402
+
+img_size = (224, 224)
+LOAD_REPEATS = 3
+SINGLE_REPEATS = 50
+BATCH_SIZE = 32
+BATCH_REPEATS = 5
+
+
+def train(architecture: str, epochs: int, folder: str) -> str:
+    """Trains one variant in a separate process and returns the path of the saved model."""
+    path = os.path.join(folder, f"{architecture}.keras")
+    command = [
+        sys.executable, os.path.join(model_dir, "predict.py"),
+        "--architecture", architecture, "--epochs", str(epochs), "--output", path,
+        "--metrics-json", os.path.join(folder, f"{architecture}.json"),
+    ]
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="2")
+    subprocess.run(command, check=True, env=env, stdout=subprocess.DEVNULL)
+    return path
+
+
+def median_ms(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(1000 * (time.perf_counter() - start))
+    return float(np.median(timings))
+
+
+def measure(path: str, images: np.ndarray, labels: np.ndarray) -> dict:
+    """Size, load time, latency and validation accuracy of one saved model."""
+    load_ms = median_ms(lambda: tf.keras.models.load_model(path, compile=False), LOAD_REPEATS)
+    model = tf.keras.models.load_model(path, compile=False)
+    # the same compiled forward pass as the app uses in plant_api.py
+    forward = tf.function(
+        lambda batch: model(batch, training=False),
+        input_signature=[tf.TensorSpec(shape=(None, *img_size, 3), dtype=tf.float32)],
+    )
+    single = images[:1]
+    batch = images[:BATCH_SIZE]
+    forward(single)  # the first call traces the function and is not timed
+    preds = np.concatenate([forward(images[i:i + BATCH_SIZE]).numpy() for i in range(0, len(images), BATCH_SIZE)])
+    return {
+        "params": model.count_params(),
+        "file_mb": os.path.getsize(path) / 1e6,
+        "load_ms": load_ms,
+        "single_ms": median_ms(lambda: forward(single).numpy(), SINGLE_REPEATS),
+        "batch_ms_per_image": median_ms(lambda: forward(batch).numpy(), BATCH_REPEATS) / len(batch),
+        "val_accuracy": float(np.mean(np.argmax(preds, axis=1) == labels)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare size, load time, latency and accuracy of the CNN variants.")
+    parser.add_argument("--epochs", type=int, default=5, help="epochs to train every variant")
+    parser.add_argument("--architectures", nargs="+", choices=ARCHITECTURES, default=list(ARCHITECTURES))
+    parser.add_argument("--models", nargs="+", help="compare these .keras files instead of training the variants")
+    parser.add_argument("--keep", help="folder to keep the trained models in (default: a temporary folder)")
+    args = parser.parse_args()
+
+    images, labels, _ = load_arrays("validation")
+    images = images.astype("float32")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.keep or tmp
+        os.makedirs(folder, exist_ok=True)
+        if args.models:
+            paths = {os.path.basename(path): path for path in args.models}
+        else:
+            paths = {}
+            for architecture in args.architectures:
+                print(f"Training {architecture} for {args.epochs} epochs ...", flush=True)
+                paths[architecture] = train(architecture, args.epochs, folder)
+
+        print(f"\n{'model':<28}{'params':>12}{'file MB':>9}{'load ms':>9}{'1 img ms':>10}{'ms/img@32':>11}{'val acc':>9}")
+        results = {}
+        for name, path in paths.items():
+            results[name] = result = measure(path, images, labels)
+            print(f"{name:<28}{result['params']:>12,}{result['file_mb']:>9.1f}{result['load_ms']:>9.0f}"
+                  f"{result['single_ms']:>10.1f}{result['batch_ms_per_image']:>11.1f}{result['val_accuracy']:>9.3f}")
+        if args.keep:
+            with open(os.path.join(folder, "comparison.json"), "w") as f:
+                json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
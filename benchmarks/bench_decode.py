@@ -0,0 +1,83 @@
+# --- Decode Benchmark ---
+# This script compares the original image preprocessing of plant_api.py (full-size decode, then resize)
+# with the reduced-resolution decode (JPEG draft mode, EXIF orientation, size limit) on the bundled "plant_images" dataset.
+# For every variant it reports the total decode time, the time per image and the peak memory (RSS) of the process.
+# Each variant runs in its own fresh Python process, so the peak memory of one variant does not hide the other.
+
+# --- how to run ---
+# type in your terminal: python benchmarks/bench_decode.py
+# press enter
+
+# --- Reference ---
+# https://docs.python.org/3/library/resource.html
+# https://docs.python.org/3/library/subprocess.html
+
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# turns the relative path of this file into absolute paths to find the app and the dataset
+script_dir = os.path.dirname(os.path.abspath(__file__))
+app_dir = os.path.join(script_dir, os.pardir, "app")
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+sys.path.insert(0, app_dir)
+
+
+def full_size_decode(image_bytes: bytes) -> np.ndarray:
+    # the preprocessing plant_api.py used before the reduced-resolution decode
+    img = Image.open(BytesIO(image_bytes)).convert("RGB").resize((224, 224))
+    return np.asarray(img, dtype="float32")
+
+
+def run_variant(variant: str) -> dict:
+    """Decodes every dataset image with one variant and returns its timings and peak memory."""
+    if variant == "full_size":
+        decode = full_size_decode
+    else:
+        from plant_api import preprocess_image as decode
+
+    paths = sorted(glob.glob(os.path.join(data_dir, "*", "*.jp*g")))
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, "rb") as f:
+            decode(f.read())
+    seconds = time.perf_counter() - start
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return {
+        "variant": variant,
+        "images": len(paths),
+        "total_s": round(seconds, 3),
+        "ms_per_image": round(1000 * seconds / max(len(paths), 1), 2),
+        "peak_rss_mb": round(peak_mb, 1),
+    }
+
+
+def main() -> None:
+    # the child processes are started with "--variant <name>" and print their result as one JSON line
+    if len(sys.argv) == 3 and sys.argv[1] == "--variant":
+        print(json.dumps(run_variant(sys.argv[2])))
+        return
+
+    print(f"{'variant':<14}{'images':>8}{'total (s)':>12}{'ms/image':>11}{'peak RSS (MB)':>16}")
+    for variant in ["full_size", "reduced"]:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--variant", variant],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{r['variant']:<14}{r['images']:>8}{r['total_s']:>12}{r['ms_per_image']:>11}{r['peak_rss_mb']:>16}")
+
+
+if __name__ == "__main__":
+    main()
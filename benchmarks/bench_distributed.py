@@ -0,0 +1,64 @@
+# --- Distributed Training Benchmark ---
+# This script measures how data-parallel training ("model/train_distributed.py") scales with the number of
+# local worker processes. It trains with 1, 2 and 4 workers for the same number of epochs and reports the seconds
+# per epoch, the training images per second and the speed-up over one worker.
+# Every worker keeps batch size 8, so with more workers every step sees more images (the global batch grows);
+# the CPU cores are divided evenly between the workers.
+# The trained models are written to a temporary folder, so the model in "model/" is not replaced.
+
+# --- how to run ---
+# type in your terminal: python benchmarks/bench_distributed.py --epochs 3
+# press enter
+
+# --- Reference ---
+# https://www.tensorflow.org/tutorials/distribute/multi_worker_with_keras
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+model_dir = os.path.join(script_dir, os.pardir, "model")
+
+
+def run_workers(workers: int, epochs: int, architecture: str, folder: str) -> dict:
+    """Trains once with the given number of workers and returns the metrics the chief wrote."""
+    metrics_path = os.path.join(folder, f"workers{workers}.json")
+    command = [
+        sys.executable, os.path.join(model_dir, "train_distributed.py"),
+        "--workers", str(workers),
+        "--epochs", str(epochs),
+        "--architecture", architecture,
+        "--output", os.path.join(folder, f"workers{workers}.keras"),
+        "--metrics-json", metrics_path,
+    ]
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="2")
+    subprocess.run(command, check=True, env=env, stdout=subprocess.DEVNULL)
+    with open(metrics_path) as f:
+        return json.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare seconds per epoch of data-parallel training with 1, 2 and 4 workers.")
+    parser.add_argument("--epochs", type=int, default=3, help="epochs per run; the first one (tracing) is not timed if there are more")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--architecture", default="baseline", help="CNN variant, see model/architectures.py")
+    args = parser.parse_args()
+
+    print(f"CPU cores: {os.cpu_count()}, epochs per run: {args.epochs}, architecture: {args.architecture}")
+    print(f"{'workers':>7}{'threads':>9}{'global bs':>11}{'s/epoch':>10}{'images/s':>10}{'speed-up':>10}{'val acc':>9}")
+    single = None
+    with tempfile.TemporaryDirectory() as folder:
+        for workers in args.workers:
+            metrics = run_workers(workers, args.epochs, args.architecture, folder)
+            single = single or metrics["images_per_second"]
+            print(f"{workers:>7}{metrics['threads_per_worker']:>9}{metrics['global_batch_size']:>11}"
+                  f"{metrics['seconds_per_epoch']:>10.1f}{metrics['images_per_second']:>10.1f}"
+                  f"{metrics['images_per_second'] / single:>9.2f}x{metrics['val_accuracy']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
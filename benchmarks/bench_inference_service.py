@@ -0,0 +1,113 @@
+# --- Inference Service Benchmark ---
+# This script measures the latency of the local inference server ("app/inference_server.py") under concurrent clients.
+# It starts the server in a separate process, then lets 1, 4 and 16 client threads send single-image requests at the same time,
+# and reports the p50 and p99 latency and the throughput for every level of concurrency.
+# As a baseline, the same load is run in-process without batching (every thread runs its own forward pass),
+# which is what every Streamlit session did before the server existed.
+
+# --- how to run ---
+# type in your terminal: python benchmarks/bench_inference_service.py
+# press enter
+
+# --- Reference ---
+# https://docs.python.org/3/library/concurrent.futures.html
+# https://numpy.org/doc/stable/reference/generated/numpy.percentile.html
+
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+# turns the relative path of this file into absolute paths to find the app and the dataset
+script_dir = os.path.dirname(os.path.abspath(__file__))
+app_dir = os.path.join(script_dir, os.pardir, "app")
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+sys.path.insert(0, app_dir)
+
+from plant_api import encode_images_request, predict_batch, preprocess_image  # noqa: E402
+
+
+def wait_for_server(url: str, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"inference server at {url} did not start within {timeout} s")
+
+
+def run_load(send_one, images: list, clients: int, requests_per_client: int) -> dict:
+    """Runs `clients` threads that each send `requests_per_client` single images and collects the latencies."""
+    def client(index: int) -> list:
+        latencies = []
+        for i in range(requests_per_client):
+            image_bytes = images[(index * requests_per_client + i) % len(images)]
+            start = time.perf_counter()
+            send_one(image_bytes)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = [lat for result in pool.map(client, range(clients)) for lat in result]
+    wall = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return {
+        "p50_ms": np.percentile(ms, 50),
+        "p99_ms": np.percentile(ms, 99),
+        "images_per_s": len(latencies) / wall,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the local inference server under concurrent clients.")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests-per-client", type=int, default=20)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(data_dir, "*", "*.jp*g")))[:64]
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+
+    url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([
+        sys.executable, os.path.join(app_dir, "inference_server.py"),
+        "--port", str(args.port), "--max-wait-ms", str(args.max_wait_ms),
+    ])
+    try:
+        wait_for_server(url)
+        session = requests.Session()
+
+        def send_to_server(image_bytes: bytes) -> None:
+            session.post(f"{url}/predict", json=encode_images_request([image_bytes]), timeout=60).raise_for_status()
+
+        def run_in_process(image_bytes: bytes) -> None:
+            predict_batch(np.expand_dims(preprocess_image(image_bytes), axis=0))
+
+        run_in_process(images[0])  # loads the model in this process before timing starts
+
+        print(f"{'mode':<12}{'clients':>8}{'p50 (ms)':>11}{'p99 (ms)':>11}{'images/s':>11}")
+        for mode, send_one in [("in-process", run_in_process), ("server", send_to_server)]:
+            for clients in args.clients:
+                r = run_load(send_one, images, clients, args.requests_per_client)
+                print(f"{mode:<12}{clients:>8}{r['p50_ms']:>11.1f}{r['p99_ms']:>11.1f}{r['images_per_s']:>11.1f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
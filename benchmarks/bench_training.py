@@ -0,0 +1,85 @@
+# --- Training Benchmark ---
+# This script compares the training modes of "model/predict.py" on this machine.
+# Every configuration is trained in its own process (the thread pools and the precision policy can only be set once
+# per process) for the same number of epochs, and the script reports the seconds per epoch, the training images
+# per second and the best validation accuracy of each run.
+# The configurations go from the original setup (batch size 8, float32) to a larger batch with a scaled and warmed-up
+# learning rate, then XLA, then bfloat16 mixed precision (only where the CPU supports bfloat16 natively).
+# The trained models are written to a temporary folder, so the model in "model/" is not replaced.
+
+# --- how to run ---
+# type in your terminal: python benchmarks/bench_training.py --epochs 3
+# press enter
+
+# --- Reference ---
+# https://www.tensorflow.org/guide/mixed_precision
+# https://www.tensorflow.org/xla
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+model_dir = os.path.join(script_dir, os.pardir, "model")
+sys.path.insert(0, model_dir)
+
+from training_modes import bf16_supported  # noqa: E402
+
+# name, options given to predict.py
+CONFIGURATIONS = [
+    ("baseline bs8 fp32", ["--batch-size", "8"]),
+    ("bs32 fp32", ["--batch-size", "32"]),
+    ("bs32 fp32 XLA", ["--batch-size", "32", "--jit-compile"]),
+    ("bs32 bf16", ["--batch-size", "32", "--mixed-precision", "bfloat16"]),
+    ("bs32 bf16 XLA", ["--batch-size", "32", "--jit-compile", "--mixed-precision", "bfloat16"]),
+]
+
+
+def run_configuration(options: list, epochs: int, threads: list, folder: str, name: str) -> dict:
+    """Trains once with the given options in a separate process and returns the metrics it wrote."""
+    metrics_path = os.path.join(folder, f"{name}.json")
+    command = [
+        sys.executable, os.path.join(model_dir, "predict.py"), *options,
+        "--epochs", str(epochs),
+        "--output", os.path.join(folder, f"{name}.keras"),
+        "--metrics-json", metrics_path,
+        *threads,
+    ]
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="2")
+    subprocess.run(command, check=True, env=env, stdout=subprocess.DEVNULL)
+    with open(metrics_path) as f:
+        return json.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare seconds per epoch and accuracy of the training modes.")
+    parser.add_argument("--epochs", type=int, default=3, help="epochs per run; the first one (tracing) is not timed if there are more")
+    parser.add_argument("--intra-op-threads", type=int, help="passed on to every run")
+    parser.add_argument("--inter-op-threads", type=int, help="passed on to every run")
+    args = parser.parse_args()
+
+    threads = []
+    if args.intra_op_threads:
+        threads += ["--intra-op-threads", str(args.intra_op_threads)]
+    if args.inter_op_threads:
+        threads += ["--inter-op-threads", str(args.inter_op_threads)]
+
+    configurations = CONFIGURATIONS
+    if not bf16_supported():
+        print("This CPU has no native bfloat16 support; the mixed precision run is skipped.")
+        configurations = [c for c in CONFIGURATIONS if "bfloat16" not in c[1]]
+
+    print(f"CPU cores: {os.cpu_count()}, epochs per run: {args.epochs}")
+    print(f"{'configuration':<20}{'s/epoch':>10}{'images/s':>10}{'val acc':>9}{'lr':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        for i, (name, options) in enumerate(configurations):
+            metrics = run_configuration(options, args.epochs, threads, folder, f"run{i}")
+            print(f"{name:<20}{metrics['seconds_per_epoch']:>10.1f}{metrics['images_per_second']:>10.1f}"
+                  f"{metrics['val_accuracy']:>9.3f}{metrics['learning_rate']:>9.5f}")
+
+
+if __name__ == "__main__":
+    main()
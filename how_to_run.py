@@ -3,6 +3,10 @@
 # --- WARNING ---
 # Our access to the weather API is based on a free trial account, it expires on May 23rd and requests are limited to 1000, if you run the app too many times or use the "Next Week" or "Previous Week" buttons too many times, you will run out of requests and receive an error message. 
 # If this happens before you were able to test the website enough for the grading, please contact us.
+# To save requests, the rainfall of every week and city is kept in the 'cache' folder: past weeks are never asked for again,
+# the current and future weeks after 3 hours (PLANT_WEATHER_TTL_SECONDS changes this).
+# With many gardens in different cities, the forecasts of all of them can be refreshed with a few requests (e.g. once an hour):
+# type in your terminal: python app/weather_api.py
 
 # --- how to run the app: ---
 
@@ -59,6 +63,79 @@
 #step 5
 # do steps 1 to 5 again from 'how to run the app' to try the app again with the model you just trained
 
+# --- how to train the model in several worker processes (optional) ---
+# Instead of step 4, the training can be split over several processes that each train on a part of the images
+# and exchange their gradients after every step. This pays off on machines with many CPU cores.
+# type in your terminal: python model/train_distributed.py --workers 2
+# press enter (the model is saved to plant_classifier.keras as in step 4)
+# to see how the epoch time changes with 1, 2 and 4 workers: python benchmarks/bench_distributed.py
+
+# --- how to see where the training time goes (optional) ---
+# With --profile, a few training steps are traced and summarized: time per step, how much of it is spent waiting
+# for the next batch of images, the time of every layer (forward and backward) and the memory used.
+# type in your terminal: python model/predict.py --profile profiles/run1
+# press enter (the summary is written to profiles/run1/profile_summary.json, the same works with model/train_model.py)
+# to compare two runs (e.g. one with --jit-compile): python model/profiling.py profiles/run1/profile_summary.json profiles/run2/profile_summary.json
+
+# --- how to quickly refit the model after adding a few photos (optional) ---
+# Instead of training everything again, only the last layers (the "head") are refitted on top of the existing conv layers.
+# The conv layers' output for every photo is stored in the 'cache' folder, so only the new photos have to go through them.
+# type in your terminal: python model/retrain_head.py
+# press enter (this saves plant_classifier_head.keras if it is not worse on the validation photos; use --output model/plant_classifier.keras to replace the model of the app)
+
+# --- how to train the fast companion model (optional) ---
+# The app can run a small 96x96 model first and only ask the full model when the small one is unsure (the "cascade").
+# It is off by default: train the small model, check what the cascade costs, then switch it on with a threshold.
+
+#step 1
+# type in your terminal: python model/predict.py --fast
+# press enter
+
+#step 2
+# check how much accuracy the cascade costs and how much time it saves:
+# type in your terminal: python model/evaluate_cascade.py
+# press enter (it prints the accuracy against the full model, the share of escalated images and the p50 latency per threshold)
+
+#step 3
+# start the app with a threshold below 1 that the evaluation justified, e.g.:
+# type in your terminal: PLANT_CASCADE_THRESHOLD=0.8 streamlit run app/app.py
+# press enter (without PLANT_CASCADE_THRESHOLD, or with 1, the cascade stays off)
+
+# --- how to build the "similar plants" index (optional) ---
+# After adding a plant, the app shows the most similar photos from plant_images next to the predicted type.
+# This needs an index of all reference photos, which is built once (and again after adding photos or retraining):
+# type in your terminal: python app/similar_plants.py
+# press enter
+
+# --- how to train a small "student" model from the trained model (optional) ---
+# A much smaller model learns to imitate the trained model (knowledge distillation); it is faster on a CPU.
+#step 1
+# type in your terminal: python model/distill.py
+# press enter (it prints accuracy, size and speed of both models at the end)
+#step 2
+# start the app with the student model:
+# type in your terminal: PLANT_MODEL_PATH=model/plant_classifier_student.keras streamlit run app/app.py
+# press enter
+
+# --- how to run the app with a smaller, faster TFLite model (optional) ---
+# The trained model can be converted to quantized TensorFlow Lite models, which are several times smaller and faster on a CPU.
+#step 1
+# type in your terminal: python model/export_tflite.py
+# press enter (it prints a table of accuracy, size and speed of every version and copies the best one to model/plant_classifier.tflite)
+#step 2
+# start the app with the TFLite backend:
+# type in your terminal: PLANT_BACKEND=tflite streamlit run app/app.py
+# press enter
+
+# --- how the app improves the classifier with your photos (optional) ---
+# After adding a plant, the app asks whether the predicted type is right; confirm it or pick the right type.
+# Confirmed photos are kept in the 'cache/staging' folder. After every 8 new ones, the classifier is fine-tuned on them
+# in the background and replaced while the app keeps running (only if it is not worse on the validation photos).
+# With the fast companion model, it is fine-tuned too, and the cascade of both models must not be worse either.
+# PLANT_FINETUNE_MIN_SAMPLES changes the number of photos (0 turns it off); the replaced models are kept in 'cache/staging'
+# (previous.keras and previous_fast.keras).
+# to fine-tune on the confirmed photos by hand: python app/finetune.py
+
 # --- how to download images ---
 # We have sent you the project with the images already downloaded, however, if you want to download the images and try the app again with the new images, please follow these steps
 # However, we recommend to use the images we provided you with, as the ones downloaded from the API are not always the best quality and would need to be filtered
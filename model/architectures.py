@@ -0,0 +1,51 @@
+# --- Model Architectures ---
+# The CNN variants that "predict.py" and "train_model.py" can train (option --architecture).
+# In the original model ("baseline"), a Flatten layer after the last Conv2D(256) turns its 26x26x256 output into
+# 173,056 numbers, and the Dense(128) layer after it needs one weight for each of them times 128: about 22 million
+# parameters, almost the whole model. That one layer decides the file size, the load time and the memory of every app process.
+# The variants replace the expensive parts:
+# - "gap": GlobalAveragePooling2D instead of Flatten, every feature map is averaged to one number, so Dense(128) only has 256x128 weights
+# - "separable": the 2nd and 3rd convolutions are depthwise-separable (a 3x3 filter per channel, then a 1x1 mix of the channels),
+#   which needs far fewer multiplications and weights than a full 3x3 convolution over all channels
+# - "lean": both of the above
+# All variants keep the same input (224x224 images in 0-255), the Dense(128) layer used by the similar plants index,
+# and the float32 softmax output, so the app works with any of them.
+
+# --- Reference ---
+# https://www.tensorflow.org/api_docs/python/tf/keras/layers/GlobalAveragePooling2D
+# https://www.tensorflow.org/api_docs/python/tf/keras/layers/SeparableConv2D
+# Lin et al. (2013), "Network In Network" (global average pooling)
+# Howard et al. (2017), "MobileNets" (depthwise-separable convolutions)
+
+from tensorflow.keras import layers, models
+
+ARCHITECTURES = ("baseline", "gap", "separable", "lean")
+
+
+def build_model(architecture: str, num_classes: int, augmentation: list,
+                conv_filters: tuple = (32, 64, 256), dropout: float = 0.5) -> models.Sequential:
+    """
+    Builds one of the ARCHITECTURES. augmentation is the list of layers put in front of the model
+    (empty if the augmentation runs in the input pipeline instead).
+    conv_filters and dropout default to the values of the original model; the hyperparameter sweep (sweep.py) varies them.
+    """
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"unknown architecture {architecture!r}, choose one of {ARCHITECTURES}")
+    separable = architecture in ("separable", "lean")
+    pooled = architecture in ("gap", "lean")
+    conv = layers.SeparableConv2D if separable else layers.Conv2D
+
+    return models.Sequential([
+        *augmentation,
+        layers.Rescaling(1./255, input_shape=(224, 224, 3)),
+        layers.Conv2D(conv_filters[0], 3, activation='relu'),  # the first convolution only sees 3 colour channels, separable would not save anything here
+        layers.MaxPooling2D(),
+        conv(conv_filters[1], 3, activation='relu'),
+        layers.MaxPooling2D(),
+        conv(conv_filters[2], 3, activation='relu'),
+        layers.MaxPooling2D(),
+        layers.GlobalAveragePooling2D() if pooled else layers.Flatten(),
+        layers.Dense(128, activation='relu'),
+        layers.Dropout(dropout),
+        layers.Dense(num_classes, activation='softmax', dtype='float32'),
+    ])
@@ -0,0 +1,239 @@
+# --- Preprocessed Dataset Cache ---
+# This module turns the JPEGs in "plant_images" into resized 224x224 uint8 arrays once, and stores them on disk
+# as NumPy shards (cache/dataset/shard-*.npy) together with a manifest (cache/dataset/manifest.json).
+# The training scripts read these shards instead of re-scanning the folders and re-decoding every JPEG on every run.
+# The manifest records the SHA-256 hash of every source file (taken from the image index, see image_index.py),
+# so a rebuild only decodes images that are new or changed;
+# unchanged images (even if they were renamed or moved to another folder) keep their place in the existing shards.
+# The train/validation split is decided per image from its content hash and the seed, so it is reproducible
+# and does not depend on the order in which the folders are listed (and duplicates always land in the same split).
+
+# --- how to run ---
+# the training scripts build/update the cache automatically; to do it by hand:
+# type in your terminal: python model/dataset_cache.py
+# press enter
+
+# --- Reference ---
+# https://numpy.org/doc/stable/reference/generated/numpy.load.html (mmap_mode)
+# https://www.tensorflow.org/api_docs/python/tf/data/Dataset
+# https://www.tensorflow.org/api_docs/python/tf/keras/utils/image_dataset_from_directory (same decode and resize)
+# https://pillow.readthedocs.io/en/stable/reference/ImageOps.html#PIL.ImageOps.exif_transpose
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image, ImageOps
+
+# Step 1: Define paths and parameters
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+cache_root = os.environ.get("PLANTELLIGENCE_CACHE_DIR", os.path.join(script_dir, os.pardir, "cache"))
+dataset_cache_dir = os.path.join(cache_root, "dataset")
+img_size = (224, 224)
+validation_split = 0.2
+seed = 123
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+# stored in the manifest; a cache written by an older version of _decode_images is decoded again from scratch
+# (version 2 applies the EXIF orientation)
+DECODE_VERSION = 2
+# when more than this share of the stored rows belongs to deleted images, all shards are rewritten
+COMPACTION_THRESHOLD = 0.5
+
+
+def split_of(sha256: str, split_seed: int = seed, split: float = validation_split) -> str:
+    """Assigns an image to "training" or "validation" from its content hash and the seed alone."""
+    bucket = int(hashlib.sha256(f"{split_seed}:{sha256}".encode("ascii")).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return "validation" if bucket < split else "training"
+
+
+def fold_of(sha256: str, folds: int, split_seed: int = seed) -> int:
+    """Assigns an image to one of `folds` folds for k-fold cross-validation, from its content hash like split_of."""
+    return int(hashlib.sha256(f"fold:{split_seed}:{sha256}".encode("ascii")).hexdigest()[:8], 16) % folds
+
+
+def scan_images(root: str = data_dir) -> list:
+    """Returns (relative path, class) for every image in root/<Class>/ (hidden files like .DS_Store are skipped)."""
+    images = []
+    for label in sorted(os.listdir(root)):
+        class_dir = os.path.join(root, label)
+        if not os.path.isdir(class_dir):
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            if not filename.startswith(".") and filename.lower().endswith(IMAGE_EXTENSIONS):
+                images.append((os.path.join(label, filename), label))
+    return images
+
+
+def _read_oriented(path: bytes) -> np.ndarray:
+    # photos taken in portrait mode are stored sideways with an EXIF orientation tag; plant_api.preprocess_image
+    # turns them upright before classifying, so the training images are turned the same way
+    with Image.open(path.decode("utf-8")) as img:
+        return np.asarray(ImageOps.exif_transpose(img).convert("RGB"))
+
+
+def _decode_images(paths: list, size: tuple) -> np.ndarray:
+    # decoded (with the EXIF orientation applied, like at serving time) and resized the same way
+    # image_dataset_from_directory does it (bilinear, no aspect ratio kept), in parallel with tf.data,
+    # then rounded to uint8 to store a quarter of the float32 size
+    def load(path):
+        img = tf.numpy_function(_read_oriented, [path], tf.uint8)
+        img.set_shape([None, None, 3])
+        img = tf.image.resize(img, size, method="bilinear")
+        return tf.cast(tf.clip_by_value(tf.round(img), 0, 255), tf.uint8)
+
+    ds = tf.data.Dataset.from_tensor_slices(paths).map(load, num_parallel_calls=tf.data.AUTOTUNE).batch(64)
+    return np.concatenate([batch.numpy() for batch in ds])
+
+
+def _read_manifest(directory: str):
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_dataset_cache(root: str = data_dir, directory: str = dataset_cache_dir, size: tuple = img_size) -> dict:
+    """
+    Brings the shards in directory up to date with the images in root and returns the manifest.
+    Files whose size and modification time did not change since the last build are not hashed again.
+    """
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    old = _read_manifest(directory)
+    if old is not None and (tuple(old["img_size"]) != tuple(size) or old.get("decode_version") != DECODE_VERSION):
+        old = None  # images of another size, or decoded differently, cannot be reused
+
+    # Step 2: the content hashes come from the image index (image_index.py), which hashes the files in parallel
+    # and skips files whose size and modification time did not change since the last scan
+    from image_index import update_index  # imported here, because image_index.py itself imports this module
+
+    stored_by_hash = {}
+    if old is not None:
+        for entry in old["entries"]:
+            stored_by_hash[entry["sha256"]] = (entry["shard"], entry["row"])
+    entries = [
+        {
+            "path": row["path"], "label": row["label"], "sha256": row["sha256"],
+            "size": row["size"], "mtime_ns": row["mtime_ns"], "split": split_of(row["sha256"]),
+        }
+        for row in update_index(root)
+    ]
+
+    # Step 3: decode only the images whose content is not stored in a shard yet, and append them as a new shard
+    shards = dict(old["shards"]) if old is not None else {}
+    new_hashes = []
+    for entry in entries:
+        if entry["sha256"] not in stored_by_hash and entry["sha256"] not in new_hashes:
+            new_hashes.append(entry["sha256"])
+    if new_hashes:
+        first_path = {}
+        for entry in entries:
+            first_path.setdefault(entry["sha256"], os.path.join(root, entry["path"]))
+        arrays = _decode_images([first_path[h] for h in new_hashes], size)
+        shard_name = f"shard-{time.time_ns()}.npy"
+        np.save(os.path.join(directory, shard_name), arrays)
+        shards[shard_name] = len(arrays)
+        for row, sha256 in enumerate(new_hashes):
+            stored_by_hash[sha256] = (shard_name, row)
+    for entry in entries:
+        entry["shard"], entry["row"] = stored_by_hash[entry["sha256"]]
+
+    # Step 4: compaction; rows of deleted images are only rewritten when they make up a large share of the shards
+    used = {(entry["shard"], entry["row"]) for entry in entries}
+    stored = sum(shards.values())
+    if stored and 1 - len(used) / stored > COMPACTION_THRESHOLD:
+        entries, shards = _compact(directory, entries, shards)
+    shards = {name: rows for name, rows in shards.items() if name in {entry["shard"] for entry in entries}}
+
+    manifest = {
+        "img_size": list(size),
+        "decode_version": DECODE_VERSION,
+        "class_names": sorted({entry["label"] for entry in entries}),
+        "seed": seed,
+        "validation_split": validation_split,
+        "shards": shards,
+        "entries": entries,
+    }
+    tmp_path = os.path.join(directory, "manifest.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(directory, "manifest.json"))
+
+    # shard files that no entry refers to anymore are removed
+    for filename in os.listdir(directory):
+        if filename.startswith("shard-") and filename not in shards:
+            os.remove(os.path.join(directory, filename))
+    print(f"Dataset cache: {len(entries)} images, {len(new_hashes)} newly decoded, "
+          f"{len(shards)} shards ({time.perf_counter() - start:.1f} s)")
+    return manifest
+
+
+def _compact(directory: str, entries: list, shards: dict):
+    # all images still in use are copied into a single new shard
+    hashes, rows = [], {}
+    for entry in entries:
+        if entry["sha256"] not in rows:
+            rows[entry["sha256"]] = len(hashes)
+            hashes.append((entry["shard"], entry["row"]))
+    opened = {name: np.load(os.path.join(directory, name), mmap_mode="r") for name in shards}
+    arrays = np.stack([opened[shard][row] for shard, row in hashes])
+    del opened
+    shard_name = f"shard-{time.time_ns()}.npy"
+    np.save(os.path.join(directory, shard_name), arrays)
+    for entry in entries:
+        entry["shard"], entry["row"] = shard_name, rows[entry["sha256"]]
+    return entries, {shard_name: len(arrays)}
+
+
+def load_manifest(directory: str = dataset_cache_dir) -> dict:
+    """Returns the manifest of the cache, building the cache first if it does not exist yet."""
+    manifest = _read_manifest(directory)
+    return manifest if manifest is not None else build_dataset_cache(directory=directory)
+
+
+def load_arrays(subset: str, directory: str = dataset_cache_dir, manifest: dict = None):
+    """
+    Returns (images, labels, paths) of one subset ("training", "validation" or "all"):
+    images as a (N, 224, 224, 3) uint8 array, labels as class indices in the order of manifest["class_names"].
+    The entries are sorted by content hash, so the order does not depend on the folder listing either.
+    """
+    manifest = manifest or load_manifest(directory)
+    class_index = {name: i for i, name in enumerate(manifest["class_names"])}
+    entries = sorted(
+        (entry for entry in manifest["entries"] if subset == "all" or entry["split"] == subset),
+        key=lambda entry: (entry["sha256"], entry["path"]),
+    )
+    # the shards are memory-mapped, so only the rows that are actually needed are read from disk
+    shards = {name: np.load(os.path.join(directory, name), mmap_mode="r") for name in manifest["shards"]}
+    size = tuple(manifest["img_size"])
+    images = np.empty((len(entries), *size, 3), dtype=np.uint8)
+    for i, entry in enumerate(entries):
+        images[i] = shards[entry["shard"]][entry["row"]]
+    labels = np.array([class_index[entry["label"]] for entry in entries], dtype=np.int32)
+    return images, labels, [entry["path"] for entry in entries]
+
+
+def make_dataset(subset: str, batch_size: int, shuffle: bool = None, directory: str = dataset_cache_dir,
+                 manifest: dict = None) -> tf.data.Dataset:
+    """
+    Returns a batched tf.data.Dataset of (float32 images in [0, 255], int labels) for one subset,
+    like image_dataset_from_directory did. The training subset is shuffled (with the seed) by default.
+    """
+    images, labels, _ = load_arrays(subset, directory, manifest)
+    ds = tf.data.Dataset.from_tensor_slices((images, labels))
+    shuffle = subset == "training" if shuffle is None else shuffle
+    if shuffle:
+        ds = ds.shuffle(len(images), seed=seed, reshuffle_each_iteration=True)
+    return ds.batch(batch_size).map(lambda x, y: (tf.cast(x, tf.float32), y), num_parallel_calls=tf.data.AUTOTUNE)
+
+
+if __name__ == "__main__":
+    manifest = build_dataset_cache()
+    splits = [entry["split"] for entry in manifest["entries"]]
+    print(f"Classes: {manifest['class_names']}")
+    print(f"Training images: {splits.count('training')}, validation images: {splits.count('validation')}")
@@ -0,0 +1,214 @@
+# --- Knowledge Distillation ---
+# This script trains a much smaller "student" model to imitate the trained model (the "teacher", plant_classifier.keras).
+# A small architecture trained on the labels alone loses accuracy, but the teacher's probabilities carry more information
+# than the labels: a photo can be "mostly a Tree, a bit like a Flower". The student learns from both:
+#   loss = alpha * (cross-entropy with the true labels) + (1 - alpha) * T^2 * (KL divergence to the teacher's softened probabilities)
+# where the temperature T > 1 softens both distributions so the small probabilities also matter.
+# The teacher only has to run once: every training image is augmented K times (plus the original), the teacher's
+# log-probabilities for all copies are computed, and images and teacher outputs are stored in cache/distill/.
+# The student then trains from that store without ever running the teacher again.
+# The student takes the same 224x224 input and returns the same 5 probabilities, so it is a drop-in replacement:
+#   PLANT_MODEL_PATH=model/plant_classifier_student.keras streamlit run app/app.py
+# At the end, accuracy, size and latency of teacher and student are printed side by side.
+
+# --- how to run ---
+# type in your terminal: python model/distill.py
+# press enter
+
+# --- Reference ---
+# Hinton, Vinyals & Dean (2015), "Distilling the Knowledge in a Neural Network"
+# https://keras.io/examples/vision/knowledge_distillation/
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+
+from architectures import ARCHITECTURES, build_model
+from dataset_cache import build_dataset_cache, cache_root, load_arrays
+from evaluate import evaluate_model, load_predictor
+
+# Step 1: Define paths and parameters
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+teacher_path = os.path.join(script_dir, "plant_classifier.keras")
+student_path = os.path.join(script_dir, "plant_classifier_student.keras")
+distill_root = os.path.join(cache_root, "distill")
+seed = 123
+
+
+def make_augmentation() -> tf.keras.Sequential:
+    # the same augmentation as the full model in predict.py
+    return tf.keras.Sequential([
+        layers.RandomFlip("horizontal_and_vertical", seed=seed),
+        layers.RandomRotation(0.3, seed=seed),
+        layers.RandomZoom(0.2, seed=seed),
+        layers.RandomTranslation(0.1, 0.1, seed=seed),
+        layers.RandomContrast(0.1, seed=seed),
+        layers.RandomBrightness(0.1, seed=seed),
+    ])
+
+
+def teacher_targets(teacher_file: str, manifest: dict, copies: int, batch_size: int = 32) -> dict:
+    """
+    Returns the stored distillation set {"images", "labels", "teacher_log_probs"} for the training split,
+    computing it first if this teacher, these images and this number of copies have not been seen before.
+    Copy 0 of every image is the original, copies 1..K are augmented.
+    """
+    key = hashlib.sha256()
+    with open(teacher_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            key.update(block)
+    key.update(json.dumps(sorted(e["sha256"] for e in manifest["entries"] if e["split"] == "training")).encode())
+    directory = os.path.join(distill_root, f"{key.hexdigest()[:16]}-k{copies}")
+    if os.path.exists(os.path.join(directory, "done")):
+        return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                for name in ("images", "labels", "teacher_log_probs")}
+
+    # the training split is only loaded when the teacher outputs have to be computed
+    start = time.perf_counter()
+    images, labels, _ = load_arrays("training", manifest=manifest)
+    os.makedirs(directory, exist_ok=True)
+    teacher = tf.keras.models.load_model(teacher_file, compile=False)
+    forward = tf.function(lambda batch: teacher(batch, training=False))
+    augmentation = make_augmentation()
+    total = len(images) * (copies + 1)
+    stored_images = np.lib.format.open_memmap(os.path.join(directory, "images.npy"), mode="w+",
+                                              dtype=np.uint8, shape=(total, *images.shape[1:]))
+    log_probs = np.empty((total, len(manifest["class_names"])), dtype=np.float32)
+    row = 0
+    for copy in range(copies + 1):
+        for i in range(0, len(images), batch_size):
+            batch = images[i:i + batch_size].astype("float32")
+            if copy > 0:
+                batch = augmentation(batch, training=True).numpy()
+            batch = np.clip(np.round(batch), 0, 255)
+            # log-probabilities are stored instead of probabilities, so any temperature can be applied later
+            probs = forward(batch).numpy()
+            stored_images[row:row + len(batch)] = batch.astype(np.uint8)
+            log_probs[row:row + len(batch)] = np.log(np.clip(probs, 1e-7, 1.0))
+            row += len(batch)
+    stored_images.flush()
+    del stored_images
+    np.save(os.path.join(directory, "labels.npy"), np.tile(labels, copies + 1))
+    np.save(os.path.join(directory, "teacher_log_probs.npy"), log_probs)
+    open(os.path.join(directory, "done"), "w").close()  # written last, so an interrupted run is computed again
+    print(f"Teacher outputs for {total} images ({copies} augmented copies) computed in {time.perf_counter() - start:.1f} s")
+    return teacher_targets(teacher_file, manifest, copies, batch_size)
+
+
+def soften(log_probs: np.ndarray, temperature: float) -> np.ndarray:
+    """Softmax of log-probabilities divided by the temperature."""
+    scaled = log_probs / temperature
+    scaled = scaled - scaled.max(axis=1, keepdims=True)
+    exp = np.exp(scaled)
+    return (exp / exp.sum(axis=1, keepdims=True)).astype("float32")
+
+
+def distillation_loss(num_classes: int, temperature: float, alpha: float):
+    """
+    Keras loss for targets that are [one-hot true label, softened teacher probabilities] side by side.
+    The student keeps its softmax output (so it stays a drop-in model); its log-probabilities serve as logits.
+    """
+    def loss(y_true, y_pred):
+        hard, soft = y_true[:, :num_classes], y_true[:, num_classes:]
+        log_p = tf.math.log(tf.clip_by_value(y_pred, 1e-7, 1.0))
+        hard_loss = -tf.reduce_sum(hard * log_p, axis=1)
+        log_student = tf.nn.log_softmax(log_p / temperature, axis=1)
+        soft_loss = tf.reduce_sum(soft * (tf.math.log(tf.clip_by_value(soft, 1e-7, 1.0)) - log_student), axis=1)
+        # T^2 keeps the size of the soft gradients comparable to the hard ones (Hinton et al.)
+        return alpha * hard_loss + (1 - alpha) * temperature ** 2 * soft_loss
+
+    return loss
+
+
+def hard_accuracy(num_classes: int):
+    def accuracy(y_true, y_pred):
+        return tf.cast(tf.equal(tf.argmax(y_true[:, :num_classes], axis=1), tf.argmax(y_pred, axis=1)), tf.float32)
+
+    return accuracy
+
+
+def single_image_ms(path: str, image: np.ndarray, repeats: int = 30) -> float:
+    predict = load_predictor(path, batch_size=1)
+    predict(image[np.newaxis])  # the first call traces the function and is not timed
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(image[np.newaxis])
+        timings.append(1000 * (time.perf_counter() - start))
+    return float(np.median(timings))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Distill the trained plant classifier into a small student model.")
+    parser.add_argument("--teacher", default=teacher_path)
+    parser.add_argument("--output", default=student_path)
+    parser.add_argument("--student", choices=[a for a in ARCHITECTURES if a != "baseline"], default="lean",
+                        help="architecture of the student (see architectures.py)")
+    parser.add_argument("--copies", type=int, default=4, help="augmented copies of every training image")
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--alpha", type=float, default=0.3, help="weight of the true labels; the rest goes to the teacher")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    # Step 2: the teacher's outputs on the augmented training images (computed once and stored)
+    manifest = build_dataset_cache(data_dir)
+    class_names = manifest["class_names"]
+    num_classes = len(class_names)
+    targets = teacher_targets(args.teacher, manifest, args.copies)
+    train_y = np.concatenate([np.eye(num_classes, dtype="float32")[targets["labels"]],
+                              soften(np.asarray(targets["teacher_log_probs"]), args.temperature)], axis=1)
+
+    # the validation images get the teacher's outputs too, so the validation loss is the same combined loss
+    val_images, val_labels, _ = load_arrays("validation", manifest=manifest)
+    val_images = val_images.astype("float32")
+    teacher_predict = load_predictor(args.teacher)
+    val_y = np.concatenate([np.eye(num_classes, dtype="float32")[val_labels],
+                            soften(np.log(np.clip(teacher_predict(val_images), 1e-7, 1.0)), args.temperature)], axis=1)
+
+    # Step 3: train the student on the stored images (they are already augmented, so the student has no augmentation layers)
+    train_ds = (
+        tf.data.Dataset.from_tensor_slices((np.asarray(targets["images"]), train_y))
+        .shuffle(len(train_y), seed=seed)
+        .batch(args.batch_size)
+        .map(lambda x, y: (tf.cast(x, tf.float32), y), num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+    student = build_model(args.student, num_classes, [])
+    student.compile(
+        optimizer="adam",
+        loss=distillation_loss(num_classes, args.temperature, args.alpha),
+        metrics=[hard_accuracy(num_classes)],
+    )
+    start = time.perf_counter()
+    student.fit(
+        train_ds,
+        validation_data=(val_images, val_y),
+        epochs=args.epochs,
+        callbacks=[tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=5, restore_best_weights=True)],
+        verbose=2,
+    )
+    print(f"Student trained in {time.perf_counter() - start:.1f} s")
+    # saved without the custom loss (compile=False is how plant_api loads it anyway)
+    student.compile()
+    student.save(args.output)
+
+    # Step 4: teacher and student side by side
+    print(f"\n{'model':<10}{'params':>12}{'file MB':>9}{'val acc':>9}{'macro F1':>10}{'1 img ms':>10}")
+    for name, path in (("teacher", args.teacher), ("student", args.output)):
+        metrics = evaluate_model(path, "validation", manifest)
+        params = tf.keras.models.load_model(path, compile=False).count_params()
+        print(f"{name:<10}{params:>12,}{os.path.getsize(path) / 1e6:>9.1f}{metrics['accuracy']:>9.3f}"
+              f"{metrics['macro_f1']:>10.3f}{single_image_ms(path, val_images[0]):>10.1f}")
+    print(f"Saved {args.output} (use it with PLANT_MODEL_PATH={args.output})")
+
+
+if __name__ == "__main__":
+    main()
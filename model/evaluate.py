@@ -0,0 +1,224 @@
+# --- Model Evaluation ---
+# This script evaluates a trained model on one split of the dataset cache (see dataset_cache.py), without opening any window,
+# so it also works in headless training jobs.
+# The whole split is classified in large batches (one compiled forward pass per batch, instead of model.predict per batch of 8),
+# and the results are written as JSON:
+# - accuracy, and precision, recall and F1 score for every class
+# - the confusion matrix (rows: true class, columns: predicted class)
+# - calibration: does a 90% confident prediction really turn out right 90% of the time?
+#   (expected and maximum calibration error over confidence bins, Brier score, mean confidence)
+# Any artifact can be evaluated: .keras models and the quantized .tflite models from export_tflite.py,
+# all against exactly the same cached images. Figures (confusion matrix, reliability diagram) are only saved when asked for.
+
+# --- how to run ---
+# type in your terminal: python model/evaluate.py model/plant_classifier.keras --output metrics.json
+# press enter
+# several artifacts at once, with figures: python model/evaluate.py model/plant_classifier.keras model/tflite/*.tflite --output-dir evaluation --figures
+
+# --- Reference ---
+# https://scikit-learn.org/stable/modules/model_evaluation.html#precision-recall-f-measure-metrics
+# Guo et al. (2017), "On Calibration of Modern Neural Networks" (expected calibration error, reliability diagrams)
+# https://matplotlib.org/stable/users/explain/figure/backends.html (the "Agg" backend draws into files only)
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from dataset_cache import build_dataset_cache, load_arrays
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+model_path = os.path.join(script_dir, "plant_classifier.keras")
+BATCH_SIZE = 64
+CALIBRATION_BINS = 10
+
+
+def load_predictor(path: str, batch_size: int = BATCH_SIZE):
+    """
+    Returns a function that maps a (N, 224, 224, 3) float32 array (0-255) to (N, classes) probabilities,
+    for a .keras or a .tflite file.
+    """
+    import tensorflow as tf
+
+    if path.endswith(".tflite"):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            Interpreter = tf.lite.Interpreter
+        interpreter = Interpreter(model_path=path, num_threads=os.cpu_count())
+
+        def predict(images: np.ndarray) -> np.ndarray:
+            preds = []
+            for start in range(0, len(images), batch_size):
+                batch = images[start:start + batch_size]
+                # the exported models have a batch size of 1; the input is resized to the batch instead of looping image by image
+                detail = interpreter.get_input_details()[0]
+                if tuple(detail["shape"]) != batch.shape:
+                    interpreter.resize_tensor_input(detail["index"], batch.shape)
+                    interpreter.allocate_tensors()
+                    detail = interpreter.get_input_details()[0]
+                if detail["dtype"] == np.uint8:
+                    batch = np.clip(np.round(batch), 0, 255)
+                interpreter.set_tensor(detail["index"], batch.astype(detail["dtype"]))
+                interpreter.invoke()
+                preds.append(interpreter.get_tensor(interpreter.get_output_details()[0]["index"]).copy())
+            return np.concatenate(preds)
+
+        return predict
+
+    model = tf.keras.models.load_model(path, compile=False)
+    forward = tf.function(
+        lambda batch: model(batch, training=False),
+        input_signature=[tf.TensorSpec(shape=(None, *model.input_shape[1:]), dtype=tf.float32)],
+    )
+
+    def predict(images: np.ndarray) -> np.ndarray:
+        return np.concatenate([forward(images[start:start + batch_size]).numpy() for start in range(0, len(images), batch_size)])
+
+    return predict
+
+
+def compute_metrics(probabilities: np.ndarray, labels: np.ndarray, class_names: list, bins: int = CALIBRATION_BINS) -> dict:
+    """Accuracy, per-class precision/recall/F1, confusion matrix and calibration statistics of a set of predictions."""
+    predicted = np.argmax(probabilities, axis=1)
+    confidence = probabilities.max(axis=1)
+    correct = predicted == labels
+    num_classes = len(class_names)
+
+    # the confusion matrix is counted in one step: every (true, predicted) pair becomes one index into a flat array
+    confusion = np.bincount(labels * num_classes + predicted, minlength=num_classes ** 2).reshape(num_classes, num_classes)
+    true_positives = np.diag(confusion)
+    predicted_counts = confusion.sum(axis=0)
+    support = confusion.sum(axis=1)
+    precision = np.divide(true_positives, predicted_counts, out=np.zeros(num_classes), where=predicted_counts > 0)
+    recall = np.divide(true_positives, support, out=np.zeros(num_classes), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(num_classes), where=precision + recall > 0)
+
+    # calibration: the predictions are grouped by confidence, and in every group the accuracy is compared to the mean confidence
+    edges = np.linspace(0, 1, bins + 1)
+    bin_index = np.clip(np.digitize(confidence, edges[1:-1]), 0, bins - 1)
+    reliability = []
+    ece = mce = 0.0
+    for b in range(bins):
+        in_bin = bin_index == b
+        if not in_bin.any():
+            reliability.append({"low": float(edges[b]), "high": float(edges[b + 1]), "count": 0})
+            continue
+        gap = abs(correct[in_bin].mean() - confidence[in_bin].mean())
+        ece += in_bin.mean() * gap
+        mce = max(mce, gap)
+        reliability.append({
+            "low": float(edges[b]), "high": float(edges[b + 1]), "count": int(in_bin.sum()),
+            "accuracy": float(correct[in_bin].mean()), "confidence": float(confidence[in_bin].mean()),
+        })
+    one_hot = np.eye(num_classes)[labels]
+
+    return {
+        "images": int(len(labels)),
+        "accuracy": float(correct.mean()),
+        "per_class": {
+            name: {"precision": float(precision[i]), "recall": float(recall[i]), "f1": float(f1[i]), "support": int(support[i])}
+            for i, name in enumerate(class_names)
+        },
+        "macro_f1": float(f1.mean()),
+        "confusion_matrix": {"labels": list(class_names), "matrix": confusion.tolist()},
+        "calibration": {
+            "expected_calibration_error": float(ece),
+            "max_calibration_error": float(mce),
+            "brier_score": float(np.mean(np.sum((probabilities - one_hot) ** 2, axis=1))),
+            "mean_confidence": float(confidence.mean()),
+            "bins": reliability,
+        },
+    }
+
+
+def save_figures(metrics: dict, directory: str, prefix: str) -> list:
+    """Saves the confusion matrix and the reliability diagram as PNG files and returns their paths."""
+    import matplotlib
+
+    matplotlib.use("Agg")  # draws into files only, never opens a window
+    import matplotlib.pyplot as plt
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    class_names = metrics["confusion_matrix"]["labels"]
+
+    # the same heatmap as the seaborn one train_model.py used to show, drawn with matplotlib alone
+    matrix = np.array(metrics["confusion_matrix"]["matrix"])
+    fig, ax = plt.subplots(figsize=(8, 6))
+    image = ax.imshow(matrix, cmap="Blues")
+    fig.colorbar(image, ax=ax)
+    ax.set_xticks(range(len(class_names)), class_names)
+    ax.set_yticks(range(len(class_names)), class_names)
+    for i in range(len(class_names)):
+        for j in range(len(class_names)):
+            ax.text(j, i, matrix[i, j], ha="center", va="center",
+                    color="white" if matrix[i, j] > matrix.max() / 2 else "black")
+    ax.set_xlabel("Predicted Label")
+    ax.set_ylabel("True Label")
+    ax.set_title(f"Confusion Matrix (accuracy {metrics['accuracy']:.3f})")
+    paths.append(os.path.join(directory, f"{prefix}_confusion_matrix.png"))
+    fig.savefig(paths[-1], bbox_inches="tight")
+    plt.close(fig)
+
+    bins = [b for b in metrics["calibration"]["bins"] if b["count"]]
+    fig, ax = plt.subplots(figsize=(6, 6))
+    ax.plot([0, 1], [0, 1], linestyle="--", color="gray", label="Perfectly calibrated")
+    ax.bar([(b["low"] + b["high"]) / 2 for b in bins], [b["accuracy"] for b in bins],
+           width=1 / len(metrics["calibration"]["bins"]), edgecolor="black", alpha=0.7, label="Accuracy per bin")
+    ax.set_xlabel("Confidence")
+    ax.set_ylabel("Accuracy")
+    ax.set_title(f"Reliability Diagram (ECE {metrics['calibration']['expected_calibration_error']:.3f})")
+    ax.legend()
+    paths.append(os.path.join(directory, f"{prefix}_reliability.png"))
+    fig.savefig(paths[-1], bbox_inches="tight")
+    plt.close(fig)
+    return paths
+
+
+def evaluate_model(path: str, subset: str = "validation", manifest: dict = None, batch_size: int = BATCH_SIZE) -> dict:
+    """Evaluates one .keras or .tflite file on a split of the dataset cache and returns its metrics."""
+    manifest = manifest or build_dataset_cache(data_dir)
+    images, labels, _ = load_arrays(subset, manifest=manifest)
+    predict = load_predictor(path, batch_size)
+    start = time.perf_counter()
+    probabilities = predict(images.astype("float32"))
+    seconds = time.perf_counter() - start
+    metrics = {"model": path, "subset": subset, **compute_metrics(probabilities, labels, manifest["class_names"])}
+    metrics["images_per_second"] = len(images) / seconds
+    return metrics
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Evaluate model artifacts on a split of the dataset cache and write JSON metrics.")
+    parser.add_argument("models", nargs="*", default=[model_path], help=".keras or .tflite files (default: model/plant_classifier.keras)")
+    parser.add_argument("--subset", choices=["validation", "training", "all"], default="validation")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--output", help="JSON file for the metrics (only with a single model)")
+    parser.add_argument("--output-dir", help="folder for one <model>.json per model (and the figures)")
+    parser.add_argument("--figures", action="store_true", help="also save the confusion matrix and reliability diagram as PNG files")
+    args = parser.parse_args()
+    if args.output and len(args.models) > 1:
+        parser.error("--output takes a single model, use --output-dir for several")
+
+    manifest = build_dataset_cache(data_dir)
+    print(f"{'model':<45}{'accuracy':>9}{'macro F1':>9}{'ECE':>7}{'images/s':>10}")
+    for path in args.models:
+        metrics = evaluate_model(path, args.subset, manifest, args.batch_size)
+        name = os.path.splitext(os.path.basename(path))[0]
+        print(f"{name:<45}{metrics['accuracy']:>9.3f}{metrics['macro_f1']:>9.3f}"
+              f"{metrics['calibration']['expected_calibration_error']:>7.3f}{metrics['images_per_second']:>10.1f}")
+        output = args.output or (os.path.join(args.output_dir, f"{name}.json") if args.output_dir else None)
+        if args.figures:
+            metrics["figures"] = save_figures(metrics, args.output_dir or os.path.dirname(os.path.abspath(output or path)), name)
+        if output:
+            os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+            with open(output, "w") as f:
+                json.dump(metrics, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
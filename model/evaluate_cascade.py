@@ -0,0 +1,78 @@
+# --- Cascade Evaluation ---
+# This script measures what the confidence-gated cascade in "app/plant_api.py" costs in accuracy and saves in latency.
+# The small 96px companion model (plant_classifier_fast.keras, trained with "python model/predict.py --fast") runs first,
+# and the full model (plant_classifier.keras) only sees the images whose top probability is below the threshold.
+# For several thresholds the script reports, on the validation split, the accuracy of the cascade
+# against the full model alone, how many images are escalated, and the median (p50) latency of a single upload.
+
+# --- how to run ---
+# type in your terminal: python model/evaluate_cascade.py
+# press enter
+
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+# Step 1: Define paths and parameters
+# The cascade logic itself is imported from plant_api.py, so the evaluation runs exactly what the app runs.
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+model_dir = os.path.join(script_dir, os.pardir, "model")
+sys.path.insert(0, os.path.join(script_dir, os.pardir, "app"))
+from plant_api import cascade_predict, fast_model_path, model_path  # noqa: E402
+from dataset_cache import build_dataset_cache, load_arrays  # noqa: E402
+
+img_size = (224, 224)
+thresholds = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95]
+latency_images = 50  # images classified one by one to measure the latency of a single upload
+
+# Step 2: Load the validation split
+# Same split as the training scripts (from the dataset cache), so none of these images were used for training.
+images, labels, _ = load_arrays("validation", manifest=build_dataset_cache(data_dir))
+images = images.astype("float32")
+
+# Step 3: Load both models and trace their forward passes once
+full_model = tf.keras.models.load_model(model_path, compile=False)
+fast_model = tf.keras.models.load_model(fast_model_path, compile=False)
+signature = [tf.TensorSpec(shape=(None, *img_size, 3), dtype=tf.float32)]
+full_fn = tf.function(lambda batch: full_model(batch, training=False), input_signature=signature)
+fast_fn = tf.function(lambda batch: fast_model(batch, training=False), input_signature=signature)
+
+
+def run(fn, batch):
+    return fn(batch).numpy()
+
+
+def p50_latency_ms(predict_one) -> float:
+    # the first call is excluded, it may still include tracing; the median is not pulled up by a few slow calls
+    predict_one(images[:1])
+    seconds = []
+    for i in range(min(latency_images, len(images))):
+        start = time.perf_counter()
+        predict_one(images[i:i + 1])
+        seconds.append(time.perf_counter() - start)
+    return 1000 * float(np.median(seconds))
+
+
+# Step 4: Full model alone
+full_preds = run(full_fn, images)
+full_accuracy = np.mean(np.argmax(full_preds, axis=1) == labels)
+full_latency = p50_latency_ms(lambda batch: run(full_fn, batch))
+fast_preds = run(fast_fn, images)
+fast_accuracy = np.mean(np.argmax(fast_preds, axis=1) == labels)
+print(f"Validation images: {len(images)}")
+print(f"Full model:  accuracy {full_accuracy:.3f}, p50 {full_latency:.1f} ms/image")
+print(f"Fast model:  accuracy {fast_accuracy:.3f}, p50 {p50_latency_ms(lambda batch: run(fast_fn, batch)):.1f} ms/image")
+
+# Step 5: Cascade for every threshold
+print(f"{'threshold':>10}{'accuracy':>10}{'vs full':>9}{'escalated':>11}{'p50 ms':>10}")
+for threshold in thresholds:
+    preds, escalated = cascade_predict(lambda b: run(fast_fn, b), lambda b: run(full_fn, b), images, threshold)
+    accuracy = np.mean(np.argmax(preds, axis=1) == labels)
+    latency = p50_latency_ms(
+        lambda batch: cascade_predict(lambda b: run(fast_fn, b), lambda b: run(full_fn, b), batch, threshold)
+    )
+    print(f"{threshold:>10.2f}{accuracy:>10.3f}{accuracy - full_accuracy:>+9.3f}{escalated.mean():>10.1%}{latency:>10.1f}")
@@ -0,0 +1,217 @@
+# --- TFLite Export (Quantization & Pruning) ---
+# This script turns the trained Keras model (plant_classifier.keras) into smaller and faster TensorFlow Lite models
+# for the CPU-only machines the app runs on, and decides which one ships.
+# Three post-training quantized versions are written to model/tflite/:
+# - dynamic: the weights are stored as 8-bit integers, the activations stay float32 (no calibration needed)
+# - float16: the weights are stored as 16-bit floats, half the size with practically no loss in accuracy
+# - int8: weights and activations are 8-bit integers; the value ranges of the activations are calibrated
+#   on a representative set of training images from plant_images (read from the dataset cache, see dataset_cache.py)
+# With --prune, the smallest weights of every Conv2D and Dense layer are set to zero first (magnitude pruning),
+# optionally followed by a few epochs of fine-tuning that keeps them at zero. Zero weights compress well,
+# so the table below also shows the gzip size of every file.
+# Every artifact is then evaluated on the validation split: accuracy, agreement with the Keras model,
+# file size and single-image latency. The fastest artifact whose accuracy is within --max-accuracy-drop
+# of the Keras model is copied to model/plant_classifier.tflite, which the app uses with PLANT_BACKEND=tflite.
+
+# --- how to run ---
+# type in your terminal: python model/export_tflite.py
+# press enter
+# or with pruning: python model/export_tflite.py --prune 0.5 --finetune-epochs 2
+
+# --- Reference ---
+# https://www.tensorflow.org/lite/performance/post_training_quantization
+# https://www.tensorflow.org/lite/performance/post_training_integer_quant
+# https://www.tensorflow.org/model_optimization/guide/pruning (magnitude pruning)
+# Zhu & Gupta (2017), "To prune, or not to prune"
+
+import argparse
+import gzip
+import os
+import shutil
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from dataset_cache import build_dataset_cache, load_arrays, make_dataset
+
+# Step 1: Define paths and parameters
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+model_path = os.path.join(script_dir, "plant_classifier.keras")
+export_dir = os.path.join(script_dir, "tflite")
+shipped_path = os.path.join(script_dir, "plant_classifier.tflite")  # the file the app's TFLite backend loads
+REPRESENTATIVE_IMAGES = 100
+LATENCY_REPEATS = 30
+PRUNABLE_LAYERS = ("Conv2D", "SeparableConv2D", "Dense")
+
+
+def load_interpreter(path: str):
+    """Opens a TFLite model with the standalone LiteRT interpreter if it is installed, else with TensorFlow's."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        Interpreter = tf.lite.Interpreter
+    interpreter = Interpreter(model_path=path)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def prune(model: tf.keras.Model, sparsity: float) -> list:
+    """
+    Sets the given share of the smallest (by absolute value) kernel weights of every Conv2D and Dense layer to zero.
+    Returns (layer, weight index, mask) triples, so fine-tuning can keep the pruned weights at zero.
+    """
+    masks = []
+    for layer in model.layers:
+        if layer.__class__.__name__ not in PRUNABLE_LAYERS:
+            continue
+        weights = layer.get_weights()
+        # the kernels come first, the bias last; biases are tiny and are never pruned
+        for i, kernel in enumerate(weights[:-1]):
+            threshold = np.quantile(np.abs(kernel), sparsity)
+            mask = np.abs(kernel) > threshold
+            weights[i] = kernel * mask
+            masks.append((layer, i, mask))
+        layer.set_weights(weights)
+    return masks
+
+
+class KeepPruned(tf.keras.callbacks.Callback):
+    """Puts the pruned weights back to zero after every training step."""
+
+    def __init__(self, masks: list):
+        super().__init__()
+        # the masks are turned into tensors once, so every step is a single multiplication per kernel
+        self.masks = [(layer.weights[i], tf.constant(mask, dtype=layer.weights[i].dtype)) for layer, i, mask in masks]
+
+    def on_train_batch_end(self, batch, logs=None):
+        for variable, mask in self.masks:
+            variable.assign(variable * mask)
+
+
+def convert(model: tf.keras.Model, mode: str, representative: np.ndarray) -> bytes:
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == "int8":
+        # the converter runs these images through the model to measure the range of every activation
+        def representative_dataset():
+            for image in representative:
+                yield [image[np.newaxis].astype("float32")]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # the images are 0-255 pixel values anyway, so the input can be uint8 and needs no float conversion;
+        # the output stays float32 so the app receives probabilities as before
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.float32
+    return converter.convert()
+
+
+def tflite_predict(interpreter, images: np.ndarray) -> np.ndarray:
+    """Runs a TFLite model image by image (the exported models have a batch size of 1)."""
+    input_detail = interpreter.get_input_details()[0]
+    output_index = interpreter.get_output_details()[0]["index"]
+    preds = []
+    for image in images:
+        batch = image[np.newaxis]
+        if input_detail["dtype"] == np.uint8:
+            batch = np.clip(np.round(batch), 0, 255)
+        interpreter.set_tensor(input_detail["index"], batch.astype(input_detail["dtype"]))
+        interpreter.invoke()
+        preds.append(interpreter.get_tensor(output_index)[0].copy())
+    return np.array(preds)
+
+
+def file_sizes(path: str):
+    with open(path, "rb") as f:
+        content = f.read()
+    return len(content) / 1e6, len(gzip.compress(content, compresslevel=6)) / 1e6
+
+
+def single_image_ms(predict_one, image: np.ndarray) -> float:
+    predict_one(image)  # the first call is excluded, it may include tracing or allocation
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        start = time.perf_counter()
+        predict_one(image)
+        timings.append(1000 * (time.perf_counter() - start))
+    return float(np.median(timings))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the plant classifier to quantized TFLite models and pick the one to ship.")
+    parser.add_argument("--model", default=model_path)
+    parser.add_argument("--prune", type=float, default=0.0, help="share of the Conv2D/Dense weights set to zero, e.g. 0.5")
+    parser.add_argument("--finetune-epochs", type=int, default=0, help="epochs of fine-tuning after pruning")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01,
+                        help="largest validation accuracy loss (vs. the Keras model) an artifact may have to be shipped")
+    parser.add_argument("--no-ship", action="store_true", help="only write and evaluate the artifacts")
+    args = parser.parse_args()
+    os.makedirs(export_dir, exist_ok=True)
+
+    # Step 2: load the model and the data (training images for calibration and fine-tuning, validation images for the table)
+    model = tf.keras.models.load_model(args.model, compile=False)
+    manifest = build_dataset_cache(data_dir)
+    train_images, _, _ = load_arrays("training", manifest=manifest)
+    val_images, val_labels, _ = load_arrays("validation", manifest=manifest)
+    val_images = val_images.astype("float32")
+    rng = np.random.default_rng(123)
+    representative = train_images[rng.choice(len(train_images), min(REPRESENTATIVE_IMAGES, len(train_images)), replace=False)]
+
+    keras_preds = model.predict(val_images, batch_size=32, verbose=0)
+    keras_accuracy = float(np.mean(np.argmax(keras_preds, axis=1) == val_labels))
+    forward = tf.function(lambda batch: model(batch, training=False))
+    rows = [("keras", args.model, keras_accuracy, 1.0, *file_sizes(args.model),
+             single_image_ms(lambda image: forward(image[np.newaxis]).numpy(), val_images[0]))]
+
+    # Step 3: optional magnitude pruning
+    prefix = "plant_classifier"
+    if args.prune > 0:
+        masks = prune(model, args.prune)
+        if args.finetune_epochs > 0:
+            model.compile(optimizer=tf.keras.optimizers.Adam(1e-4), loss="sparse_categorical_crossentropy", metrics=["accuracy"])
+            model.fit(
+                make_dataset("training", 32, manifest=manifest),
+                validation_data=make_dataset("validation", 32, manifest=manifest),
+                epochs=args.finetune_epochs,
+                callbacks=[KeepPruned(masks)],
+                verbose=2,
+            )
+        prefix = f"plant_classifier_pruned{int(round(100 * args.prune))}"
+
+    # Step 4: convert and evaluate every quantization mode
+    for mode in ("dynamic", "float16", "int8"):
+        path = os.path.join(export_dir, f"{prefix}_{mode}.tflite")
+        start = time.perf_counter()
+        with open(path, "wb") as f:
+            f.write(convert(model, mode, representative))
+        print(f"Converted {mode} in {time.perf_counter() - start:.1f} s -> {path}")
+        interpreter = load_interpreter(path)
+        preds = tflite_predict(interpreter, val_images)
+        accuracy = float(np.mean(np.argmax(preds, axis=1) == val_labels))
+        agreement = float(np.mean(np.argmax(preds, axis=1) == np.argmax(keras_preds, axis=1)))
+        rows.append((mode, path, accuracy, agreement, *file_sizes(path),
+                     single_image_ms(lambda image: tflite_predict(interpreter, image[np.newaxis]), val_images[0])))
+
+    # Step 5: the table, and the fastest artifact that is accurate enough ships
+    print(f"\n{'artifact':<10}{'val acc':>9}{'agrees':>8}{'MB':>8}{'gzip MB':>9}{'ms/image':>10}")
+    for name, _, accuracy, agreement, size, gzipped, latency in rows:
+        print(f"{name:<10}{accuracy:>9.3f}{agreement:>8.1%}{size:>8.1f}{gzipped:>9.1f}{latency:>10.1f}")
+    candidates = [row for row in rows[1:] if row[2] >= keras_accuracy - args.max_accuracy_drop]
+    if not candidates:
+        print("No TFLite artifact is accurate enough; keep the Keras backend.")
+        return
+    best = min(candidates, key=lambda row: row[6])
+    if args.no_ship:
+        print(f"Best artifact: {best[0]} ({best[1]})")
+        return
+    shutil.copyfile(best[1], shipped_path + ".tmp")
+    os.replace(shipped_path + ".tmp", shipped_path)
+    print(f"Shipping {best[0]} -> {shipped_path} (start the app with PLANT_BACKEND=tflite to use it)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# --- Image Index & Duplicate Detection ---
+# This module keeps an index of every image in "plant_images": path, class, byte size, modification time,
+# content hash (SHA-256), perceptual hash (dHash), width and height. It is stored as one compact JSON file
+# (cache/image_index.json, one row per image, the column names only once; another --root gets its own file next to it).
+# - files are hashed in parallel by a pool of threads (hashing and JPEG decoding release Python's GIL)
+# - a rescan only hashes files whose size or modification time changed; all other rows are reused
+# - hidden files such as .DS_Store and non-image files are skipped
+# The index also finds duplicates:
+# - exact duplicates: the same bytes (same SHA-256) saved more than once
+# - near duplicates: the same photo resized, re-compressed or slightly edited (dHashes differ in only a few bits)
+# and flags the groups that sit in two classes (contradicting labels) or on both sides of the train/validation split
+# (the model would be validated on photos it has practically seen during training).
+# The dataset cache (dataset_cache.py) takes its content hashes from this index, so the training caches are rebuilt
+# incrementally from the same scan.
+
+# --- how to run ---
+# type in your terminal: python model/image_index.py --report duplicates.json
+# press enter
+
+# --- Reference ---
+# https://www.hackerfactor.com/blog/index.php?/archives/529-Kind-of-Like-That.html (dHash)
+# https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.draft
+# https://docs.python.org/3/library/concurrent.futures.html#threadpoolexecutor
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from dataset_cache import cache_root, scan_images, split_of
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+index_path = os.path.join(cache_root, "image_index.json")  # the index of plant_images
+COLUMNS = ["path", "label", "size", "mtime_ns", "sha256", "dhash", "width", "height"]
+NEAR_DUPLICATE_BITS = 6  # dHashes (64 bits) that differ in at most this many bits are considered the same photo
+DHASH_BANDS = 8  # the 64 bits are split into 8 bands of 8 bits for the candidate search (see find_near_duplicates)
+
+
+def index_path_for(root: str) -> str:
+    """The index file of a folder: cache/image_index.json for plant_images, a file named after the folder's path otherwise."""
+    root = os.path.abspath(root)
+    if root == os.path.abspath(data_dir):
+        return index_path
+    return os.path.join(cache_root, f"image_index-{hashlib.sha256(root.encode('utf-8')).hexdigest()[:12]}.json")
+
+
+def max_bits_argument(value: str) -> int:
+    """argparse type for --max-bits: the band search only finds pairs that differ in fewer bits than there are bands."""
+    bits = int(value)
+    if not 0 <= bits < DHASH_BANDS:
+        raise argparse.ArgumentTypeError(f"must be between 0 and {DHASH_BANDS - 1}, got {bits}")
+    return bits
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: shrink to 9x8 grey pixels and record whether each pixel is brighter than its right neighbour."""
+    image.draft("L", (64, 64))  # JPEGs are decoded at a reduced scale, the hash only needs 9x8 pixels
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hash_file(root: str, rel_path: str, label: str) -> list:
+    """Computes one row of the index (in the order of COLUMNS)."""
+    path = os.path.join(root, rel_path)
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    try:
+        with Image.open(path) as image:
+            width, height = image.size  # read from the header, before draft() shrinks the image
+            perceptual = f"{dhash(image):016x}"
+    except OSError:
+        width = height = perceptual = None  # not a readable image; it still gets a content hash
+    return [rel_path, label, stat.st_size, stat.st_mtime_ns, digest.hexdigest(), perceptual, width, height]
+
+
+def load_index(path: str = index_path) -> list:
+    """Returns the rows of the index as dicts, or an empty list if it has not been built yet."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        index = json.load(f)
+    return [dict(zip(index["columns"], row)) for row in index["rows"]]
+
+
+def update_index(root: str = data_dir, path: str = None, workers: int = None) -> list:
+    """
+    Brings the index of root (at path, by default index_path_for(root)) up to date and returns its rows as dicts.
+    Only files whose size or modification time changed since the last scan are hashed again.
+    """
+    start = time.perf_counter()
+    path = path or index_path_for(root)
+    known = {row["path"]: row for row in load_index(path)}
+    rows, to_hash = [], []
+    for rel_path, label in scan_images(root):
+        stat = os.stat(os.path.join(root, rel_path))
+        row = known.get(rel_path)
+        if row is not None and row["size"] == stat.st_size and row["mtime_ns"] == stat.st_mtime_ns and row["label"] == label:
+            rows.append(row)
+        else:
+            rows.append(None)
+            to_hash.append((len(rows) - 1, rel_path, label))
+
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 2)) as pool:
+            hashed = pool.map(lambda item: hash_file(root, item[1], item[2]), to_hash)
+            for (position, _, _), values in zip(to_hash, hashed):
+                rows[position] = dict(zip(COLUMNS, values))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"columns": COLUMNS, "rows": [[row[column] for column in COLUMNS] for row in rows]}, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    print(f"Image index: {len(rows)} images, {len(to_hash)} hashed ({time.perf_counter() - start:.1f} s)")
+    return rows
+
+
+def find_exact_duplicates(rows: list) -> list:
+    """Groups of rows with the same content hash."""
+    by_hash = {}
+    for row in rows:
+        by_hash.setdefault(row["sha256"], []).append(row)
+    return [group for group in by_hash.values() if len(group) > 1]
+
+
+def find_near_duplicates(rows: list, max_bits: int = NEAR_DUPLICATE_BITS) -> list:
+    """
+    Pairs of rows with different content whose dHashes differ in at most max_bits bits.
+    Two hashes within max_bits < DHASH_BANDS bits agree completely in at least one 8-bit band,
+    so only rows that share a band are compared, instead of every pair.
+    With max_bits >= DHASH_BANDS, pairs could differ in every band and be missed, so that is refused.
+    """
+    if not 0 <= max_bits < DHASH_BANDS:
+        raise ValueError(f"max_bits must be between 0 and {DHASH_BANDS - 1}, got {max_bits}")
+    rows = [row for row in rows if row["dhash"] is not None]
+    hashes = np.array([int(row["dhash"], 16) for row in rows], dtype=np.uint64)
+    candidates = set()
+    for band in range(DHASH_BANDS):
+        buckets = {}
+        for i, value in enumerate((hashes >> np.uint64(8 * band)) & np.uint64(0xFF)):
+            buckets.setdefault(int(value), []).append(i)
+        for members in buckets.values():
+            for a in range(len(members)):
+                for b in range(a + 1, len(members)):
+                    candidates.add((members[a], members[b]))
+    pairs = []
+    for i, j in sorted(candidates):
+        if rows[i]["sha256"] == rows[j]["sha256"]:
+            continue  # exact duplicates are reported separately
+        distance = bin(int(hashes[i] ^ hashes[j])).count("1")
+        if distance <= max_bits:
+            pairs.append({"a": rows[i], "b": rows[j], "distance": distance})
+    return pairs
+
+
+def duplicate_report(rows: list, max_bits: int = NEAR_DUPLICATE_BITS) -> dict:
+    """Exact and near duplicates, each flagged when it spans two classes or both sides of the train/validation split."""
+    exact = []
+    for group in find_exact_duplicates(rows):
+        exact.append({
+            "sha256": group[0]["sha256"],
+            "paths": [row["path"] for row in group],
+            "cross_class": len({row["label"] for row in group}) > 1,
+            # the split is decided by the content hash, so exact copies always share it
+            "cross_split": False,
+        })
+    near = []
+    for pair in find_near_duplicates(rows, max_bits):
+        a, b = pair["a"], pair["b"]
+        near.append({
+            "paths": [a["path"], b["path"]],
+            "distance": pair["distance"],
+            "cross_class": a["label"] != b["label"],
+            "cross_split": split_of(a["sha256"]) != split_of(b["sha256"]),
+        })
+    return {
+        "images": len(rows),
+        "exact_duplicates": exact,
+        "near_duplicates": near,
+        "cross_class": sum(item["cross_class"] for item in exact + near),
+        "cross_split": sum(item["cross_split"] for item in near),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Update the image index of plant_images and report duplicates and leaks.")
+    parser.add_argument("--root", default=data_dir, help="folder of <Class>/<image> files (default: plant_images)")
+    parser.add_argument("--workers", type=int, help="hashing threads (default: twice the number of cores)")
+    parser.add_argument("--max-bits", type=max_bits_argument, default=NEAR_DUPLICATE_BITS,
+                        help=f"largest dHash distance of near duplicates, 0 to {DHASH_BANDS - 1} "
+                             f"(the search compares hashes that share one of the {DHASH_BANDS} bands, default {NEAR_DUPLICATE_BITS})")
+    parser.add_argument("--report", help="JSON file for the full duplicate report")
+    parser.add_argument("--fail-on-leaks", action="store_true", help="exit with an error if a duplicate crosses classes or splits")
+    args = parser.parse_args()
+
+    rows = update_index(args.root, workers=args.workers)
+    report = duplicate_report(rows, args.max_bits)
+    print(f"Exact duplicates: {len(report['exact_duplicates'])} groups, near duplicates: {len(report['near_duplicates'])} pairs")
+    for item in report["exact_duplicates"]:
+        if item["cross_class"]:
+            print(f"  same file in two classes: {', '.join(item['paths'])}")
+    for item in report["near_duplicates"]:
+        flags = [name for name in ("cross_class", "cross_split") if item[name]]
+        if flags:
+            print(f"  {' and '.join(flags)} (distance {item['distance']}): {', '.join(item['paths'])}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.fail_on_leaks and (report["cross_class"] or report["cross_split"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,19 @@
 
 
 #importing libraries
+import argparse #reads the options given in the terminal, e.g. --fast
 import os
 import tensorflow as tf #main Machine Learning framework we used for our model 
 from tensorflow.keras import layers, models
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
 import matplotlib.pyplot as plt
+from dataset_cache import build_dataset_cache, make_dataset #our own module that stores the decoded images on disk, so they are not decoded again on every run
+from architectures import ARCHITECTURES, build_model #the lighter variants of the CNN (global average pooling, separable convolutions)
+from training_modes import EpochTimer, WarmUp, configure_runtime, scaled_learning_rate, to_float32, write_metrics #our own helpers for the faster training mode (XLA, mixed precision, threads, larger batches)
+from profiling import ProfileCallback #our own profiler, which splits the step time into waiting for input and computing (only with --profile)
 #source: 
 # Official documentation: https://docs.python.org/3/library/os.html
+# Official documentation: https://docs.python.org/3/library/argparse.html
 # Official documentation: https://www.tensorflow.org/api_docs
 # Official documentation: https://www.tensorflow.org/api_docs/python/tf/keras
 # Official documentation: https://www.tensorflow.org/api_docs/python/tf/keras/callbacks
@@ -25,45 +31,61 @@ script_dir = os.path.dirname(os.path.abspath(__file__)) #locates the file runnin
 model_dir = os.path.join(script_dir, os.pardir, "model") #from the absolute path we find the parent directory and go in model
 model_path = os.path.join(model_dir, "plant_classifier.keras") #from the absolute path of model we add plant_classifier.keras
 data_dir = os.path.join(script_dir, os.pardir, "plant_images") #from the absolute path of this file we find the parent directory and in it find plant_images
+fast_model_path = os.path.join(model_dir, "plant_classifier_fast.keras") #the small companion model, which the app runs first and only asks the full model when it is unsure
+
+#options of the script: "python model/predict.py" trains the full model, "python model/predict.py --fast" trains the small 96x96 companion model
+parser = argparse.ArgumentParser(description="Train the plant classifier.")
+parser.add_argument("--fast", action="store_true", help="train the small low-resolution companion model used by the cascade in plant_api.py")
+#options of the faster training mode, e.g. "python model/predict.py --batch-size 32 --jit-compile --mixed-precision auto"
+parser.add_argument("--epochs", type=int, default=1, help="number of passes over the training set")
+parser.add_argument("--batch-size", type=int, default=8, help="images per training step; the learning rate is scaled to match")
+parser.add_argument("--jit-compile", action="store_true", help="compile every training step with XLA")
+parser.add_argument("--mixed-precision", choices=["off", "auto", "bfloat16"], default="off",
+                    help="compute in bfloat16 while keeping float32 weights (auto: only if the CPU supports bfloat16 natively)")
+parser.add_argument("--intra-op-threads", type=int, help="threads used inside a single operation, e.g. a convolution (default: all cores)")
+parser.add_argument("--inter-op-threads", type=int, help="operations run side by side (default: chosen by TensorFlow)")
+parser.add_argument("--architecture", choices=ARCHITECTURES, default="baseline",
+                    help="CNN variant of the full model (see architectures.py): baseline, gap, separable or lean")
+parser.add_argument("--output", help="where to save the trained model (default: model/plant_classifier.keras)")
+parser.add_argument("--figures", help="folder to save the training progress plot in (default: no plot)")
+parser.add_argument("--metrics-json", help="file to write seconds per epoch, images per second and validation accuracy to")
+parser.add_argument("--profile", help="folder for a TensorBoard profiler trace and profile_summary.json (see profiling.py)")
+args = parser.parse_args()
+if args.fast:
+    model_path = fast_model_path #the companion model is saved next to the full model instead of replacing it
+if args.output:
+    model_path = args.output #e.g. the training benchmark saves its models somewhere temporary
+
+#the thread pools and the precision have to be set before TensorFlow creates any model or dataset
+policy = configure_runtime(args.intra_op_threads, args.inter_op_threads, args.mixed_precision)
+print(f"Precision policy: {policy}, XLA: {args.jit_compile}, batch size: {args.batch_size}")
 
 
 img_size = (224, 224) #we are specifyign the size of the images to 224x224 pixels, which all images will be resized to 
-batch_size = 8 #this is the number of images processed at once
+batch_size = args.batch_size #this is the number of images processed at once (8 by default)
 #source: 
 # This implementation follows the TensorFlow image classification tutorial:
 # https://www.tensorflow.org/tutorials/images/classification (Accessed: May 3, 2025)
 # Function concept and implementation assisted by ChatGPT (Accessed: May 3 2024)
 
-#Firstly, we have to create a Training Dataset, i.e. the set of images that will be used to train the dataset.
-train_ds = tf.keras.preprocessing.image_dataset_from_directory( #using TensorFlow Keras
-    data_dir, #specifiying the path to the images specified above
-    validation_split=0.2, #80% of the images will be used for training the model 
-    subset="training", #loading the "training" subset, as opposed to the validation/testing subset
-    seed=123, #ensuring that splits stay the same throughout each run
-    image_size=img_size, #image size as defined above 
-    batch_size=batch_size #batch size as defined above 
-)
-#source: 
-# This implementation follows the TensorFlow image classification tutorial:
-# https://www.tensorflow.org/tutorials/images/classification (Accessed: May 3, 2025)
+#Before training, the images are decoded and resized to 224x224 only once and stored as shards on disk (see dataset_cache.py).
+#On later runs only new or changed images in plant_images are decoded again, everything else is read straight from the shards.
+manifest = build_dataset_cache(data_dir) #scans plant_images, decodes new images and returns the manifest describing all images
 
+#Firstly, we have to create a Training Dataset, i.e. the set of images that will be used to train the dataset.
+#About 80% of the images are used for training. Which images are in which split is decided by the content of each image and the seed 123,
+#so the split stays the same throughout each run, no matter in which order the folders are listed.
+train_ds = make_dataset("training", batch_size, manifest=manifest) #batches of (images, labels) from the shards, with the batch size as defined above
 
 #Secondly, we need to create a Validation/Testing Dataset, i.e. the set of images that will be used to test how accurate the model is. 
-val_ds = tf.keras.preprocessing.image_dataset_from_directory(
-    data_dir, #specifiying the path to the images specified above
-    validation_split=0.2, #20% of the images will be used for validating/testing the model 
-    subset="validation", #loading the "validation" subset
-    seed=123, #ensuring that splits stay the same throughout each run
-    image_size=img_size, #image size as defined above 
-    batch_size=batch_size #batch size as defined above 
-)
+val_ds = make_dataset("validation", batch_size, manifest=manifest) #the other ~20% of the images, not shuffled
 #source: 
 # This implementation follows the TensorFlow image classification tutorial:
 # https://www.tensorflow.org/tutorials/images/classification (Accessed: May 3, 2025)
 
 
-#when we loaded the dataset, TensorFlow automatically assigned calss lables based on the subfolders names, these are displayed here: 
-class_names = train_ds.class_names #returns a list of the class labels, i.e. the plant types 
+#when we built the dataset cache, the class labels were assigned based on the subfolders names (in alphabetical order, as TensorFlow does it), these are displayed here: 
+class_names = manifest["class_names"] #returns a list of the class labels, i.e. the plant types 
 print(f"Detected classes: {class_names}")
 #source: 
 # This implementation follows the TensorFlow image classification tutorial:
@@ -91,30 +113,62 @@ data_augmentation = tf.keras.Sequential([ #a sequential pipeline is created, whe
 # https://www.tensorflow.org/tutorials/images/data_augmentation (Accessed: May 3, 2025)
 # Function concept and implementation assisted by ChatGPT (Accessed: May 3 2024)
 
+#XLA cannot compile the random augmentation layers, and Keras turns XLA off for the whole model if they are inside it.
+#So with --jit-compile the augmentation runs in the input pipeline instead (on the training images only), and the model itself holds no augmentation layers.
+#The augmentation layers do nothing at prediction time anyway, so both kinds of saved models behave the same in the app.
+if args.jit_compile:
+    train_ds = train_ds.map(lambda x, y: (data_augmentation(x, training=True), y), num_parallel_calls=AUTOTUNE)
+    augmentation = []
+else:
+    augmentation = [data_augmentation]
+
 #Here we are building the CNN itself, this means that we are defining the sequence through so-called layers, through which the image will be passed 
-model = models.Sequential([
-    data_augmentation,  #here we are using the data augmentation pipeline during training which are being applied to the images, as we defined before
-    layers.Rescaling(1./255, input_shape=(224, 224, 3)), #we are normalising the pixel values to 0,1, i.e. dividing it by 255. This helps the model have a more stable training. 
-    layers.Conv2D(32, 3, activation='relu'), #this applies 32 filters, i.e. feature detectors over the image, each with a size of 3x3, these then slide over the image to recognise "low-level" pattern, such as lines, colors and basic shapes. Also, it only keeps positive patterns detected. 
-    layers.MaxPooling2D(), #this keeps only the most important feature of each of the feature detectors, this is because it keeps the computations small, i.e. more managable
-    layers.Conv2D(64, 3, activation='relu'), #now 64 filters are being applied, i.e. the model is recognising more complex features in the pictures, such as curves and textures. 
-    layers.MaxPooling2D(), #again, only the most important features are kept
-    layers.Conv2D(256, 3, activation='relu'), #now 256 filters are being applied, to recognise even more complex features, i.e. entire plant shapes, and even thorns of a cactus, etc.
-    layers.MaxPooling2D(), #again
-    layers.Flatten(), #Now, the final output will be converted to a 1D flat vector, this is because the in the next steps 1D vector inputs are expected
-    layers.Dense(128, activation='relu'), #A so-called neural layer with 128 neurons, whereby each neuron looks at all the features that were kept from before and "tries" to extract meaningful information out of them for plant classficiation later. 
-    layers.Dropout(0.5), #increased from 0.1 to 0.3 to now 0.5. Here 50% of the neurons are turned of, so that the model doesn't rely on the strongest neurons, this is to prevent overfitting, making it more robust. 
-    layers.Dense(len(class_names), activation='softmax') #Here, each there is one neuron per class, i.e. 5, each associated with probability, the strongest probability indicates the confidence level of the model in that classification prediction. 
-])
+if args.fast:
+    #The companion model is much smaller: it looks at a 96x96 version of the image and only has a few small conv layers.
+    #It still takes 224x224 images as input (the Resizing layer shrinks them), so the app can give both models exactly the same images.
+    model = models.Sequential([
+        layers.Resizing(96, 96, input_shape=(224, 224, 3)), #shrinks the image to 96x96 pixels inside the model, which makes every following layer about 5 times cheaper
+        *augmentation, #same augmentation as the full model
+        layers.Rescaling(1./255), #normalising the pixel values to 0,1
+        layers.Conv2D(16, 3, activation='relu'), #16 small filters for lines, colours and basic shapes
+        layers.MaxPooling2D(),
+        layers.Conv2D(32, 3, activation='relu'), #32 filters for curves and textures
+        layers.MaxPooling2D(),
+        layers.Conv2D(64, 3, activation='relu'), #64 filters for larger shapes
+        layers.GlobalAveragePooling2D(), #averages every feature map to a single number, instead of flattening, so the model stays tiny
+        layers.Dropout(0.3), #turns off 30% of the features during training against overfitting
+        layers.Dense(len(class_names), activation='softmax', dtype='float32') #one neuron per class, as in the full model
+    ])
+elif args.architecture != "baseline":
+    #the lighter variants replace Flatten with global average pooling and/or use separable convolutions, see architectures.py
+    model = build_model(args.architecture, len(class_names), augmentation)
+else:
+    model = models.Sequential([
+        *augmentation,  #here we are using the data augmentation pipeline during training which are being applied to the images, as we defined before
+        layers.Rescaling(1./255, input_shape=(224, 224, 3)), #we are normalising the pixel values to 0,1, i.e. dividing it by 255. This helps the model have a more stable training. 
+        layers.Conv2D(32, 3, activation='relu'), #this applies 32 filters, i.e. feature detectors over the image, each with a size of 3x3, these then slide over the image to recognise "low-level" pattern, such as lines, colors and basic shapes. Also, it only keeps positive patterns detected. 
+        layers.MaxPooling2D(), #this keeps only the most important feature of each of the feature detectors, this is because it keeps the computations small, i.e. more managable
+        layers.Conv2D(64, 3, activation='relu'), #now 64 filters are being applied, i.e. the model is recognising more complex features in the pictures, such as curves and textures. 
+        layers.MaxPooling2D(), #again, only the most important features are kept
+        layers.Conv2D(256, 3, activation='relu'), #now 256 filters are being applied, to recognise even more complex features, i.e. entire plant shapes, and even thorns of a cactus, etc.
+        layers.MaxPooling2D(), #again
+        layers.Flatten(), #Now, the final output will be converted to a 1D flat vector, this is because the in the next steps 1D vector inputs are expected
+        layers.Dense(128, activation='relu'), #A so-called neural layer with 128 neurons, whereby each neuron looks at all the features that were kept from before and "tries" to extract meaningful information out of them for plant classficiation later. 
+        layers.Dropout(0.5), #increased from 0.1 to 0.3 to now 0.5. Here 50% of the neurons are turned of, so that the model doesn't rely on the strongest neurons, this is to prevent overfitting, making it more robust. 
+        layers.Dense(len(class_names), activation='softmax', dtype='float32') #Here, each there is one neuron per class, i.e. 5, each associated with probability, the strongest probability indicates the confidence level of the model in that classification prediction. 
+    ])
+#the output layer always computes in float32 (dtype='float32'), so with mixed precision the probabilities and the loss stay exact
 #source: 
 # This implementation follows the TensorFlow image classification tutorial:
 # https://www.tensorflow.org/tutorials/images/data_augmentation (Accessed: May 3, 2025)
 # Function concept and implementation assisted by ChatGPT (Accessed: May 3 2024)
 
+learning_rate = scaled_learning_rate(batch_size) #Adam's default 0.001 at batch size 8, larger for larger batches
 model.compile( #here we specifiy 3 components that are important for the training of the model 
-    optimizer='adam', #controls how the model updates its weights, through caculating weight updatse using averages, i.e. hwow much weight in terms of important is given to each feature that has been detected.
+    optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate), #controls how the model updates its weights, through caculating weight updatse using averages, i.e. hwow much weight in terms of important is given to each feature that has been detected.
     loss='sparse_categorical_crossentropy', #a formula that calculates how wrong the model's prediction are, which the model is trying to minimize
-    metrics=['accuracy'] #this specifies how a "success" is reported in the model, and we choose accuracy, 
+    metrics=['accuracy'], #this specifies how a "success" is reported in the model, and we choose accuracy, 
+    jit_compile=args.jit_compile #with XLA the whole training step is compiled into one program, which fuses many small operations
 )
 #source: 
 # This implementation follows the TensorFlow image classification tutorial:
@@ -127,6 +181,17 @@ callbacks = [
     ModelCheckpoint(filepath=model_path, save_best_only=True), #locally saving the trained model, filepath might have to be adjusted
     ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, min_lr=1e-6, verbose=1) #reduces the learning rate by half when the model stops improving. It is based on the validation loss.
 ]
+train_images = sum(1 for entry in manifest["entries"] if entry["split"] == "training")
+epoch_timer = EpochTimer(train_images) #measures the seconds per epoch and images per second
+callbacks.append(epoch_timer)
+if batch_size > 8:
+    #a larger learning rate right from the start can throw the fresh weights off, so it is raised step by step during the first epoch
+    callbacks.append(WarmUp(learning_rate, warmup_steps=max(1, train_images // batch_size)))
+if args.profile:
+    #records per-step input wait and compute, per-layer timings and peak memory (see profiling.py)
+    callbacks.append(ProfileCallback(args.profile, batch_size, settings={
+        "script": "predict.py", "architecture": "fast" if args.fast else args.architecture,
+        "jit_compile": args.jit_compile, "policy": policy}))
 #source: 
 # Function concept and implementation assisted by ChatGPT (Accessed: May 3 2024)
 
@@ -135,7 +200,7 @@ callbacks = [
 history = model.fit(
     train_ds, #this is the training set that the model is trained with, containing 1) images and 2) labels (true plant types)
     validation_data=val_ds, #this is the validation/test dataset
-    epochs=1, #looping through the training set 50 times 
+    epochs=args.epochs, #looping through the training set this many times (1 by default)
     callbacks=callbacks
 )
 #source: 
@@ -144,17 +209,45 @@ history = model.fit(
 
 #Evaluating the model
 #finally, we a using matplotlib to visualize the model's accuracy over each epoch for training and validation.
-plt.plot(history.history['accuracy'], label='Train Accuracy') #plots the training accuracy
-plt.plot(history.history['val_accuracy'], label='Validation Accuracy') #plots the validation accuracy
-plt.title("Training Progress") #Title of the graph 
-plt.xlabel("Epoch") #x axis labelling 
-plt.ylabel("Accuracy") #y axis labelling 
-plt.legend() #adds a legend with Train Accuracy and Validation Accuracy
-plt.grid(True) #adds a grid
-plt.show() #displays the plot 
+#The plot is saved to a file, and only when a folder is given with --figures, so training never waits for a window to be closed (e.g. on a server).
+#For the full evaluation (precision, recall, confusion matrix, calibration) run: python model/evaluate.py
+if args.figures:
+    os.makedirs(args.figures, exist_ok=True)
+    plt.plot(history.history['accuracy'], label='Train Accuracy') #plots the training accuracy
+    plt.plot(history.history['val_accuracy'], label='Validation Accuracy') #plots the validation accuracy
+    plt.title("Training Progress") #Title of the graph 
+    plt.xlabel("Epoch") #x axis labelling 
+    plt.ylabel("Accuracy") #y axis labelling 
+    plt.legend() #adds a legend with Train Accuracy and Validation Accuracy
+    plt.grid(True) #adds a grid
+    plt.savefig(os.path.join(args.figures, "training_progress.png")) #saves the plot instead of displaying it
 #source: 
 # This implementation follows the TensorFlow image classification tutorial:
 # https://www.tensorflow.org/tutorials/images/classification (Accessed: May 4, 2025)
 # Function concept and implementation assisted by ChatGPT (Accessed: May 4 2024)
 
+#With mixed precision the layers still compute in bfloat16, so a float32 copy is saved for the app (weights are float32 either way)
+if policy != "float32":
+    best = tf.keras.models.load_model(model_path, compile=False) #the best checkpoint that ModelCheckpoint saved
+    to_float32(best).save(model_path)
+
+if args.metrics_json:
+    epoch_seconds = epoch_timer.epoch_seconds
+    #the first epoch includes tracing (and XLA compilation), so the steady speed is measured on the later epochs when there are any
+    steady = epoch_seconds[1:] or epoch_seconds
+    write_metrics(args.metrics_json, {
+        "architecture": "fast" if args.fast else args.architecture,
+        "batch_size": batch_size,
+        "learning_rate": learning_rate,
+        "jit_compile": model.jit_compile, #what Keras actually used
+        "policy": policy,
+        "intra_op_threads": args.intra_op_threads,
+        "inter_op_threads": args.inter_op_threads,
+        "epochs": len(epoch_seconds),
+        "epoch_seconds": epoch_seconds,
+        "seconds_per_epoch": sum(steady) / len(steady),
+        "images_per_second": train_images * len(steady) / sum(steady),
+        "val_accuracy": max(history.history['val_accuracy']),
+    })
+
 print(model_path)
\ No newline at end of file
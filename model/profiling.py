@@ -0,0 +1,260 @@
+# --- Training Profiler ---
+# An opt-in profiling mode for the training scripts ("predict.py --profile DIR", "train_model.py --profile DIR").
+# When a run is slow, the question is where the time goes: waiting for the input pipeline (reading the cache,
+# shuffling, augmentation in tf.data), or computing (the convolutions, the backward pass, the optimizer).
+# The ProfileCallback:
+# - times every training step of the run, which gives the steps per second and images per second
+# - records a window of steps (by default steps 5 to 24 of the first epoch, after tracing is done) with the
+#   TensorFlow profiler; the trace is written to DIR and can be opened in TensorBoard's "Profile" tab
+# - reads that trace back and writes a compact summary to DIR/profile_summary.json:
+#   - per traced step: total time, time spent waiting for the next batch (input) and the rest (compute)
+#   - per layer of the model: time of its forward and backward operations, plus the optimizer's time
+#   - time of every stage of the tf.data pipeline (shuffle, map, batch, prefetch, ...) and of the operations in its map functions
+#   - with --jit-compile, the time of the fused XLA kernels instead of the layers
+#   - peak memory of the TensorFlow allocator and of the whole process
+# Summaries of several runs can be compared side by side:
+#   python model/profiling.py run_a/profile_summary.json run_b/profile_summary.json
+
+# --- how to run ---
+# type in your terminal: python model/predict.py --profile profiles/baseline
+# press enter, then: tensorboard --logdir profiles/baseline (needs "pip install tensorboard tensorboard-plugin-profile")
+
+# --- Reference ---
+# https://www.tensorflow.org/guide/profiler
+# https://www.tensorflow.org/guide/data_performance_analysis
+# https://www.tensorflow.org/api_docs/python/tf/profiler/experimental/start
+
+import argparse
+import glob
+import json
+import os
+import re
+import time
+
+import numpy as np
+import tensorflow as tf
+
+PROFILE_START_STEP = 5  # the first steps trace and compile the training function, they are not representative
+PROFILE_STEPS = 20
+
+
+def _peak_rss_mb():
+    # the resource module only exists on Linux and macOS
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 if os.uname().sysname == "Linux" else peak / 1024 ** 2
+
+
+def _read_trace(logdir: str):
+    """Returns the host plane of the newest trace in logdir, or None if the profiler did not write one."""
+    from tensorflow.tsl.profiler.protobuf import xplane_pb2
+
+    files = sorted(glob.glob(os.path.join(logdir, "plugins", "profile", "*", "*.xplane.pb")), key=os.path.getmtime)
+    if not files:
+        return None
+    space = xplane_pb2.XSpace()
+    with open(files[-1], "rb") as f:
+        space.ParseFromString(f.read())
+    return next((plane for plane in space.planes if plane.name == "/host:CPU"), None)
+
+
+def _base_name(name: str) -> str:
+    # "separable_conv2d_1_2" -> "separable_conv2d": the layer type without the numbers Keras adds to make names unique
+    return re.sub(r"(_\d+)+$", "", name)
+
+
+def _match_layers(scopes: dict, layers: list) -> dict:
+    """
+    Maps the name scopes of the trace to the layers. Keras makes scope names unique by adding "_1", "_2", ...
+    which do not follow the layer names (the scope of layer "conv2d" may be "conv2d_1"), so scopes and layers
+    of the same type are paired in order: the scope whose operations run first belongs to the first such layer.
+    scopes maps each scope to the start time of its first forward operation.
+    """
+    by_type = {}
+    for layer in layers:
+        by_type.setdefault(_base_name(layer.name), []).append(layer)
+    matched = {}
+    for scope in sorted(scopes, key=scopes.get):
+        candidates = by_type.get(_base_name(scope), [])
+        matched[scope] = candidates.pop(0) if candidates else None
+    return matched
+
+
+def summarize_trace(plane, model) -> dict:
+    """
+    Splits the events of a profiler trace into input waits (one per step, in order), per-layer forward/backward
+    operation times, input pipeline times, XLA kernel times and the allocator's peak memory (all in ms / MB).
+    """
+    names = {key: value.name for key, value in plane.event_metadata.items()}
+    stat_names = {key: value.name for key, value in plane.stat_metadata.items()}
+    input_waits, pipeline, xla = [], {}, {}
+    scope_times, first_seen = {}, {}
+    optimizer_ms = 0.0
+    peak_bytes = 0
+    for line in plane.lines:
+        if line.name == "python":
+            continue  # the Python thread only shows the calls that wait for the operations below
+        for event in sorted(line.events, key=lambda e: e.offset_ps):
+            name = names[event.metadata_id]
+            ms = event.duration_ps / 1e9
+            for stat in event.stats:
+                if stat_names.get(stat.metadata_id) == "peak_bytes_in_use":
+                    peak_bytes = max(peak_bytes, stat.int64_value or stat.uint64_value)
+            parts = [part for part in name.split(":")[0].split("/") if part not in ("StatefulPartitionedCall", "gradient_tape")]
+            if line.name.startswith("tf_data_iterator_get_next"):
+                # the time the training step waited for its next batch
+                if name.startswith("IteratorGetNextOp"):
+                    input_waits.append(ms)
+            elif line.name.startswith("tf_data"):
+                # the input pipeline: its stages (e.g. "Iterator::Root::Prefetch::Shuffle") and the operations
+                # of its map functions (e.g. the augmentation layers when they run in tf.data with --jit-compile)
+                if name.startswith("Iterator::"):
+                    pipeline[name] = pipeline.get(name, 0.0) + ms
+                elif len(parts) > 2:
+                    key = "map: " + "/".join(_base_name(part) for part in parts[:2])
+                    pipeline[key] = pipeline.get(key, 0.0) + ms
+            elif len(parts) > 2:
+                # operations are named after the model and the layer that created them, e.g.
+                # "StatefulPartitionedCall/gradient_tape/sequential_1/conv2d_1/Conv2DBackpropFilter"
+                if any(part.lower().startswith(("adam", "sgd", "rmsprop")) for part in parts):
+                    optimizer_ms += ms
+                    continue
+                # layers that are models themselves (the augmentation block) are split one level further
+                scope, inner = parts[1], _base_name(parts[2]) if len(parts) > 3 else None
+                times = scope_times.setdefault((scope, inner), {"forward_ms": 0.0, "backward_ms": 0.0})
+                backward = "gradient_tape" in name
+                times["backward_ms" if backward else "forward_ms"] += ms
+                if not backward:
+                    start = line.timestamp_ns * 1000 + event.offset_ps
+                    first_seen[scope] = min(first_seen.get(scope, start), start)
+            elif re.fullmatch(r"[a-z][a-z_\-]*(\.\d+)?", name):
+                # with --jit-compile the layers are fused into XLA kernels ("convolution.4", "depthwise.5", ...)
+                # that can no longer be traced back to a layer
+                xla[name] = xla.get(name, 0.0) + ms
+
+    matched = _match_layers({scope: first_seen.get(scope, float("inf")) for scope, _ in scope_times}, model.layers)
+    layers = {}
+    for (scope, inner), times in scope_times.items():
+        layer = matched.get(scope)
+        label = layer.name if layer is not None else scope  # e.g. the loss, which belongs to no layer
+        if inner is not None and hasattr(layer, "layers"):
+            label += "/" + inner
+        total = layers.setdefault(label, {"forward_ms": 0.0, "backward_ms": 0.0})
+        total["forward_ms"] += times["forward_ms"]
+        total["backward_ms"] += times["backward_ms"]
+    return {
+        "input_waits_ms": input_waits,
+        "layers": layers,
+        "optimizer_ms": optimizer_ms,
+        "input_pipeline_ms": pipeline,
+        "xla_kernels_ms": xla,
+        "peak_tensor_memory_mb": peak_bytes / 1024 ** 2,
+    }
+
+
+class ProfileCallback(tf.keras.callbacks.Callback):
+    """Times every training step and records steps start_step .. start_step + steps - 1 of the first epoch with the profiler."""
+
+    def __init__(self, logdir: str, batch_size: int, settings: dict = None,
+                 start_step: int = PROFILE_START_STEP, steps: int = PROFILE_STEPS):
+        super().__init__()
+        self.logdir = logdir
+        self.batch_size = batch_size
+        self.settings = settings or {}
+        self.start_step = start_step
+        self.steps = steps
+        self.step_seconds = []
+        self.traced = []  # indices into step_seconds of the traced steps
+        self._tracing = False
+        self._done = False
+        self._step_start = None
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if not self._done and not self._tracing and batch == self.start_step:
+            tf.profiler.experimental.start(self.logdir)
+            self._tracing = True
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        # the loss is read back, so the step has really finished and its time is not hidden by asynchronous execution
+        if logs:
+            float(logs.get("loss", 0.0))
+        self.step_seconds.append(time.perf_counter() - self._step_start)
+        if self._tracing:
+            self.traced.append(len(self.step_seconds) - 1)
+            if len(self.traced) == self.steps:
+                self._stop()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self._stop()  # an epoch shorter than the window is traced up to its end; the validation is never traced
+
+    def on_train_end(self, logs=None):
+        self._stop()
+        self.write_summary()
+
+    def _stop(self):
+        if self._tracing:
+            tf.profiler.experimental.stop()
+            self._tracing = False
+            self._done = True
+
+    def write_summary(self) -> dict:
+        steady = self.step_seconds[self.start_step:] or self.step_seconds
+        summary = {
+            "settings": self.settings,
+            "batch_size": self.batch_size,
+            "steps": len(self.step_seconds),
+            "step_ms_mean": 1000 * float(np.mean(steady)),
+            "step_ms_p90": 1000 * float(np.percentile(steady, 90)),
+            "images_per_second": self.batch_size / float(np.mean(steady)),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+        plane = _read_trace(self.logdir)
+        if plane is not None:
+            trace = summarize_trace(plane, self.model)
+            traced_ms = [1000 * self.step_seconds[i] for i in self.traced]
+            waits = trace["input_waits_ms"][:len(traced_ms)]
+            waits += [0.0] * (len(traced_ms) - len(waits))
+            summary["traced_steps"] = [
+                {"total_ms": total, "input_ms": wait, "compute_ms": max(0.0, total - wait)}
+                for total, wait in zip(traced_ms, waits)
+            ]
+            summary["input_wait_fraction"] = sum(waits) / sum(traced_ms) if traced_ms else 0.0
+            summary["layers"] = dict(sorted(trace["layers"].items(), key=lambda item: -sum(item[1].values())))
+            summary["optimizer_ms"] = trace["optimizer_ms"]
+            summary["input_pipeline_ms"] = dict(sorted(trace["input_pipeline_ms"].items(), key=lambda item: -item[1]))
+            summary["xla_kernels_ms"] = dict(sorted(trace["xla_kernels_ms"].items(), key=lambda item: -item[1])[:15])
+            summary["peak_tensor_memory_mb"] = trace["peak_tensor_memory_mb"]
+        os.makedirs(self.logdir, exist_ok=True)
+        path = os.path.join(self.logdir, "profile_summary.json")
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Profile: {summary['images_per_second']:.1f} images/s, "
+              f"{100 * summary.get('input_wait_fraction', 0.0):.0f}% of the traced step time waiting for input -> {path}")
+        return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the profile summaries of several training runs.")
+    parser.add_argument("summaries", nargs="+", help="profile_summary.json files written with --profile")
+    parser.add_argument("--layers", type=int, default=5, help="number of slowest layers to list per run")
+    args = parser.parse_args()
+
+    print(f"{'run':<40}{'step ms':>9}{'p90 ms':>9}{'images/s':>10}{'input %':>9}{'tensors MB':>12}{'RSS MB':>9}")
+    for path in args.summaries:
+        with open(path) as f:
+            summary = json.load(f)
+        run = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        print(f"{run:<40}{summary['step_ms_mean']:>9.1f}{summary['step_ms_p90']:>9.1f}{summary['images_per_second']:>10.1f}"
+              f"{100 * summary.get('input_wait_fraction', 0.0):>9.1f}{summary.get('peak_tensor_memory_mb', 0.0):>12.1f}"
+              f"{summary['peak_rss_mb'] or 0.0:>9.0f}")
+        for layer, times in list(summary.get("layers", {}).items())[:args.layers]:
+            print(f"    {layer:<36}forward {times['forward_ms']:>8.1f} ms   backward {times['backward_ms']:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
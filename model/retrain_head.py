@@ -0,0 +1,199 @@
+# --- Head-Only Retraining ---
+# This script refits only the classifier head of the trained model (the Dense layers after Flatten) and keeps the conv layers as they are.
+# The frozen conv stack is run once over every image of the dataset cache (see dataset_cache.py), and its output features
+# are stored on disk (cache/features/<conv weights hash>/). The head is then trained on those stored features only,
+# which takes seconds instead of a full training run. Finally, the refitted head is put back on top of the conv layers
+# and the combined model is saved as a new model file, plant_classifier_head.keras (the app keeps using plant_classifier.keras
+# until the new file is copied over it or passed with PLANT_MODEL_PATH).
+# The new model is only saved if its validation accuracy is not more than MAX_ACCURACY_DROP below the current model's
+# (the same check as in app/finetune.py); --force saves it anyway.
+# The features are stored per image content hash, so after adding a few labelled photos only those photos go through the conv layers.
+# They are only reused as long as the conv weights are the same; after a full retrain with predict.py they are computed again.
+# Note: the random augmentation layers do nothing when features are extracted, so the head is trained on the plain images.
+
+# --- how to run ---
+# type in your terminal: python model/retrain_head.py
+# press enter (to replace the model used by the app directly: python model/retrain_head.py --output model/plant_classifier.keras)
+
+# --- Reference ---
+# https://www.tensorflow.org/tutorials/images/transfer_learning (feature extraction with a frozen base)
+# https://numpy.org/doc/stable/reference/generated/numpy.lib.format.open_memmap.html
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from dataset_cache import build_dataset_cache, cache_root, load_arrays
+
+# Step 1: Define paths and parameters
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+model_path = os.path.join(script_dir, "plant_classifier.keras")
+head_model_path = os.path.join(script_dir, "plant_classifier_head.keras")
+MAX_ACCURACY_DROP = 0.01
+features_root = os.path.join(cache_root, "features")
+FEATURE_LAYERS = ("Flatten", "GlobalAveragePooling2D", "GlobalMaxPooling2D")  # the head starts right after the last of these
+
+
+def split_model(model: tf.keras.Model):
+    """
+    Returns (feature extractor, index of the first head layer).
+    The feature extractor is the model up to the last Flatten/global pooling layer; everything after it is the head.
+    """
+    cut = max(i for i, layer in enumerate(model.layers) if layer.__class__.__name__ in FEATURE_LAYERS)
+    extractor = tf.keras.Model(model.inputs[0], model.layers[cut].output)
+    return extractor, cut + 1
+
+
+def weights_hash(layers: list) -> str:
+    """Hash of the weights of the given layers, so features are only reused with exactly the same conv stack."""
+    digest = hashlib.sha256()
+    for layer in layers:
+        for weight in layer.get_weights():
+            digest.update(np.ascontiguousarray(weight).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def extract_features(extractor: tf.keras.Model, manifest: dict, directory: str, batch_size: int = 32) -> dict:
+    """
+    Brings the feature store in directory up to date with the dataset cache and returns {sha256: row}.
+    The features are stored as float16 (half the disk space; the head is trained in float32 anyway).
+    """
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, "index.json")
+    rows = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            rows = json.load(f)
+
+    images, _, paths = load_arrays("all", manifest=manifest)
+    sha_of_path = {entry["path"]: entry["sha256"] for entry in manifest["entries"]}
+    missing = {}
+    for i, path in enumerate(paths):
+        sha256 = sha_of_path[path]
+        if sha256 not in rows and sha256 not in missing:
+            missing[sha256] = i
+    if not missing:
+        return rows
+
+    # the old features are copied into a new, larger file together with the features of the new images
+    dim = int(np.prod(extractor.output.shape[1:]))
+    old_path = os.path.join(directory, "features.npy")
+    new_path = os.path.join(directory, f"features-{time.time_ns()}.npy")
+    store = np.lib.format.open_memmap(new_path, mode="w+", dtype=np.float16, shape=(len(rows) + len(missing), dim))
+    if rows:
+        store[:len(rows)] = np.load(old_path, mmap_mode="r")[:len(rows)]
+    forward = tf.function(lambda batch: extractor(batch, training=False))
+    hashes = list(missing)
+    for start in range(0, len(hashes), batch_size):
+        chunk = hashes[start:start + batch_size]
+        batch = images[[missing[h] for h in chunk]].astype("float32")
+        store[len(rows) + start:len(rows) + start + len(chunk)] = forward(batch).numpy().reshape(len(chunk), dim)
+    store.flush()
+    del store
+    # the old rows keep their positions in the new file, so the old index stays valid until it is replaced below
+    os.replace(new_path, old_path)
+    first_new_row = len(rows)
+    for i, sha256 in enumerate(hashes):
+        rows[sha256] = first_new_row + i
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(rows, f)
+    os.replace(tmp_path, index_path)
+    print(f"Extracted features of {len(hashes)} images")
+    return rows
+
+
+def load_features(manifest: dict, directory: str, rows: dict, subset: str):
+    """Returns (float32 features, labels) of one subset, in the same order as load_arrays."""
+    class_index = {name: i for i, name in enumerate(manifest["class_names"])}
+    entries = sorted(
+        (entry for entry in manifest["entries"] if entry["split"] == subset),
+        key=lambda entry: (entry["sha256"], entry["path"]),
+    )
+    store = np.load(os.path.join(directory, "features.npy"), mmap_mode="r")
+    features = store[[rows[entry["sha256"]] for entry in entries]].astype("float32")
+    labels = np.array([class_index[entry["label"]] for entry in entries], dtype=np.int32)
+    return features, labels
+
+
+def build_head(model: tf.keras.Model, first_head_layer: int, dim: int, reset: bool) -> tf.keras.Model:
+    """A standalone copy of the head layers that takes the stored features as input."""
+    head = tf.keras.Sequential(
+        [tf.keras.Input(shape=(dim,))]
+        + [layer.__class__.from_config(layer.get_config()) for layer in model.layers[first_head_layer:]]
+    )
+    if not reset:
+        # starting from the current head means a few new photos only nudge it instead of training it from scratch
+        for source, target in zip(model.layers[first_head_layer:], head.layers):
+            target.set_weights(source.get_weights())
+    return head
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Refit only the classifier head of the trained model from cached conv features.")
+    parser.add_argument("--model", default=model_path, help="model whose conv layers are kept")
+    parser.add_argument("--output", default=head_model_path, help="where to save the combined model (default: model/plant_classifier_head.keras)")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=1e-4)
+    parser.add_argument("--reset-head", action="store_true", help="train the head from random weights instead of the current ones")
+    parser.add_argument("--force", action="store_true", help="save the model even if its validation accuracy dropped")
+    args = parser.parse_args()
+    start = time.perf_counter()
+
+    # Step 2: split the trained model into the frozen conv stack and the head
+    model = tf.keras.models.load_model(args.model, compile=False)
+    extractor, first_head_layer = split_model(model)
+    directory = os.path.join(features_root, weights_hash(model.layers[:first_head_layer]))
+
+    # Step 3: run the conv stack over the images that have no stored features yet
+    manifest = build_dataset_cache(data_dir)
+    rows = extract_features(extractor, manifest, directory)
+    train_x, train_y = load_features(manifest, directory, rows, "training")
+    val_x, val_y = load_features(manifest, directory, rows, "validation")
+    extracted = time.perf_counter()
+    print(f"Features ready: {len(train_x)} training and {len(val_x)} validation images ({extracted - start:.1f} s)")
+
+    # Step 4: train only the head on the stored features
+    # the accuracy of the current model is measured with a copy of its head (with --reset-head the trained one starts random)
+    current = build_head(model, first_head_layer, train_x.shape[1], reset=False)
+    current.compile(loss="sparse_categorical_crossentropy", metrics=["accuracy"])
+    before = current.evaluate(val_x, val_y, batch_size=args.batch_size, verbose=0)[1]
+    head = build_head(model, first_head_layer, train_x.shape[1], args.reset_head)
+    head.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=args.learning_rate),
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    head.fit(
+        train_x, train_y,
+        validation_data=(val_x, val_y),
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        callbacks=[tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=5, restore_best_weights=True)],
+        verbose=2,
+    )
+    after = head.evaluate(val_x, val_y, batch_size=args.batch_size, verbose=0)[1]
+    print(f"Head trained in {time.perf_counter() - extracted:.1f} s, validation accuracy {before:.3f} -> {after:.3f}")
+    if after < before - MAX_ACCURACY_DROP and not args.force:
+        print(f"Not saved: the validation accuracy dropped by more than {MAX_ACCURACY_DROP} (use --force to save it anyway)")
+        raise SystemExit(1)
+
+    # Step 5: put the refitted head back on top of the conv layers and save the combined model
+    for source, target in zip(head.layers, model.layers[first_head_layer:]):
+        target.set_weights(source.get_weights())
+    # saved next to the target first and then renamed, so the app never loads a half-written file
+    tmp_path = args.output + ".tmp.keras"
+    model.save(tmp_path)
+    os.replace(tmp_path, args.output)
+    print(f"Saved {args.output} ({time.perf_counter() - start:.1f} s in total)")
+
+
+if __name__ == "__main__":
+    main()
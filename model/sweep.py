@@ -0,0 +1,256 @@
+# --- Hyperparameter Sweep ---
+# Instead of hand-editing the constants in predict.py (dropout 0.1 -> 0.3 -> 0.5, epochs 1 or 50, ...),
+# this script trains many settings ("trials") and collects their results in one table and one CSV file.
+# - the search space lists the values to try for augmentation strengths, dropout, learning rate, batch size,
+#   conv widths and architecture; either every combination is tried (grid) or --trials random combinations
+# - the trials run in a pool of worker processes; every process limits TensorFlow to --threads-per-trial threads,
+#   so several trials share the CPU cores instead of fighting over them
+# - with --folds k, every trial is trained k times (k-fold cross-validation on the training split) and the mean is reported
+# - bad trials are stopped early: after each epoch, a trial whose validation accuracy is below the median of the trials
+#   that already reached that epoch is stopped (median stopping rule), besides the usual EarlyStopping on the loss
+# - all trials read the same decoded images from the dataset cache (dataset_cache.py), so no trial touches plant_images;
+#   but every worker process copies the images it trains on into its own memory (load_arrays returns a copy of the
+#   memory-mapped shards, and tf.data copies it again), so the pool is made smaller if N copies do not fit in the free memory
+# The search space can be given as a JSON file mapping each parameter to a list of values, e.g.
+#   {"dropout": [0.3, 0.5], "learning_rate": [0.001, 0.0003], "conv_filters": [[32, 64, 256], [16, 32, 64]]}
+# Parameters that are not listed keep the values of predict.py.
+
+# --- how to run ---
+# type in your terminal: python model/sweep.py --trials 8 --epochs 10 --workers 2 --threads-per-trial 2 --output sweep.csv
+# press enter
+
+# --- Reference ---
+# https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+# https://www.tensorflow.org/api_docs/python/tf/config/threading
+# Golovin et al. (2017), "Google Vizier" (median stopping rule)
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from dataset_cache import build_dataset_cache, fold_of, load_arrays, load_manifest, seed
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+
+# the values of predict.py, used for every parameter the search space does not list
+DEFAULTS = {
+    "architecture": "baseline",
+    "conv_filters": [32, 64, 256],
+    "dropout": 0.5,
+    "learning_rate": 0.001,
+    "batch_size": 8,
+    "rotation": 0.3,
+    "zoom": 0.2,
+    "translation": 0.1,
+    "contrast": 0.1,
+    "brightness": 0.1,
+}
+DEFAULT_SPACE = {
+    "architecture": ["baseline", "lean"],
+    "dropout": [0.3, 0.5],
+    "learning_rate": [0.001, 0.0003],
+    "batch_size": [8, 32],
+    "rotation": [0.1, 0.3],
+}
+MEDIAN_STOP_MIN_TRIALS = 3  # the median rule only starts once this many trials have reported an epoch
+# memory of one worker: the decoded images up to three times (load_arrays, the k-fold selection and the tf.data tensor)
+# plus TensorFlow, the model and its activations (about 1 GB for the baseline with batch size 8)
+DATASET_COPIES_PER_WORKER = 3
+MODEL_BYTES_PER_WORKER = 1 << 30
+
+
+def expand_space(space: dict, trials: int = None) -> list:
+    """Every combination of the space (grid), or `trials` random combinations of it."""
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    if trials is not None and trials < len(grid):
+        grid = random.Random(seed).sample(grid, trials)
+    return [{**DEFAULTS, **params} for params in grid]
+
+
+def _init_worker(threads: int) -> None:
+    # runs once in every worker process, before TensorFlow is imported there
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(max(1, threads // 2))
+
+
+def _available_memory():
+    # free physical memory in bytes, or None where os.sysconf does not know it (e.g. on Windows)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def fit_workers(workers: int, manifest: dict) -> int:
+    """The number of workers whose private copies of the dataset fit into the free memory (at least 1)."""
+    available = _available_memory()
+    if available is None:
+        return workers
+    dataset_bytes = len(manifest["entries"]) * int(np.prod(manifest["img_size"])) * 3
+    per_worker = DATASET_COPIES_PER_WORKER * dataset_bytes + MODEL_BYTES_PER_WORKER
+    return max(1, min(workers, available // per_worker))
+
+
+def _fold_indices(manifest: dict, paths: list, folds: int, fold: int):
+    sha_of_path = {entry["path"]: entry["sha256"] for entry in manifest["entries"]}
+    in_fold = np.array([fold_of(sha_of_path[path], folds) == fold for path in paths])
+    return np.flatnonzero(~in_fold), np.flatnonzero(in_fold)
+
+
+def run_trial(trial: int, params: dict, fold: int, folds: int, epochs: int, progress) -> dict:
+    """
+    Runs in a worker process: trains one trial (on one fold) and returns its result.
+    progress is a shared dict {(trial, fold, epoch): val_accuracy} used by the median stopping rule.
+    """
+    import tensorflow as tf
+    from tensorflow.keras import layers
+
+    from architectures import build_model
+
+    start = time.perf_counter()
+    manifest = load_manifest()
+    if folds > 1:
+        images, labels, paths = load_arrays("training", manifest=manifest)
+        train_index, val_index = _fold_indices(manifest, paths, folds, fold)
+        train_x, train_y, val_x, val_y = images[train_index], labels[train_index], images[val_index], labels[val_index]
+    else:
+        train_x, train_y, _ = load_arrays("training", manifest=manifest)
+        val_x, val_y, _ = load_arrays("validation", manifest=manifest)
+
+    train_ds = (tf.data.Dataset.from_tensor_slices((train_x, train_y)).shuffle(len(train_y), seed=seed)
+                .batch(params["batch_size"]).map(lambda x, y: (tf.cast(x, tf.float32), y)).prefetch(tf.data.AUTOTUNE))
+    val_ds = (tf.data.Dataset.from_tensor_slices((val_x, val_y)).batch(64)
+              .map(lambda x, y: (tf.cast(x, tf.float32), y)).prefetch(tf.data.AUTOTUNE))
+
+    augmentation = tf.keras.Sequential([
+        layers.RandomFlip("horizontal_and_vertical"),
+        layers.RandomRotation(params["rotation"]),
+        layers.RandomZoom(params["zoom"]),
+        layers.RandomTranslation(params["translation"], params["translation"]),
+        layers.RandomContrast(params["contrast"]),
+        layers.RandomBrightness(params["brightness"]),
+    ])
+    model = build_model(params["architecture"], len(manifest["class_names"]), [augmentation],
+                        tuple(params["conv_filters"]), params["dropout"])
+    model.compile(optimizer=tf.keras.optimizers.Adam(params["learning_rate"]),
+                  loss="sparse_categorical_crossentropy", metrics=["accuracy"])
+
+    class MedianStopping(tf.keras.callbacks.Callback):
+        """Stops the trial when its best validation accuracy so far is below the median of the other trials at this epoch."""
+
+        stopped = False
+        best = 0.0
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.best = best = max(self.best, logs["val_accuracy"])
+            progress[(trial, fold, epoch)] = best
+            others = [value for (t, f, e), value in progress.items() if e == epoch and t != trial]
+            if len(others) >= MEDIAN_STOP_MIN_TRIALS and best < np.median(others):
+                self.stopped = True
+                self.model.stop_training = True
+
+    median_stopping = MedianStopping()
+    history = model.fit(
+        train_ds, validation_data=val_ds, epochs=epochs, verbose=0,
+        callbacks=[tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=5), median_stopping],
+    )
+    return {
+        "trial": trial,
+        "fold": fold,
+        "val_accuracy": max(history.history["val_accuracy"]),
+        "epochs_run": len(history.history["val_accuracy"]),
+        "stopped_early": median_stopping.stopped,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a hyperparameter sweep over the plant classifier in parallel processes.")
+    parser.add_argument("--space", help="JSON file with the search space (default: a small built-in space)")
+    parser.add_argument("--trials", type=int, help="number of random combinations (default: every combination)")
+    parser.add_argument("--epochs", type=int, default=10, help="maximum epochs per trial")
+    parser.add_argument("--folds", type=int, default=1, help="k for k-fold cross-validation on the training split (1: use the validation split)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 2), help="trials running at the same time")
+    parser.add_argument("--threads-per-trial", type=int, default=None, help="TensorFlow threads per worker (default: cores / workers)")
+    parser.add_argument("--output", default="sweep.csv", help="CSV file with one row per trial")
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    trials = expand_space(space, args.trials)
+
+    # the images are decoded once here; the workers read them from the shards
+    manifest = build_dataset_cache(data_dir)
+    workers = fit_workers(args.workers, manifest)
+    if workers < args.workers:
+        print(f"Only {workers} of {args.workers} workers fit into the free memory (every worker holds its own copy of the images)")
+    # the cores are shared by the workers that actually run, so fewer workers get more threads each
+    threads = args.threads_per_trial or max(1, (os.cpu_count() or 1) // workers)
+    print(f"{len(trials)} trials x {args.folds} fold(s), {workers} workers with {threads} threads each")
+
+    start = time.perf_counter()
+    results = {}
+    # "spawn" starts clean worker processes; forking a process that has already loaded TensorFlow is not safe
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager, ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(threads,)
+    ) as pool:
+        progress = manager.dict()
+        futures = [
+            pool.submit(run_trial, trial, params, fold, args.folds, args.epochs, progress)
+            for trial, params in enumerate(trials)
+            for fold in range(args.folds)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.setdefault(result["trial"], []).append(result)
+            print(f"  trial {result['trial']} fold {result['fold']}: val accuracy {result['val_accuracy']:.3f} "
+                  f"after {result['epochs_run']} epochs{' (stopped early)' if result['stopped_early'] else ''} "
+                  f"in {result['seconds']:.0f} s", flush=True)
+
+    # one row per trial: its parameters and the mean over its folds
+    rows = []
+    for trial, params in enumerate(trials):
+        runs = results[trial]
+        accuracies = [run["val_accuracy"] for run in runs]
+        rows.append({
+            "trial": trial,
+            **{name: json.dumps(value) if isinstance(value, list) else value for name, value in params.items()},
+            "val_accuracy": round(float(np.mean(accuracies)), 4),
+            "val_accuracy_std": round(float(np.std(accuracies)), 4),
+            "epochs_run": sum(run["epochs_run"] for run in runs),
+            "stopped_early": any(run["stopped_early"] for run in runs),
+            "seconds": round(sum(run["seconds"] for run in runs), 1),
+        })
+    rows.sort(key=lambda row: -row["val_accuracy"])
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    varied = sorted(space)
+    print(f"\n{'trial':>5}  " + "  ".join(f"{name:>14}" for name in varied) + f"{'val acc':>9}{'std':>7}{'epochs':>8}")
+    for row in rows:
+        print(f"{row['trial']:>5}  " + "  ".join(f"{str(row[name]):>14}" for name in varied)
+              + f"{row['val_accuracy']:>9.3f}{row['val_accuracy_std']:>7.3f}{row['epochs_run']:>8}")
+    print(f"Sweep finished in {time.perf_counter() - start:.0f} s, results in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
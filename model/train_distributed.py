@@ -0,0 +1,226 @@
+# --- Data-Parallel Training Across Worker Processes ---
+# This script trains the plant classifier in several local worker processes at once (data parallelism).
+# Every worker holds a full copy of the model and trains on its own shard of the preprocessed dataset
+# (every N-th image of the dataset cache, see dataset_cache.py); after every step the workers average their gradients,
+# so all copies stay identical. This uses TensorFlow's MultiWorkerMirroredStrategy, the same mechanism that spreads
+# training over several machines, here with all workers on localhost.
+# Started without --worker-index, the script is the launcher: it picks free ports, writes the cluster description
+# (TF_CONFIG) for every worker, starts them and waits. Worker 0 (the "chief") saves the model to the usual
+# plant_classifier.keras and writes the seconds per epoch.
+
+# --- how to run ---
+# type in your terminal: python model/train_distributed.py --workers 2 --epochs 10
+# press enter
+
+# --- Reference ---
+# https://www.tensorflow.org/tutorials/distribute/multi_worker_with_keras
+# https://www.tensorflow.org/api_docs/python/tf/distribute/MultiWorkerMirroredStrategy
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from architectures import ARCHITECTURES
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(script_dir, os.pardir, "plant_images")
+model_path = os.path.join(script_dir, "plant_classifier.keras")
+
+
+def free_ports(count: int) -> list:
+    """Asks the operating system for `count` unused local ports."""
+    sockets = [socket.socket() for _ in range(count)]
+    for s in sockets:
+        s.bind(("localhost", 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def launch(args) -> None:
+    """Starts one process per worker with its TF_CONFIG and waits for all of them."""
+    # the images are decoded once here, so the workers only read the shards
+    from dataset_cache import build_dataset_cache
+
+    build_dataset_cache(data_dir)
+    workers = [f"localhost:{port}" for port in free_ports(args.workers)]
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    processes = []
+    for index in range(args.workers):
+        env = dict(os.environ, TF_CONFIG=json.dumps({"cluster": {"worker": workers}, "task": {"type": "worker", "index": index}}))
+        env["OMP_NUM_THREADS"] = str(threads)
+        command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--worker-index", str(index),
+                   "--threads-per-worker", str(threads)]
+        processes.append(subprocess.Popen(command, env=env))
+    codes = [process.wait() for process in processes]
+    if any(codes):
+        sys.exit(f"worker exit codes: {codes}")
+
+
+def train_worker(args) -> None:
+    """Runs inside one worker process."""
+    import numpy as np
+    import tensorflow as tf
+    from tensorflow.keras import layers
+
+    from architectures import build_model
+    from dataset_cache import load_arrays, load_manifest, seed
+    from training_modes import scaled_learning_rate, write_metrics
+
+    tf.config.threading.set_intra_op_parallelism_threads(args.threads_per_worker)
+    tf.config.threading.set_inter_op_parallelism_threads(max(1, args.threads_per_worker // 2))
+    # the strategy reads the cluster and this worker's index from TF_CONFIG, which the launcher set
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    workers = strategy.num_replicas_in_sync
+    is_chief = args.worker_index == 0
+
+    manifest = load_manifest()
+    train_x, train_y, _ = load_arrays("training", manifest=manifest)
+    val_x, val_y, _ = load_arrays("validation", manifest=manifest)
+    # the global batch is batch_size images on every worker, so the learning rate is scaled to the global batch
+    global_batch = args.batch_size * workers
+    # all workers run the same number of steps, because they have to meet at every gradient exchange
+    steps_per_epoch = max(1, len(train_y) // global_batch)
+
+    def shard(x, y, shuffle):
+        def dataset_fn(context):
+            # Every worker reads only its own shard: every n-th image of the cache, starting at its index,
+            # so each image is seen by exactly one worker per pass.
+            index, count = context.input_pipeline_id, context.num_input_pipelines
+            ds = tf.data.Dataset.from_tensor_slices((x[index::count], y[index::count]))
+            if shuffle:
+                ds = ds.shuffle(len(y) // count, seed=seed + index)
+            return (ds.repeat().batch(context.get_per_replica_batch_size(global_batch))
+                    .map(lambda a, b: (tf.cast(a, tf.float32), b)).prefetch(tf.data.AUTOTUNE))
+        return iter(strategy.distribute_datasets_from_function(dataset_fn))
+
+    def validation_shard(x, y):
+        def dataset_fn(context):
+            # The validation split is not repeated: every epoch goes over every image exactly once.
+            # The shards differ by at most one image, so the shorter ones get a copy of their first image
+            # with weight 0. Then all workers run the same number of batches (they meet at every reduce)
+            # and the padding is not counted.
+            index, count = context.input_pipeline_id, context.num_input_pipelines
+            shard_x, shard_y = x[index::count], y[index::count]
+            padding = -(-len(y) // count) - len(shard_y)
+            weights = np.concatenate([np.ones(len(shard_y), "float32"), np.zeros(padding, "float32")])
+            ds = tf.data.Dataset.from_tensor_slices((np.concatenate([shard_x, shard_x[:padding]]),
+                                                     np.concatenate([shard_y, shard_y[:padding]]), weights))
+            return (ds.batch(context.get_per_replica_batch_size(global_batch))
+                    .map(lambda a, b, w: (tf.cast(a, tf.float32), b, w)).prefetch(tf.data.AUTOTUNE))
+        return strategy.distribute_datasets_from_function(dataset_fn)
+
+    with strategy.scope():
+        augmentation = tf.keras.Sequential([
+            layers.RandomFlip("horizontal_and_vertical"),
+            layers.RandomRotation(0.3),
+            layers.RandomZoom(0.2),
+            layers.RandomTranslation(0.1, 0.1),
+            layers.RandomContrast(0.1),
+            layers.RandomBrightness(0.1),
+        ])
+        model = build_model(args.architecture, len(manifest["class_names"]), [augmentation])
+        optimizer = tf.keras.optimizers.Adam(learning_rate=scaled_learning_rate(global_batch))
+    loss_fn = tf.keras.losses.SparseCategoricalCrossentropy(reduction="none")
+
+    # A hand-written training step instead of model.fit: Keras 3's fit() cannot start under
+    # MultiWorkerMirroredStrategy (it fails while building the model from the first distributed batch).
+    def correct(labels, probs):
+        return tf.reduce_sum(tf.cast(tf.equal(tf.argmax(probs, axis=1), tf.cast(labels, tf.int64)), tf.float32))
+
+    @tf.function
+    def train_step(iterator):
+        def step(images, labels):
+            with tf.GradientTape() as tape:
+                probs = model(images, training=True)
+                # the loss is divided by the global batch, so summing the workers' gradients gives the mean
+                loss = tf.nn.compute_average_loss(loss_fn(labels, probs), global_batch_size=global_batch)
+            gradients = tape.gradient(loss, model.trainable_variables)
+            optimizer.apply_gradients(zip(gradients, model.trainable_variables))  # averages the gradients of all workers
+            return loss, correct(labels, probs)
+
+        loss, hits = strategy.run(step, args=next(iterator))
+        return strategy.reduce("SUM", loss, axis=None), strategy.reduce("SUM", hits, axis=None)
+
+    @tf.function
+    def evaluate(dataset):
+        # one pass over the whole validation split, the accuracy is counted over all workers
+        def step(images, labels, weights):
+            hits = tf.cast(tf.equal(tf.argmax(model(images, training=False), axis=1), tf.cast(labels, tf.int64)), tf.float32)
+            return tf.reduce_sum(hits * weights), tf.reduce_sum(weights)
+
+        hits = total = tf.constant(0.0)
+        for images, labels, weights in dataset:
+            step_hits, step_total = strategy.run(step, args=(images, labels, weights))
+            hits += strategy.reduce("SUM", step_hits, axis=None)
+            total += strategy.reduce("SUM", step_total, axis=None)
+        return hits / total
+
+    train_iterator = shard(train_x, train_y, shuffle=True)
+    val_dataset = validation_shard(val_x, val_y)
+    epoch_seconds, val_accuracies = [], []
+    best_weights = None
+    for epoch in range(args.epochs):
+        start = time.perf_counter()
+        loss = hits = 0.0
+        for _ in range(steps_per_epoch):
+            step_loss, step_hits = train_step(train_iterator)
+            loss += float(step_loss)
+            hits += float(step_hits)
+        epoch_seconds.append(time.perf_counter() - start)
+        val_accuracy = float(evaluate(val_dataset))
+        # like the ModelCheckpoint in predict.py, the weights of the best epoch are kept
+        if not val_accuracies or val_accuracy > max(val_accuracies):
+            best_weights = model.get_weights()
+        val_accuracies.append(val_accuracy)
+        if is_chief:
+            print(f"Epoch {epoch + 1}/{args.epochs}: loss {loss / steps_per_epoch:.4f}, "
+                  f"accuracy {hits / (steps_per_epoch * global_batch):.4f}, val_accuracy {val_accuracy:.4f}, "
+                  f"{epoch_seconds[-1]:.1f} s, {steps_per_epoch * global_batch / epoch_seconds[-1]:.1f} images/s", flush=True)
+    model.set_weights(best_weights)
+
+    # all workers hold the same weights now; the chief writes the model and the metrics
+    if is_chief:
+        tmp_path = args.output + ".tmp.keras"
+        model.save(tmp_path)
+        os.replace(tmp_path, args.output)
+        print(f"Saved {args.output}")
+        if args.metrics_json:
+            steady = epoch_seconds[1:] or epoch_seconds  # the first epoch also traces the functions
+            write_metrics(args.metrics_json, {
+                "workers": workers,
+                "threads_per_worker": args.threads_per_worker,
+                "global_batch_size": global_batch,
+                "epoch_seconds": epoch_seconds,
+                "seconds_per_epoch": float(np.mean(steady)),
+                "images_per_second": steps_per_epoch * global_batch / float(np.mean(steady)),
+                "val_accuracy": max(val_accuracies),
+            })
+    # the workers wait for each other before exiting; a worker that leaves early is reported as crashed by the others
+    strategy.reduce("SUM", strategy.run(tf.function(lambda: tf.constant(1.0))), axis=None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the plant classifier data-parallel in several local worker processes.")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=8, help="images per step on every worker")
+    parser.add_argument("--architecture", choices=ARCHITECTURES, default="baseline", help="CNN variant, see architectures.py")
+    parser.add_argument("--threads-per-worker", type=int, help="TensorFlow threads per worker (default: cores / workers)")
+    parser.add_argument("--output", default=model_path)
+    parser.add_argument("--metrics-json", help="file the chief writes seconds per epoch and images per second to")
+    parser.add_argument("--worker-index", type=int, help=argparse.SUPPRESS)  # set by the launcher
+    args = parser.parse_args()
+    if args.worker_index is None:
+        launch(args)
+    else:
+        train_worker(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,19 @@
 # The model is trained using TensorFlow and Keras, with data augmentation and model checkpointing.
 # The dataset is expected to be organized in a directory structure where each subdirectory contains images of a specific class.
 
+import argparse
+import json
 import os
 import tensorflow as tf
 from tensorflow.keras import layers, models
-import matplotlib.pyplot as plt
+from dataset_cache import build_dataset_cache, make_dataset
+from architectures import ARCHITECTURES, build_model
+from evaluate import evaluate_model, save_figures
+from profiling import ProfileCallback
 
 # Step 1: Define paths and parameters
 # Define the path to the dataset and model directory
-script_dir = os.path.dirname(os.path.abspath("train_model.py"))
+script_dir = os.path.dirname(os.path.abspath(__file__))
 data_dir = os.path.join(script_dir, os.pardir, "plant_images")
 model_dir = os.path.join(script_dir, os.pardir, "model")
 os.makedirs(model_dir, exist_ok=True)
@@ -20,29 +25,26 @@ batch_size = 8
 epochs     = 10
 seed       = 123
 
+# The CNN variant can be chosen in the terminal, e.g. "python model/train_model.py --architecture lean" (see architectures.py)
+# Nothing is shown on screen, so the script also runs in headless jobs; the evaluation goes to JSON and, if asked for, to PNG files.
+parser = argparse.ArgumentParser(description="Train the plant classifier and evaluate it on the validation split.")
+parser.add_argument("--architecture", choices=ARCHITECTURES, default="baseline")
+parser.add_argument("--metrics-json", default=os.path.join(model_dir, "evaluation.json"), help="where to write the evaluation")
+parser.add_argument("--figures", help="folder for the training progress, confusion matrix and reliability plots (default: no plots)")
+parser.add_argument("--profile", help="folder for a TensorBoard profiler trace and profile_summary.json (see profiling.py)")
+args = parser.parse_args()
+
 # Step 2: Load training and validation data
-# Load the dataset from the directory
-train_ds = tf.keras.preprocessing.image_dataset_from_directory(
-    data_dir,
-    validation_split=0.2,
-    subset="training",
-    seed=123,
-    image_size=img_size,
-    batch_size=batch_size
-)
+# The images are decoded and resized once and read from the shards of the dataset cache (see dataset_cache.py);
+# only new or changed images are decoded again. The split is derived from the image contents and the seed.
+manifest = build_dataset_cache(data_dir)
+train_ds = make_dataset("training", batch_size, manifest=manifest)
 
 # Load the validation dataset
-val_ds = tf.keras.preprocessing.image_dataset_from_directory(
-    data_dir,
-    validation_split=0.2,
-    subset="validation",
-    seed=123,
-    image_size=img_size,
-    batch_size=batch_size
-)
+val_ds = make_dataset("validation", batch_size, manifest=manifest)
 
 # Save the class names ("Edible", "Succulent","Grass" , "Tree", "Flower")
-class_names = train_ds.class_names
+class_names = manifest["class_names"]
 print(f"Detected classes: {class_names}")
 
 # Step 3: Set up data performance and augmentation
@@ -60,20 +62,23 @@ data_augmentation = tf.keras.Sequential([
 ])
 
 # Step 4: Build your CNN model
-model = models.Sequential([
-    data_augmentation,  # apply augmentations during training
-    layers.Rescaling(1./255, input_shape=(224, 224, 3)),  # normalize
-    layers.Conv2D(32, 3, activation='relu'),
-    layers.MaxPooling2D(),
-    layers.Conv2D(64, 3, activation='relu'),
-    layers.MaxPooling2D(),
-    layers.Conv2D(256, 3, activation='relu'),
-    layers.MaxPooling2D(),
-    layers.Flatten(),
-    layers.Dense(128, activation='relu'),
-    layers.Dropout(0.5),  # helps prevent overfitting
-    layers.Dense(len(class_names), activation='softmax')  # output layer
-])
+if args.architecture != "baseline":
+    model = build_model(args.architecture, len(class_names), [data_augmentation])
+else:
+    model = models.Sequential([
+        data_augmentation,  # apply augmentations during training
+        layers.Rescaling(1./255, input_shape=(224, 224, 3)),  # normalize
+        layers.Conv2D(32, 3, activation='relu'),
+        layers.MaxPooling2D(),
+        layers.Conv2D(64, 3, activation='relu'),
+        layers.MaxPooling2D(),
+        layers.Conv2D(256, 3, activation='relu'),
+        layers.MaxPooling2D(),
+        layers.Flatten(),
+        layers.Dense(128, activation='relu'),
+        layers.Dropout(0.5),  # helps prevent overfitting
+        layers.Dense(len(class_names), activation='softmax')  # output layer
+    ])
 
 # Step 5: Compile the model
 model.compile(
@@ -97,6 +102,9 @@ callbacks = [
         verbose=1
     ),
 ]
+# With --profile, a window of training steps is recorded with the TensorFlow profiler (see profiling.py)
+if args.profile:
+    callbacks.append(ProfileCallback(args.profile, batch_size, settings={"script": "train_model.py", "architecture": args.architecture}))
 
 # Step 6: Train the model
 history = model.fit(
@@ -106,43 +114,32 @@ history = model.fit(
     callbacks=callbacks
 )
 
-# Step 7: Plot training vs validation accuracy
-plt.plot(history.history['accuracy'], label='Train Accuracy')
-plt.plot(history.history['val_accuracy'], label='Validation Accuracy')
-plt.title("Training Progress")
-plt.xlabel("Epoch")
-plt.ylabel("Accuracy")
-plt.legend()
-plt.grid(True)
-plt.show()
-
-
-#CONFUSION MATRIX
-
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
-
-# Step 1: Get true labels and predicted labels
-y_true = []
-y_pred = []
-
-for batch_images, batch_labels in val_ds:
-    preds = model.predict(batch_images)
-    y_true.extend(batch_labels.numpy())
-    y_pred.extend(np.argmax(preds, axis=1))
-
-# Build matrix
-cm = confusion_matrix(y_true, y_pred)
-
-# Plot
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', xticklabels=class_names, yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.show()
+# Step 7: Evaluate the best checkpoint on the whole validation split (see evaluate.py)
+# One pass in large batches gives accuracy, per-class precision/recall, the confusion matrix and calibration statistics.
+metrics = evaluate_model(checkpoint_path, "validation", manifest)
+metrics["history"] = {key: [float(v) for v in values] for key, values in history.history.items()}
+print(f"Validation accuracy: {metrics['accuracy']:.3f}, macro F1: {metrics['macro_f1']:.3f}, "
+      f"ECE: {metrics['calibration']['expected_calibration_error']:.3f}")
+
+# Step 8: Plots, only when a folder for them was given
+if args.figures:
+    metrics["figures"] = save_figures(metrics, args.figures, "plant_classifier")
+    import matplotlib.pyplot as plt  # save_figures has already switched matplotlib to the file-only backend
+
+    plt.plot(history.history['accuracy'], label='Train Accuracy')
+    plt.plot(history.history['val_accuracy'], label='Validation Accuracy')
+    plt.title("Training Progress")
+    plt.xlabel("Epoch")
+    plt.ylabel("Accuracy")
+    plt.legend()
+    plt.grid(True)
+    metrics["figures"].append(os.path.join(args.figures, "plant_classifier_training_progress.png"))
+    plt.savefig(metrics["figures"][-1], bbox_inches="tight")
+    plt.close()
+
+with open(args.metrics_json, "w") as f:
+    json.dump(metrics, f, indent=2)
+print(f"Evaluation written to {args.metrics_json}")
 
 # --- Reference ---
 # https://www.tensorflow.org/tutorials/images/classification
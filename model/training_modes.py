@@ -0,0 +1,129 @@
+# --- Training Modes ---
+# Helpers for the faster training mode of "predict.py":
+# - thread pools: how many threads TensorFlow uses inside one operation (intra-op) and to run operations side by side (inter-op)
+# - mixed precision: computing in bfloat16 (on CPUs that support it natively) while keeping the weights in float32
+# - XLA: compiling the whole training step into one optimised program (jit_compile=True in model.compile)
+# - larger batches: the learning rate grows with the batch size and is warmed up over the first steps
+# It also contains the callback that measures seconds per epoch and images per second for the training benchmark.
+
+# --- Reference ---
+# https://www.tensorflow.org/guide/mixed_precision
+# https://www.tensorflow.org/xla
+# https://www.tensorflow.org/api_docs/python/tf/config/threading
+# Goyal et al. (2017), "Accurate, Large Minibatch SGD" (learning rate scaling and warm-up)
+
+import json
+import os
+import time
+
+import tensorflow as tf
+
+BASE_BATCH_SIZE = 8  # the batch size the original learning rate (Adam's default, 0.001) was tuned for
+BASE_LEARNING_RATE = 1e-3
+
+
+def bf16_supported() -> bool:
+    """True if the CPU has native bfloat16 instructions (AVX512-BF16 or AMX), where mixed precision pays off."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        # not Linux; Apple silicon and most other CPUs would only emulate bfloat16, which is slower
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def configure_runtime(intra_op_threads: int = None, inter_op_threads: int = None, mixed_precision: str = "off") -> str:
+    """
+    Sets the thread pools and the mixed precision policy; must run before any model or dataset is created.
+    mixed_precision is "off", "bfloat16" or "auto" (bfloat16 only where the CPU supports it).
+    Returns the name of the policy in use.
+    """
+    if intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    use_bf16 = mixed_precision == "bfloat16" or (mixed_precision == "auto" and bf16_supported())
+    policy = "mixed_bfloat16" if use_bf16 else "float32"
+    tf.keras.mixed_precision.set_global_policy(policy)
+    return policy
+
+
+def scaled_learning_rate(batch_size: int, base_learning_rate: float = BASE_LEARNING_RATE) -> float:
+    """
+    Learning rate for a given batch size. Adam is scaled with the square root of the batch size ratio,
+    which is gentler than the linear rule used for plain SGD.
+    """
+    return base_learning_rate * (batch_size / BASE_BATCH_SIZE) ** 0.5
+
+
+class WarmUp(tf.keras.callbacks.Callback):
+    """Raises the learning rate linearly from a tenth of its target to the target over the first warmup_steps batches."""
+
+    def __init__(self, target_learning_rate: float, warmup_steps: int):
+        super().__init__()
+        self.target_learning_rate = target_learning_rate
+        self.warmup_steps = warmup_steps
+        self.step = 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.step < self.warmup_steps:
+            fraction = 0.1 + 0.9 * self.step / self.warmup_steps
+            self.model.optimizer.learning_rate.assign(self.target_learning_rate * fraction)
+        elif self.step == self.warmup_steps:
+            self.model.optimizer.learning_rate.assign(self.target_learning_rate)
+        self.step += 1
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    """Records the duration of every epoch and the resulting training images per second."""
+
+    def __init__(self, images_per_epoch: int):
+        super().__init__()
+        self.images_per_epoch = images_per_epoch
+        self.epoch_seconds = []
+        self._start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._start
+        self.epoch_seconds.append(seconds)
+        print(f"Epoch {epoch + 1}: {seconds:.1f} s, {self.images_per_epoch / seconds:.1f} images/s")
+
+
+def to_float32(model: tf.keras.Model) -> tf.keras.Model:
+    """
+    Returns a float32 copy of a model trained with mixed precision.
+    The weights are float32 already; only the layers' compute dtype is reset,
+    so the app does not run its inference in bfloat16.
+    """
+    def strip(value):
+        if isinstance(value, dict):
+            if value.get("class_name") in ("DTypePolicy", "Policy") and "mixed" in str(value.get("config", {}).get("name")):
+                return "float32"
+            return {key: strip(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [strip(item) for item in value]
+        if isinstance(value, str) and value.startswith("mixed_"):
+            return "float32"
+        return value
+
+    # the global policy is switched to float32 while the copy is built, and restored afterwards
+    previous = tf.keras.mixed_precision.global_policy()
+    tf.keras.mixed_precision.set_global_policy("float32")
+    try:
+        copy = model.__class__.from_config(strip(model.get_config()))
+    finally:
+        tf.keras.mixed_precision.set_global_policy(previous)
+    copy.set_weights(model.get_weights())
+    return copy
+
+
+def write_metrics(path: str, metrics: dict) -> None:
+    """Writes the run's settings and results as JSON, so the benchmark can compare runs."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(metrics, f, indent=2)
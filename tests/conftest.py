@@ -0,0 +1,18 @@
+# --- Test Setup ---
+# The app and model scripts import each other by their bare module names (e.g. "from plant_api import ..."),
+# like they do when they are run with "python app/..." or "python model/...", so both folders are put on the path.
+# The runtime caches of the imported modules are redirected to a temporary folder, so the tests never read or
+# write the real "cache" folder.
+
+# --- how to run ---
+# type in your terminal: python -m pytest tests
+# press enter
+
+import os
+import sys
+import tempfile
+
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(repo_dir, "app"))
+sys.path.insert(0, os.path.join(repo_dir, "model"))
+os.environ.setdefault("PLANTELLIGENCE_CACHE_DIR", tempfile.mkdtemp(prefix="plantelligence-test-cache-"))
@@ -0,0 +1,43 @@
+# Tests for the confidence-gated cascade in "app/plant_api.py".
+
+import numpy as np
+
+from plant_api import cascade_predict
+
+
+def _fast(batch):
+    # confident (0.9) for the images whose first pixel is positive, unsure (0.4) otherwise
+    confident = batch[:, 0, 0, 0] > 0
+    return np.where(confident[:, None], [0.9, 0.1, 0, 0, 0], [0.4, 0.3, 0.3, 0, 0]).astype("float32")
+
+
+def test_only_unsure_images_are_escalated():
+    batch = np.array([1, -1, 1, -1], dtype="float32").reshape(4, 1, 1, 1)
+    seen = []
+
+    def full(images):
+        seen.append(len(images))
+        return np.tile(np.array([0, 0, 0, 0, 1], dtype="float32"), (len(images), 1))
+
+    preds, escalated = cascade_predict(_fast, full, batch, threshold=0.8)
+    assert escalated.tolist() == [False, True, False, True]
+    assert seen == [2]  # one call of the full model, with the two unsure images only
+    assert np.argmax(preds, axis=1).tolist() == [0, 4, 0, 4]
+
+
+def test_full_model_is_not_called_when_every_image_is_confident():
+    batch = np.ones((3, 1, 1, 1), dtype="float32")
+
+    def full(images):
+        raise AssertionError("the full model must not run")
+
+    preds, escalated = cascade_predict(_fast, full, batch, threshold=0.8)
+    assert not escalated.any()
+    assert preds.shape == (3, 5)
+
+
+def test_threshold_one_escalates_everything():
+    batch = np.ones((2, 1, 1, 1), dtype="float32")
+    preds, escalated = cascade_predict(_fast, lambda images: np.full((len(images), 5), 0.2, "float32"), batch, 1.0)
+    assert escalated.all()
+    np.testing.assert_allclose(preds, 0.2)
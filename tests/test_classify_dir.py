@@ -0,0 +1,52 @@
+# Tests for "app/classify_dir.py": its standard output must stay valid JSONL, whatever the libraries print.
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from PIL import Image
+
+from conftest import repo_dir
+
+
+@pytest.fixture
+def tiny_model(tmp_path):
+    """A tiny stand-in for plant_classifier.keras with the same input and output shape."""
+    tf = pytest.importorskip("tensorflow")
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=(224, 224, 3)),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(5, activation="softmax"),
+    ])
+    path = str(tmp_path / "tiny.keras")
+    model.save(path)
+    return path
+
+
+def test_stdout_is_jsonl(tmp_path, tiny_model):
+    images = tmp_path / "images" / "Edible"
+    images.mkdir(parents=True)
+    for i, color in enumerate(["green", "red", "blue"]):
+        Image.new("RGB", (64, 48), color).save(images / f"{i}.png")
+    (images / "broken.jpg").write_bytes(b"not an image")
+
+    env = dict(
+        os.environ,
+        PLANT_MODEL_PATH=tiny_model,
+        PLANT_CASCADE_THRESHOLD="1",  # only the stand-in model, not a fast model that may exist locally
+        PLANT_INFERENCE_URL="",
+        PLANTELLIGENCE_CACHE_DIR=str(tmp_path / "cache"),
+    )
+    result = subprocess.run(
+        [sys.executable, os.path.join(repo_dir, "app", "classify_dir.py"), str(tmp_path / "images"), "--workers", "1"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+
+    lines = result.stdout.splitlines()
+    assert len(lines) == 4
+    records = [json.loads(line) for line in lines]  # fails on any line that is not JSON
+    assert sum("error" in record for record in records) == 1
+    assert "Classified 3 images" in result.stderr
+    assert "1 could not be read" in result.stderr
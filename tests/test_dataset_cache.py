@@ -0,0 +1,47 @@
+# Tests for the hash-based training/validation split, the k-fold assignment and the decoding in "model/dataset_cache.py".
+
+import hashlib
+
+from PIL import Image
+
+from dataset_cache import _decode_images, fold_of, split_of, validation_split
+
+HASHES = [hashlib.sha256(str(i).encode("ascii")).hexdigest() for i in range(2000)]
+
+
+def test_split_depends_on_the_image_and_seed_only():
+    first = [split_of(sha256) for sha256 in HASHES]
+    assert [split_of(sha256) for sha256 in HASHES] == first
+    assert set(first) == {"training", "validation"}
+    # adding or removing other images never moves an image to the other split
+    assert [split_of(sha256) for sha256 in reversed(HASHES)] == first[::-1]
+    assert [split_of(sha256, split_seed=7) for sha256 in HASHES] != first
+
+
+def test_split_ratio_is_close_to_validation_split():
+    share = sum(split_of(sha256) == "validation" for sha256 in HASHES) / len(HASHES)
+    assert abs(share - validation_split) < 0.03
+    assert all(split_of(sha256, split=0.0) == "training" for sha256 in HASHES)
+
+
+def test_folds_are_stable_and_balanced():
+    folds = [fold_of(sha256, 5) for sha256 in HASHES]
+    assert [fold_of(sha256, 5) for sha256 in HASHES] == folds
+    counts = [folds.count(fold) for fold in range(5)]
+    assert min(counts) > 0.8 * len(HASHES) / 5
+    assert max(counts) < 1.2 * len(HASHES) / 5
+
+
+def test_exif_orientation_is_applied_like_at_serving_time(tmp_path):
+    # stored sideways: red on the left, blue on the right; orientation 6 means "turn 90 degrees clockwise to view"
+    img = Image.new("RGB", (40, 20), "blue")
+    img.paste("red", (0, 0, 20, 20))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    path = tmp_path / "sideways.jpg"
+    img.save(path, exif=exif, quality=100)
+
+    decoded = _decode_images([str(path)], (8, 8))[0]
+    # upright, the red half is at the top
+    assert decoded[0, 4, 0] > 200 and decoded[0, 4, 2] < 50
+    assert decoded[7, 4, 2] > 200 and decoded[7, 4, 0] < 50
@@ -0,0 +1,48 @@
+# Tests for the metrics of the headless evaluation in "model/evaluate.py".
+
+import numpy as np
+import pytest
+
+from evaluate import compute_metrics
+
+CLASSES = ["A", "B", "C"]
+
+
+def test_confusion_matrix_and_per_class_scores():
+    probabilities = np.array([
+        [0.9, 0.05, 0.05],  # A, right
+        [0.6, 0.3, 0.1],    # B predicted as A
+        [0.1, 0.8, 0.1],    # B, right
+        [0.2, 0.2, 0.6],    # C, right
+    ])
+    metrics = compute_metrics(probabilities, np.array([0, 1, 1, 2]), CLASSES, bins=10)
+    assert metrics["images"] == 4
+    assert metrics["accuracy"] == pytest.approx(0.75)
+    assert metrics["confusion_matrix"]["matrix"] == [[1, 0, 0], [1, 1, 0], [0, 0, 1]]
+    assert metrics["per_class"]["A"] == pytest.approx({"precision": 0.5, "recall": 1.0, "f1": 2 / 3, "support": 1})
+    assert metrics["per_class"]["B"] == pytest.approx({"precision": 1.0, "recall": 0.5, "f1": 2 / 3, "support": 2})
+    assert metrics["macro_f1"] == pytest.approx((2 / 3 + 2 / 3 + 1) / 3)
+
+
+def test_class_without_images_or_predictions_scores_zero():
+    probabilities = np.array([[0.7, 0.2, 0.1], [0.2, 0.7, 0.1]])
+    metrics = compute_metrics(probabilities, np.array([0, 1]), CLASSES)
+    assert metrics["per_class"]["C"] == {"precision": 0.0, "recall": 0.0, "f1": 0.0, "support": 0}
+
+
+def test_calibration_of_perfectly_calibrated_predictions_is_zero():
+    # confidence 1.0 and always right
+    probabilities = np.eye(3)[[0, 1, 2, 0]]
+    metrics = compute_metrics(probabilities, np.array([0, 1, 2, 0]), CLASSES, bins=5)
+    calibration = metrics["calibration"]
+    assert calibration["expected_calibration_error"] == pytest.approx(0.0)
+    assert calibration["brier_score"] == pytest.approx(0.0)
+    assert [b["count"] for b in calibration["bins"]] == [0, 0, 0, 0, 4]
+
+
+def test_overconfident_predictions_have_a_calibration_error():
+    # 0.9 confident, but only half of them right
+    probabilities = np.array([[0.9, 0.05, 0.05]] * 4)
+    metrics = compute_metrics(probabilities, np.array([0, 0, 1, 1]), CLASSES, bins=10)
+    assert metrics["calibration"]["expected_calibration_error"] == pytest.approx(0.4)
+    assert metrics["calibration"]["max_calibration_error"] == pytest.approx(0.4)
@@ -0,0 +1,91 @@
+# Tests for the staging store of confirmed uploads in "app/finetune.py".
+
+import io
+import os
+import sqlite3
+
+import pytest
+from PIL import Image
+
+import finetune
+
+
+def _png(color: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def staging(tmp_path, monkeypatch):
+    monkeypatch.setattr(finetune, "staging_dir", str(tmp_path / "staging"))
+    monkeypatch.setattr(finetune, "staging_db_path", str(tmp_path / "staging" / "staging.sqlite"))
+    monkeypatch.setattr(finetune, "baseline_path", str(tmp_path / "staging" / "baseline.json"))
+    return tmp_path / "staging"
+
+
+def _rows(staging) -> list:
+    db = sqlite3.connect(str(staging / "staging.sqlite"))
+    rows = db.execute("SELECT sha256, label, predicted, used FROM samples ORDER BY added_at").fetchall()
+    db.close()
+    return rows
+
+
+def test_confirmed_photo_is_stored_once_with_its_label(staging):
+    sha256 = finetune.stage_upload(_png("green"), "Grass", predicted="Tree")
+    assert os.path.exists(staging / "images" / sha256)
+    assert _rows(staging) == [(sha256, "Grass", "Tree", 0)]
+    stats = finetune.get_staging_stats()
+    assert (stats["staged"], stats["new"]) == (1, 1)
+
+
+def test_same_photo_again_only_updates_its_label(staging):
+    sha256 = finetune.stage_upload(_png("green"), "Grass")
+    finetune.stage_upload(_png("red"), "Flower")
+    # the photos were used by a fine-tuning run
+    db = sqlite3.connect(str(staging / "staging.sqlite"))
+    db.execute("UPDATE samples SET used = 1")
+    db.commit()
+    db.close()
+
+    # confirming the same label again does not make the photo new
+    assert finetune.stage_upload(_png("green"), "Grass") == sha256
+    assert finetune.get_staging_stats()["new"] == 0
+    # a corrected label does, so the photo is part of the next run
+    finetune.stage_upload(_png("green"), "Succulent")
+    rows = _rows(staging)
+    assert len(rows) == 2
+    assert rows[0][0] == sha256 and rows[0][1] == "Succulent" and rows[0][3] == 0
+    assert finetune.get_staging_stats()["new"] == 1
+
+
+def test_unknown_label_and_broken_image_are_refused(staging):
+    with pytest.raises(ValueError):
+        finetune.stage_upload(_png("green"), "Cactus")
+    with pytest.raises((ValueError, OSError)):
+        finetune.stage_upload(b"not an image", "Tree")
+    assert not os.path.exists(staging / "images") or os.listdir(staging / "images") == []
+
+
+def test_label_corrected_during_a_run_stays_new(staging):
+    sha256 = finetune.stage_upload(_png("green"), "Grass")
+    _, labels, hashes = finetune._load_staged(used=0)
+    # the user corrects the label while the run trains on "Grass"
+    finetune.stage_upload(_png("green"), "Succulent")
+    finetune._mark_used(hashes, labels)
+    assert _rows(staging) == [(sha256, "Succulent", None, 0)]
+    # the run that trained on the corrected label marks it as used
+    _, labels, hashes = finetune._load_staged(used=0)
+    finetune._mark_used(hashes, labels)
+    assert _rows(staging)[0][3] == 1
+
+
+def test_reference_accuracy_is_kept_only_for_models_written_by_a_run(staging):
+    assert finetune._read_baseline("models", "validation") is None
+    finetune._write_baseline({"models_hash": "models", "validation_hash": "validation",
+                              "val_accuracy": 0.9, "cascade_val_accuracy": None})
+    # the next run on the models an accepted run wrote is gated against the same reference
+    assert finetune._read_baseline("models", "validation")["val_accuracy"] == 0.9
+    # models replaced by hand, or another validation split, become the new reference
+    assert finetune._read_baseline("retrained models", "validation") is None
+    assert finetune._read_baseline("models", "other validation") is None
@@ -0,0 +1,63 @@
+# Tests for the dHash band search and the index location in "model/image_index.py".
+
+import itertools
+import os
+import random
+
+import pytest
+
+import image_index
+
+
+def _rows(hashes: list) -> list:
+    return [{"path": f"{i}.jpg", "sha256": f"sha{i}", "dhash": f"{value:016x}"} for i, value in enumerate(hashes)]
+
+
+def _flip(value: int, bits: list) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_band_search_finds_every_pair_of_brute_force():
+    rng = random.Random(0)
+    hashes = []
+    for _ in range(30):
+        base = rng.getrandbits(64)
+        hashes.append(base)
+        # a near copy with up to 7 flipped bits, spread over different bands
+        hashes.append(_flip(base, rng.sample(range(64), rng.randint(1, 7))))
+    rows = _rows(hashes)
+    max_bits = image_index.DHASH_BANDS - 1
+    expected = {
+        (i, j) for i, j in itertools.combinations(range(len(hashes)), 2)
+        if bin(hashes[i] ^ hashes[j]).count("1") <= max_bits
+    }
+    found = {
+        (int(pair["a"]["path"].split(".")[0]), int(pair["b"]["path"].split(".")[0]))
+        for pair in image_index.find_near_duplicates(rows, max_bits)
+    }
+    assert found == expected
+    assert len(expected) >= 30
+
+
+def test_exact_duplicates_are_not_near_duplicates():
+    rows = _rows([0x1234, 0x1234])
+    rows[1]["sha256"] = rows[0]["sha256"]
+    assert image_index.find_near_duplicates(rows) == []
+
+
+def test_max_bits_at_band_count_is_refused():
+    with pytest.raises(ValueError):
+        image_index.find_near_duplicates(_rows([0, 1]), image_index.DHASH_BANDS)
+    with pytest.raises(Exception):
+        image_index.max_bits_argument(str(image_index.DHASH_BANDS))
+    assert image_index.max_bits_argument("0") == 0
+
+
+def test_index_path_depends_on_root(tmp_path):
+    assert image_index.index_path_for(image_index.data_dir) == image_index.index_path
+    other = image_index.index_path_for(str(tmp_path))
+    assert other != image_index.index_path
+    assert os.path.dirname(other) == os.path.dirname(image_index.index_path)
+    assert image_index.index_path_for(str(tmp_path) + os.sep) == other
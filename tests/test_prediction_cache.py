@@ -0,0 +1,66 @@
+# Tests for the prediction cache in "app/plant_api.py": in-memory LRU, SQLite persistence and the model hash.
+
+import numpy as np
+
+from plant_api import _PredictionCache
+
+
+def test_miss_then_hit(tmp_path):
+    cache = _PredictionCache(str(tmp_path / "predictions.sqlite"), max_entries=4)
+    assert cache.get("model", "image") is None
+    cache.put("model", "image", "Tree", [0.1, 0.2, 0.3, 0.1, 0.3])
+    label, probabilities = cache.get("model", "image")
+    assert label == "Tree"
+    np.testing.assert_allclose(probabilities, [0.1, 0.2, 0.3, 0.1, 0.3], rtol=1e-6)
+    assert (cache.hits, cache.misses) == (1, 1)
+    # a prediction of another model is not reused
+    assert cache.get("other model", "image") is None
+
+
+def test_least_recently_used_entry_leaves_memory_but_stays_on_disk(tmp_path):
+    cache = _PredictionCache(str(tmp_path / "predictions.sqlite"), max_entries=2)
+    for name in ("a", "b"):
+        cache.put("model", name, "Grass", np.zeros(5))
+    cache.get("model", "a")  # "a" is now more recent than "b"
+    cache.put("model", "c", "Grass", np.zeros(5))
+    assert list(cache._memory) == [("model", "a"), ("model", "c")]
+    # "b" is read back from SQLite and becomes the most recent entry
+    assert cache.get("model", "b")[0] == "Grass"
+    assert list(cache._memory) == [("model", "c"), ("model", "b")]
+
+
+def test_entries_survive_a_new_process(tmp_path):
+    path = str(tmp_path / "predictions.sqlite")
+    _PredictionCache(path, max_entries=4).put("model", "image", "Flower", np.full(5, 0.2))
+    assert _PredictionCache(path, max_entries=4).get("model", "image")[0] == "Flower"
+
+
+def test_changed_model_file_changes_the_hash_and_keeps_other_models_predictions(tmp_path):
+    model_file = tmp_path / "model.keras"
+    model_file.write_bytes(b"first model")
+    path = str(tmp_path / "predictions.sqlite")
+    cache = _PredictionCache(path, max_entries=4)
+    first = cache.model_hash((str(model_file),))
+    assert cache.model_hash((str(model_file),)) == first
+    assert cache.model_hash((str(model_file),), "cascade@0.8") != first
+    cache.put(first, "image", "Tree", np.zeros(5))
+
+    model_file.write_bytes(b"second, longer model")
+    second = cache.model_hash((str(model_file),))
+    assert second != first
+    # another process may still run the first model (or other settings), so its rows stay in the shared file
+    assert _PredictionCache(path, max_entries=4).get(first, "image")[0] == "Tree"
+    assert cache.get(second, "image") is None
+
+
+def test_oldest_rows_beyond_max_rows_are_dropped_on_a_new_model_hash(tmp_path):
+    model_file = tmp_path / "model.keras"
+    model_file.write_bytes(b"first model")
+    path = str(tmp_path / "predictions.sqlite")
+    cache = _PredictionCache(path, max_entries=4, max_rows=2)
+    for name in ("a", "b", "c"):
+        cache.put("model", name, "Grass", np.zeros(5))
+    cache.put("model", "a", "Tree", np.zeros(5))  # rewritten, so "a" is now the newest row
+    cache.model_hash((str(model_file),))
+    fresh = _PredictionCache(path, max_entries=4)
+    assert [fresh.get("model", name) is not None for name in ("a", "b", "c")] == [True, False, True]
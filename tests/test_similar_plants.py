@@ -0,0 +1,52 @@
+# Tests for the "similar plants" lookup in "app/plant_api.py": an index built with another model must not be used.
+
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import plant_api
+import similar_plants
+
+
+def _png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), "green").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def index_for(tmp_path, monkeypatch):
+    """Writes a two-row index built with the given model hash and points plant_api at it and at a fake model file."""
+    model_file = tmp_path / "model.keras"
+    model_file.write_bytes(b"current model")
+    monkeypatch.setattr(plant_api._keras_model_holder, "path", str(model_file))
+    monkeypatch.setattr(plant_api, "_similar_index", None)
+    monkeypatch.setattr(similar_plants, "index_dir", str(tmp_path / "index"))
+    # the query is the first reference photo, without running a model
+    monkeypatch.setattr(plant_api, "embed_images", lambda batch: np.array([[1.0, 0.0]], dtype="float32"))
+
+    def write(model_hash: str) -> None:
+        directory = tmp_path / "index"
+        directory.mkdir()
+        np.array([[1.0, 0.0], [0.0, 1.0]], dtype="float32").tofile(directory / "embeddings-1.f32")
+        entries = [{"path": f"Edible/{i}.jpg", "label": "Edible", "size": 1, "mtime_ns": 1} for i in range(2)]
+        manifest = {"model_hash": model_hash, "dim": 2, "matrix": "embeddings-1.f32", "entries": entries}
+        (directory / "manifest.json").write_text(json.dumps(manifest))
+
+    return write, plant_api._file_sha256(str(model_file))
+
+
+def test_index_of_current_model_is_searched(index_for):
+    write, current_hash = index_for
+    write(current_hash)
+    results = plant_api.find_similar_plants(_png(), k=1)
+    assert [result["path"].endswith("0.jpg") for result in results] == [True]
+
+
+def test_index_of_other_model_is_ignored(index_for):
+    write, _ = index_for
+    write("hash-of-an-older-model")
+    assert plant_api.find_similar_plants(_png(), k=1) == []
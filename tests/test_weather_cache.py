@@ -0,0 +1,174 @@
+# Tests for the forecast cache in "app/weather_api.py": one API call for sessions that ask for the same week at once,
+# and for the geocode cache.
+
+import datetime
+import threading
+import time
+
+import pytest
+
+import weather_api
+from weather_api import _ForecastCache
+
+PAST_WEEK = datetime.date(2024, 4, 1)
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return _ForecastCache(str(tmp_path / "weather.sqlite"), ttl_seconds=3600)
+
+
+def test_fetched_week_is_served_from_the_cache(cache):
+    key = _ForecastCache.key(PAST_WEEK, 47.4239, 9.3748)
+    assert key[:2] == (47.42, 9.37)
+    calls = []
+    rainfall = [float(i) for i in range(7)]
+    assert cache.get_or_fetch(key, lambda: calls.append(1) or rainfall) == rainfall
+    assert cache.get_or_fetch(key, lambda: calls.append(1) or rainfall) == rainfall
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses, cache.upstream_calls) == (1, 1, 1)
+
+
+def test_concurrent_sessions_share_one_api_call(cache):
+    key = _ForecastCache.key(PAST_WEEK, 47.42, 9.37)
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return [1.0] * 7
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_or_fetch(key, fetch)))
+    first.start()
+    _wait_for(lambda: key in cache._in_flight)
+    second = threading.Thread(target=lambda: results.append(cache.get_or_fetch(key, fetch)))
+    second.start()
+    _wait_for(lambda: cache.coalesced == 1)
+    release.set()
+    first.join()
+    second.join()
+    assert results == [[1.0] * 7, [1.0] * 7]
+    assert len(calls) == 1
+    assert cache.upstream_calls == 1
+    assert cache._in_flight == {}
+
+
+def test_error_of_the_shared_call_reaches_every_waiting_session(cache):
+    key = _ForecastCache.key(PAST_WEEK, 47.42, 9.37)
+    release = threading.Event()
+    errors = []
+
+    def fetch():
+        release.wait(5)
+        raise ConnectionError("API down")
+
+    def session():
+        try:
+            cache.get_or_fetch(key, fetch)
+        except ConnectionError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=session)]
+    threads[0].start()
+    _wait_for(lambda: key in cache._in_flight)
+    threads.append(threading.Thread(target=session))
+    threads[1].start()
+    _wait_for(lambda: cache.coalesced == 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert errors == ["API down", "API down"]
+    # nothing was stored, so the next request asks the API again
+    assert cache.get(key) is None
+
+
+def test_week_inside_a_running_range_waits_for_it_and_gets_its_days(cache):
+    # a three-week prefetch is running; the middle week is cut out of its result instead of being fetched again
+    range_key = _ForecastCache.key(PAST_WEEK, 47.42, 9.37, days=21)
+    week_key = _ForecastCache.key(PAST_WEEK + datetime.timedelta(days=7), 47.42, 9.37)
+    release = threading.Event()
+
+    def fetch_range():
+        release.wait(5)
+        return [float(day) for day in range(21)]
+
+    thread = threading.Thread(target=lambda: cache.get_or_fetch(range_key, fetch_range, prefetch=True))
+    thread.start()
+    _wait_for(lambda: range_key in cache._in_flight)
+    with cache._lock:
+        assert cache._covering(week_key)[1] == 7
+        # another location or a week reaching past the range is not covered
+        assert cache._covering(_ForecastCache.key(PAST_WEEK, 47.43, 9.37)) is None
+        assert cache._covering(_ForecastCache.key(PAST_WEEK + datetime.timedelta(days=15), 47.42, 9.37)) is None
+    release.set()
+    week = cache.get_or_fetch(week_key, lambda: pytest.fail("the week must not be fetched again"))
+    thread.join()
+    assert week == [float(day) for day in range(7, 14)]
+    assert cache.prefetched == 1
+
+
+def test_weeks_are_assembled_from_the_daily_rows_of_a_range(cache):
+    cache.put({_ForecastCache.key(PAST_WEEK, 47.42, 9.37, days=14): [float(day) for day in range(14)]})
+    shifted = _ForecastCache.key(PAST_WEEK + datetime.timedelta(days=3), 47.42, 9.37)
+    assert cache.get(shifted) == [float(day) for day in range(3, 10)]
+    # one missing day is enough to ask the API again
+    assert cache.get(_ForecastCache.key(PAST_WEEK + datetime.timedelta(days=8), 47.42, 9.37)) is None
+
+
+def test_only_days_that_are_not_over_expire(tmp_path):
+    cache = _ForecastCache(str(tmp_path / "weather.sqlite"), ttl_seconds=0)
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    past_key = _ForecastCache.key(PAST_WEEK, 47.42, 9.37)
+    future_key = _ForecastCache.key(today, 47.42, 9.37)
+    cache.put({past_key: [0.0] * 7, future_key: [0.0] * 7})
+    time.sleep(0.01)
+    assert cache.get(past_key) == [0.0] * 7
+    assert cache.get(future_key) is None
+
+
+def test_city_that_is_not_found_is_looked_up_again_after_the_ttl(tmp_path, monkeypatch):
+    answers = [{}, {"results": [{"latitude": 46.9, "longitude": 7.4}]}]
+    calls = []
+
+    class Response:
+        def __init__(self, payload):
+            self.payload = payload
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return self.payload
+
+    def fake_get(url, **kwargs):
+        calls.append(url)
+        return Response(answers[len(calls) - 1])
+
+    monkeypatch.setattr(weather_api, "_http_get", fake_get)
+    monkeypatch.setattr(weather_api, "weather_db_path", str(tmp_path / "weather.sqlite"))
+    monkeypatch.setattr(weather_api, "_geocodes", {})
+    now = [1000.0]
+    monkeypatch.setattr(weather_api.time, "time", lambda: now[0])
+
+    assert weather_api.geocode("Bern") == weather_api.FALLBACK_LOCATION
+    # within the TTL the empty answer is reused, also by a new process
+    monkeypatch.setattr(weather_api, "_geocodes", {})
+    assert weather_api.geocode(" bern ") == weather_api.FALLBACK_LOCATION
+    assert len(calls) == 1
+
+    now[0] += weather_api.GEOCODE_NOT_FOUND_TTL_SECONDS
+    assert weather_api.geocode("Bern") == (46.9, 7.4)
+    assert len(calls) == 2
+    # a found city does not expire
+    now[0] += 100 * weather_api.GEOCODE_NOT_FOUND_TTL_SECONDS
+    assert weather_api.geocode("Bern") == (46.9, 7.4)
+    assert len(calls) == 2